@@ -32,6 +32,21 @@ except ModuleNotFoundError:
 ENGINE_MODE: Literal['neural', 'mi', 'minecraft', 'lmd', 'mi_material', 'exposed'] = os.getenv('ENGINE_MODE', 'exposed')
 print(f'{ENGINE_MODE=}')
 DEBUG: bool = os.environ.get('DEBUG', '0') == '1'
+MEMOIZE: bool = os.environ.get('MEMOIZE', '0') == '1'  # memoize `library_call` results on function name and kwargs; calls that draw random numbers, and their callers, are never cached
+VALIDATE_PROGRAMS: bool = os.environ.get('VALIDATE_PROGRAMS', '1') == '1'  # statically check `impl.py` and skip executing it if it is certain to fail
+EXECUTE_TIMEOUT: float = float(os.environ.get('EXECUTE_TIMEOUT', '3600'))  # seconds per trial subprocess before its process group is killed; 0 for none
+EXECUTE_MAX_RSS_GB: float = float(os.environ.get('EXECUTE_MAX_RSS_GB', '16'))  # resident memory limit per trial subprocess; 0 for none
+EXECUTE_LOG_MAX_MB: float = float(os.environ.get('EXECUTE_LOG_MAX_MB', '64'))  # cap on each of `execute_out.txt` and `execute_err.txt`; 0 for none
+RENDER_WORKERS: int = int(os.environ.get('RENDER_WORKERS', '0'))  # pre-warmed processes executing `impl.py`; 0 spawns one subprocess per trial
+RENDER_FORK: bool = os.environ.get('RENDER_FORK', '1') == '1'  # render workers fork a sandboxed child per `impl.py`; scalar Mitsuba variants only
+RENDER_TIMEOUT: float = float(os.environ.get('RENDER_TIMEOUT', '0'))  # seconds per `impl.py` in the render pool; 0 for none
+RENDER_MEMORY_GB: float = float(os.environ.get('RENDER_MEMORY_GB', '16'))  # address space limit per forked `impl.py`; 0 for none
+RENDER_CACHE: bool = os.environ.get('RENDER_CACHE', '0') == '1'  # reuse renderings of identical scenes across runs
+RENDER_CACHE_DIR: str = os.environ.get('RENDER_CACHE_DIR', str(Path(PROJ_DIR) / 'cache' / 'renderings'))
+RENDER_CACHE_MAX_GB: float = float(os.environ.get('RENDER_CACHE_MAX_GB', '4'))
+BLOCK_INDEX_DIR: str = os.environ.get('BLOCK_INDEX_DIR', str(Path(PROJ_DIR) / 'cache' / 'block_index'))  # precomputed `BlockIndex` and resolved aliases (`aliases.db`) for Minecraft block names
+MINECRAFT_EXPORT: Literal['json', 'binary', 'both'] = os.environ.get('MINECRAFT_EXPORT', 'json')  # scene format written by `minecraft_helper`; `binary` is the compact `.mcscene` of `block_scene`
+BATCH_SHAPES: bool = os.environ.get('BATCH_SHAPES', '0') == '1'  # use columnar `ShapeBatch` in `transform_shape` and `concat_shapes`
 
 PROMPT_MODE: Literal['default', 'calc', 'assert', 'sketch'] = os.environ.get('PROMPT_MODE', 'default' if ENGINE_MODE == 'minecraft' else 'calc')
 if ENGINE_MODE == 'minecraft' and PROMPT_MODE != 'default':
@@ -52,6 +67,8 @@ LLM_PROVIDER: Literal['gpt', 'claude', 'llama', 'gemini'] = 'gemini'
 TEMPERATURE: float = 0.05
 NUM_COMPLETIONS: int = 1
 MAX_TOKENS: int = 4000
+LLM_CONCURRENCY: int = int(os.environ.get('LLM_CONCURRENCY', '4'))  # completions of one request fetched in parallel
+LLM_REQUESTS_PER_MINUTE: float = float(os.environ.get('LLM_REQUESTS_PER_MINUTE', '50'))  # per provider and process
 
 assert 0 <= TEMPERATURE <= 1, TEMPERATURE
 if NUM_COMPLETIONS > 1:
@@ -0,0 +1,88 @@
+from functools import lru_cache
+from typing import Any, Sequence
+import numpy as np
+from .type_utils import BBox
+
+
+# primitive types whose axis-aligned bounding boxes are computed in closed form;
+# everything else (e.g. `ply`) must be resolved by loading the shape into Mitsuba
+ANALYTIC_TYPES = ('cube', 'sphere', 'cylinder', 'linearcurve', 'bsplinecurve')
+
+
+def _as_matrix(m: Any) -> np.ndarray:
+    # accepts numpy arrays, nested lists, and `mi.ScalarTransform4f`
+    return np.asarray(getattr(m, 'matrix', m), dtype=np.float64)
+
+
+@lru_cache(maxsize=1024)
+def _load_curve(filename: str) -> np.ndarray:
+    # control point files are written once by `mi_helper.curve_fn` and never modified
+    return np.loadtxt(filename, dtype=np.float64, ndmin=2)  # (n, 4), each row is x y z radius
+
+
+def compute_aabbs(types: Sequence[str], to_world: np.ndarray, params: Sequence[dict[str, Any]]
+                  ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes axis-aligned bounding boxes of Mitsuba primitives in world space, following the Mitsuba conventions:
+    `cube` spans [-1, 1]^3 and `sphere` has radius 1 in object space, `cylinder` is defined by `p0`, `p1`, `radius`,
+    and curves are bounded by their control points padded by the per-point radius.
+
+    Args:
+        types: primitive types, length N
+        to_world: (N, 4, 4) affine transforms
+        params: per-primitive dicts holding the remaining plugin parameters (`p0`, `p1`, `radius`, `filename`)
+
+    Returns:
+        (N, 3) min corners, (N, 3) max corners, and a (N,) boolean mask of primitives that were handled analytically;
+        corners of unhandled primitives are NaN.
+    """
+    types = np.asarray(types, dtype=object)
+    n = len(types)
+    to_world = np.asarray(to_world, dtype=np.float64).reshape(n, 4, 4)
+    linear = to_world[:, :3, :3]
+    offset = to_world[:, :3, 3]
+    box_min = np.full((n, 3), np.nan)
+    box_max = np.full((n, 3), np.nan)
+
+    # a transformed box or sphere is centered at the translation; only the half extents differ
+    inds = np.flatnonzero(types == 'cube')
+    half = np.abs(linear[inds]).sum(axis=-1)
+    box_min[inds] = offset[inds] - half
+    box_max[inds] = offset[inds] + half
+
+    # Mitsuba drops non-uniform scaling and shearing from spheres: the radius is the length of the image of the x axis
+    inds = np.flatnonzero(types == 'sphere')
+    half = np.linalg.norm(linear[inds, :, 0], axis=-1, keepdims=True)
+    box_min[inds] = offset[inds] - half
+    box_max[inds] = offset[inds] + half
+
+    inds = np.flatnonzero(types == 'cylinder')
+    if len(inds) > 0:
+        p0 = np.asarray([np.asarray(params[i].get('p0', (0, 0, 0)), dtype=np.float64) for i in inds])
+        p1 = np.asarray([np.asarray(params[i].get('p1', (0, 0, 1)), dtype=np.float64) for i in inds])
+        radius = np.asarray([float(params[i].get('radius', 1.)) for i in inds])
+        axis = (p1 - p0) / np.linalg.norm(p1 - p0, axis=-1, keepdims=True)
+        # the cylinder is bounded by its two end caps; the image of a unit circle perpendicular to `axis`
+        # extends sqrt(|a_i|^2 - (a_i . axis)^2) along world axis i, where a_i is the i-th row of the linear part
+        rows = linear[inds]
+        half = radius[:, None] * np.sqrt(np.maximum(
+            np.square(rows).sum(axis=-1) - np.square(np.einsum('nij,nj->ni', rows, axis)), 0))
+        c0 = np.einsum('nij,nj->ni', rows, p0) + offset[inds]
+        c1 = np.einsum('nij,nj->ni', rows, p1) + offset[inds]
+        box_min[inds] = np.minimum(c0, c1) - half
+        box_max[inds] = np.maximum(c0, c1) + half
+
+    for i in np.flatnonzero((types == 'linearcurve') | (types == 'bsplinecurve')):
+        curve = _load_curve(str(params[i]['filename']))
+        points = curve[:, :3] @ linear[i].T + offset[i]
+        radius = curve[:, 3:]  # Mitsuba does not scale curve radii by `to_world`
+        box_min[i] = (points - radius).min(axis=0)
+        box_max[i] = (points + radius).max(axis=0)
+
+    return box_min, box_max, np.isin(types, ANALYTIC_TYPES)
+
+
+def bbox_from_corners(box_min: np.ndarray, box_max: np.ndarray) -> BBox:
+    box_center = (box_min + box_max) / 2
+    box_sizes = box_max - box_min
+    return BBox(center=box_center, sizes=box_sizes, min=box_min, max=box_max, size=float(max(box_sizes)))
@@ -0,0 +1,239 @@
+import difflib
+import hashlib
+import importlib.metadata
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Optional, Sequence
+import numpy as np
+
+PREFIX = 'minecraft:'
+_SEP = '\x1f'  # joins the tokens of a name; never produced by the tokenizer for block names
+
+
+def normalize_block_name(name: str) -> str:
+    # `Oak Planks`, `oak-planks` and `minecraft:oak_planks` all map to `minecraft:oak_planks`
+    name = name.strip().lower().replace(' ', '_').replace('-', '_')
+    return name if name.startswith(PREFIX) else PREFIX + name
+
+
+def normalized_names(names: Sequence[str]) -> dict[str, str]:
+    # normalized name -> the first valid block with that normalized name
+    normalized: dict[str, str] = {}
+    for name in names:
+        normalized.setdefault(normalize_block_name(name), name)
+    return normalized
+
+
+def semantic_text(name: str) -> str:
+    # the prefix is stripped whether or not it is present, as the original `minecraft_helper.find_closest_match` did
+    return name[len(PREFIX):].replace('_', ' ')
+
+
+class BlockIndex:
+    """
+    Precomputed index for resolving free-form block names to the closest valid block.
+
+    The score of a block is `char_weight * difflib.SequenceMatcher(None, query, block).ratio() +
+    sem_weight * nlp(semantic_text(query)).similarity(nlp(semantic_text(block)))`, and `resolve` returns the first
+    block with the highest score. The semantic term for all blocks is one product with the stacked spaCy vectors.
+    `SequenceMatcher.quick_ratio`, an upper bound on `ratio` given by the character count matrix, bounds the character
+    term, so the exact `ratio` is only computed for the few blocks whose bound exceeds the best score found so far.
+    """
+
+    def __init__(self, names: Sequence[str], vectors: np.ndarray, norms: np.ndarray, tokens: Sequence[str],
+                 alphabet: str, char_counts: np.ndarray):
+        self.names = list(names)
+        self.vectors = vectors  # (N, D) float32 spaCy document vectors
+        self.norms = norms  # (N,) float64, computed like `Doc.vector_norm`
+        self.tokens = list(tokens)  # token texts joined by `_SEP`, for spaCy's identical-tokens shortcut
+        self.alphabet = alphabet
+        self.char_counts = char_counts  # (N, len(alphabet)) character histograms of the full names
+
+        self.name_set = frozenset(self.names)
+        self.normalized = normalized_names(self.names)
+        self.token_index: dict[str, list[int]] = {}
+        for i, t in enumerate(self.tokens):
+            self.token_index.setdefault(t, []).append(i)
+        self.char_index = {c: i for i, c in enumerate(alphabet)}
+        self.lengths = self.char_counts.sum(axis=1)
+        self.vectors_64 = self.vectors.astype(np.float64)
+
+    @classmethod
+    def build(cls, names: Sequence[str], nlp: Any) -> 'BlockIndex':
+        docs = list(nlp.pipe([semantic_text(name) for name in names]))
+        vectors = np.stack([np.asarray(doc.vector, dtype=np.float32) for doc in docs])
+        norms = np.asarray([doc.vector_norm for doc in docs], dtype=np.float64)
+        tokens = [_SEP.join(t.text for t in doc) for doc in docs]
+        alphabet = ''.join(sorted(set(''.join(names))))
+        char_index = {c: i for i, c in enumerate(alphabet)}
+        char_counts = np.zeros((len(names), len(alphabet)), dtype=np.int32)
+        for i, name in enumerate(names):
+            for c in name:
+                char_counts[i, char_index[c]] += 1
+        return cls(names, vectors, norms, tokens, alphabet, char_counts)
+
+    @staticmethod
+    def digest(names: Sequence[str], nlp: Any) -> str:
+        meta = getattr(nlp, 'meta', {})
+        key = json.dumps([list(names), meta.get('lang'), meta.get('name'), meta.get('version'),
+                          list(getattr(nlp.vocab.vectors, 'shape', ()))])
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    @classmethod
+    def load_or_build(cls, names: Sequence[str], nlp: Any, cache_dir: Optional[str]) -> 'BlockIndex':
+        if cache_dir is None:
+            return cls.build(names, nlp)
+        path = Path(cache_dir) / f'block_index_{cls.digest(names, nlp)}.npz'
+        if path.exists():
+            try:
+                return cls.load(path.as_posix())
+            except Exception as e:
+                print(f'[ERROR] failed to load block index from {path}: {e}')
+        index = cls.build(names, nlp)
+        index.save(path.as_posix())
+        return index
+
+    def save(self, path: str):
+        path = Path(path)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        tmp_path = path.with_name(f'.{path.stem}.{uuid.uuid4()}.npz')  # written atomically, runs may share the cache
+        np.savez(tmp_path, names=np.asarray(self.names), vectors=self.vectors, norms=self.norms,
+                 tokens=np.asarray(self.tokens), alphabet=np.asarray(self.alphabet), char_counts=self.char_counts)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'BlockIndex':
+        with np.load(path) as data:
+            return cls(names=data['names'].tolist(), vectors=data['vectors'], norms=data['norms'],
+                       tokens=data['tokens'].tolist(), alphabet=str(data['alphabet']), char_counts=data['char_counts'])
+
+    def lookup(self, query: str) -> Optional[str]:
+        if query in self.name_set:
+            return query
+        return self.normalized.get(normalize_block_name(query))
+
+    def resolve(self, query: str, nlp: Any, char_weight: float = .6, sem_weight: float = .4) -> str:
+        return self.resolve_with_score(query, nlp, char_weight=char_weight, sem_weight=sem_weight)[0]
+
+    def resolve_with_score(self, query: str, nlp: Any, char_weight: float = .6,
+                           sem_weight: float = .4) -> tuple[str, float]:
+        match = self.lookup(query)
+        if match is not None:
+            return match, 1.
+
+        doc = nlp(semantic_text(query))
+        vector = np.asarray(doc.vector, dtype=np.float32)
+        norm = doc.vector_norm
+        if norm == 0:
+            sem_bound = np.zeros((len(self.names),))
+        else:
+            sem_bound = self.vectors_64 @ vector.astype(np.float64) / np.where(self.norms > 0, self.norms * norm, np.inf)
+        same_tokens = self.token_index.get(_SEP.join(t.text for t in doc), [])
+        sem_bound[same_tokens] = 1.
+
+        counts = np.zeros((len(self.alphabet),), dtype=np.int32)
+        for c in query:
+            if c in self.char_index:
+                counts[self.char_index[c]] += 1
+        char_bound = 2. * np.minimum(self.char_counts, counts).sum(axis=1) / (self.lengths + len(query))
+        # the slack covers float32 vs float64 rounding in the semantic term
+        bound = char_weight * char_bound + sem_weight * sem_bound + 1e-6
+
+        same_tokens = set(same_tokens)
+        best_score, best = -np.inf, -1
+        for i in np.argsort(-bound, kind='stable'):
+            if bound[i] < best_score:
+                break
+            if i in same_tokens:
+                sem_sim = 1.
+            elif norm == 0 or self.norms[i] == 0:
+                sem_sim = 0.
+            else:  # same arithmetic as `Doc.similarity`
+                sem_sim = (np.dot(vector, self.vectors[i]) / (norm * float(self.norms[i]))).item()
+            char_sim = difflib.SequenceMatcher(None, query, self.names[i]).ratio()
+            score = (char_weight * char_sim) + (sem_weight * sem_sim)
+            if score > best_score or (score == best_score and i < best):
+                best_score, best = score, i
+        return self.names[best], float(best_score)
+
+
+def alias_version(names: Sequence[str], model: str, char_weight: float, sem_weight: float) -> str:
+    # aliases depend on the valid blocks, the spaCy model package and the weights; bump `v1` if `resolve` changes
+    try:
+        model_version = importlib.metadata.version(model.replace('_', '-'))
+    except importlib.metadata.PackageNotFoundError:
+        model_version = None
+    key = json.dumps(['v1', list(names), model, model_version, char_weight, sem_weight])
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+class BlockAliasStore:
+    """
+    SQLite store of resolved block names, query -> (block, score), shared by all processes and runs.
+
+    Rows are tagged with a version from `alias_version`, so runs with different `valid_blocks` can share the store.
+    Opening the store marks its version as used; `prune` deletes the rows of versions that have not been used for
+    `max_age_days`, which happens on open unless `max_age_days` is None. Like `LLMCache`, the database runs in WAL mode
+    and each thread and process has its own connection.
+    """
+
+    def __init__(self, path: str, version: str, timeout: float = 60., max_age_days: Optional[float] = 30.):
+        self.path = str(path)
+        self.version = version
+        self.timeout = timeout
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS aliases ('
+                     'version TEXT NOT NULL, query TEXT NOT NULL, block TEXT NOT NULL, score REAL NOT NULL, '
+                     'PRIMARY KEY (version, query)) WITHOUT ROWID')
+        conn.execute('CREATE TABLE IF NOT EXISTS versions (version TEXT PRIMARY KEY, last_used REAL NOT NULL)')
+        conn.execute('INSERT OR REPLACE INTO versions (version, last_used) VALUES (?, ?)', (version, time.time()))
+        if max_age_days is not None:
+            self.prune(max_age_days)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            Path(self.path).parent.mkdir(exist_ok=True, parents=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, query: str) -> Optional[tuple[str, float]]:
+        row = self._connect().execute('SELECT block, score FROM aliases WHERE version = ? AND query = ?',
+                                      (self.version, query)).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def put(self, query: str, block: str, score: float):
+        self._connect().execute('INSERT OR REPLACE INTO aliases (version, query, block, score) VALUES (?, ?, ?, ?)',
+                                (self.version, query, block, score))
+
+    def __len__(self) -> int:
+        return self._connect().execute('SELECT COUNT(*) FROM aliases WHERE version = ?', (self.version,)).fetchone()[0]
+
+    def prune(self, max_age_days: float) -> int:
+        # rows of versions that no store opened within `max_age_days`, or that predate the `versions` table
+        cutoff = time.time() - max_age_days * 24 * 3600
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM versions WHERE last_used < ? AND version != ?', (cutoff, self.version))
+            num_deleted = conn.execute('DELETE FROM aliases WHERE version NOT IN (SELECT version FROM versions)').rowcount
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return num_deleted
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,118 @@
+"""
+Compact binary format for block scenes and animations, as an alternative to the JSON written by `minecraft_helper`.
+
+Layout, little-endian:
+    b'MCSC' | uint32 header length | UTF-8 JSON header | zlib-compressed frames
+
+The header holds `width`, `height`, `depth`, `num_frames` and the `palette`, where entry 0 is air (`null`) and every
+other entry is `{"type", "properties", "stack"}`, plus any extra fields of the JSON export such as `block_counts`.
+Each frame is a run-length encoding of the volume in `x + z * width + y * width * depth` order, the order of Sponge
+`.schem` block data, stored as a uint32 run count followed by the uint32 run lengths and the uint32 run codes. Code 0
+keeps the voxel of the previous frame and code `i + 1` sets it to palette entry `i`, so the first frame is encoded
+against an empty volume and each later frame only stores what changed.
+
+`viewers/minecraft/app/static/js/script_animation.js` reads the same format in the browser.
+"""
+import json
+import zlib
+from pathlib import Path
+from typing import Any, Iterable, Optional, Union
+import numpy as np
+
+MAGIC = b'MCSC'
+VERSION = 1
+SUFFIX = '.mcscene'
+
+
+def _flatten(volume: np.ndarray) -> np.ndarray:
+    # (x, y, z) -> x + z * width + y * width * depth
+    return volume.transpose(1, 2, 0).ravel()
+
+
+def _unflatten(flat: np.ndarray, width: int, height: int, depth: int) -> np.ndarray:
+    return flat.reshape(height, depth, width).transpose(2, 0, 1)
+
+
+def _encode_frame(codes: np.ndarray) -> bytes:
+    if len(codes) == 0:
+        return np.zeros((1,), dtype='<u4').tobytes()
+    starts = np.flatnonzero(np.concatenate([[True], codes[1:] != codes[:-1]]))
+    lengths = np.diff(np.concatenate([starts, [len(codes)]]))
+    return b''.join([np.asarray([len(starts)], dtype='<u4').tobytes(),
+                     lengths.astype('<u4').tobytes(), codes[starts].astype('<u4').tobytes()])
+
+
+def write_block_scene(path: Union[str, Path], volumes: Iterable[np.ndarray], palette: list[Optional[dict]],
+                      level: int = 6, **extra: Any) -> dict:
+    """
+    Writes frames given as `(width, height, depth)` arrays of indices into `palette`, whose entry 0 must be air.
+
+    Returns:
+        the header
+    """
+    assert palette[0] is None, palette[0]
+    compressor = zlib.compressobj(level)
+    body, shape, num_frames, previous = [], None, 0, None
+    for volume in volumes:
+        if shape is None:
+            shape = volume.shape
+        assert volume.shape == shape, (volume.shape, shape)
+        current = _flatten(volume).astype(np.uint32)
+        if previous is None:
+            previous = np.zeros_like(current)
+        codes = np.where(current != previous, current + 1, 0)
+        body.append(compressor.compress(_encode_frame(codes)))
+        previous, num_frames = current, num_frames + 1
+    body.append(compressor.flush())
+
+    width, height, depth = shape if shape is not None else (0, 0, 0)
+    header = {'version': VERSION, 'width': int(width), 'height': int(height), 'depth': int(depth),
+              'num_frames': num_frames, 'palette': palette, **extra}
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.asarray([len(header_bytes)], dtype='<u4').tobytes())
+        f.write(header_bytes)
+        for chunk in body:
+            f.write(chunk)
+    return header
+
+
+def is_block_scene(path: Union[str, Path]) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_block_scene(path: Union[str, Path]) -> tuple[dict, list[np.ndarray]]:
+    """
+    Returns:
+        the header, and the frames as `(width, height, depth)` arrays of palette indices
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f'{path} is not a block scene')
+    header_length = int(np.frombuffer(data, dtype='<u4', count=1, offset=len(MAGIC))[0])
+    header_end = len(MAGIC) + 4 + header_length
+    header = json.loads(data[len(MAGIC) + 4:header_end].decode('utf-8'))
+    if header['version'] > VERSION:
+        raise ValueError(f"{path} has version {header['version']}, only {VERSION} is supported")
+    words = np.frombuffer(zlib.decompress(data[header_end:]), dtype='<u4')
+
+    width, height, depth = header['width'], header['height'], header['depth']
+    current = np.zeros((width * height * depth,), dtype=np.uint32)
+    frames, offset = [], 0
+    for _ in range(header['num_frames']):
+        num_runs = int(words[offset])
+        lengths, codes = words[offset + 1:offset + 1 + num_runs], words[offset + 1 + num_runs:offset + 1 + 2 * num_runs]
+        offset += 1 + 2 * num_runs
+        # only the runs with a non-zero code change anything
+        changed = codes > 0
+        starts = (np.cumsum(lengths, dtype=np.int64) - lengths)[changed]
+        lengths, codes = lengths[changed].astype(np.int64), codes[changed]
+        run_offsets = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - run_offsets, lengths) + np.arange(lengths.sum())
+        current = current.copy()
+        current[positions] = np.repeat(codes - 1, lengths)
+        frames.append(_unflatten(current, width, height, depth))
+    return header, frames
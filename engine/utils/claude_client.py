@@ -1,10 +1,11 @@
-from engine.constants import PROJ_DIR, ANTHROPIC_API_KEY, MAX_TOKENS, TEMPERATURE, NUM_COMPLETIONS
+from engine.constants import PROJ_DIR, ANTHROPIC_API_KEY, MAX_TOKENS, TEMPERATURE, NUM_COMPLETIONS, LLM_CONCURRENCY, LLM_REQUESTS_PER_MINUTE
+from engine.utils.llm_cache import LLMCache, canonical_request
+from engine.utils.llm_concurrency import fan_out, get_rate_limiter
 import copy
+import hashlib
 from pathlib import Path
 import base64
-import json
 import os
-import time
 import random
 from PIL import Image
 import io
@@ -14,21 +15,23 @@ import anthropic
 CLAUDE_MODEL_NAME = 'claude-3-5-sonnet-20240620'  # this the model used throughout the paper
 CLAUDE_MODEL_NAME = 'claude-3-5-sonnet-20241022'
 
+
+def _retry_after(e):
+    response = getattr(e, 'response', None)
+    try:
+        return float(response.headers['retry-after'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
 class ClaudeClient:
-    def __init__(self, model_name=CLAUDE_MODEL_NAME, cache="cache.json"):
+    def __init__(self, model_name=CLAUDE_MODEL_NAME, cache="cache.db"):
         self.cache_file = cache
         self.model_name = model_name
-        self.exponential_backoff = 1
-        # Load the cache JSON file, if cache file exists. Else, cache is {}
-        if os.path.exists(cache):
-            while os.path.exists(self.cache_file + ".tmp") or os.path.exists(self.cache_file + ".lock"):
-                time.sleep(0.1)
-            with open(cache, "r") as f:
-                self.cache = json.load(f)
-        else:
-            self.cache = {}
+        self.cache = LLMCache(cache)
 
-        self.client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+        # retries are handled by `fan_out`, which shares one rate limiter across concurrent requests
+        self.client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=0)
 
         # Tip, if you want to extend MAX_TOKENS to 8000, attach default_headers after the api_key arg above.
         # default_headers={
@@ -70,34 +73,29 @@ class ClaudeClient:
         cache_key = None
         results = []
         if not skip_cache:
-            cache_key = str((user_prompt, system_prompt, max_tokens, temperature, stop_sequences, 'claude'))
+            request = canonical_request(provider='claude', model=self.model_name, user_prompt=user_prompt, system_prompt=system_prompt,
+                                        max_tokens=max_tokens, temperature=temperature, stop_sequences=stop_sequences)
+            cache_key = hashlib.sha256(request.encode()).hexdigest()
 
             num_completions = skip_cache_completions + num_completions
-            if cache_key in self.cache:
-                print(f'[INFO] Claude: cache hit {len(self.cache[cache_key])}')
-                if len(self.cache[cache_key]) < num_completions:
-                    num_completions -= len(self.cache[cache_key])
-                    results = self.cache[cache_key]
+            results = self.cache.get(cache_key)
+            if len(results) > 0:
+                print(f'[INFO] Claude: cache hit {len(results)}')
+                if len(results) < num_completions:
+                    num_completions -= len(results)
                 else:
-                    return cache_key, self.cache[cache_key][skip_cache_completions:num_completions]
-
-        while num_completions > 0:
-            while True:
-                try:
-                    response = self.client.messages.create(
-                        model=self.model_name,
-                        system=system_prompt,
-                        messages=messages,
-                        max_tokens=max_tokens,
-                        temperature=temperature,
-                        stop_sequences=stop_sequences
-                    )
-                    break
-                except anthropic.RateLimitError:
-                    print("Rate limit reached. Waiting before retrying...")
-                    time.sleep(16 * self.exponential_backoff)
-                    self.exponential_backoff *= 2
-            num_completions -= 1
+                    return cache_key, results[skip_cache_completions:num_completions]
+        num_cached = len(results)
+
+        def complete():
+            response = self.client.messages.create(
+                model=self.model_name,
+                system=system_prompt,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop_sequences=stop_sequences
+            )
 
             content = []
             if response.content:
@@ -108,27 +106,19 @@ class ClaudeClient:
             indented = []
             for c in content:
                 indented.append(c.split('\n'))
+            return indented
+
+        for indented in fan_out(complete, num_completions, max_concurrency=LLM_CONCURRENCY,
+                                rate_limiter=get_rate_limiter('claude', LLM_REQUESTS_PER_MINUTE),
+                                retry_on=(anthropic.RateLimitError, anthropic.InternalServerError, anthropic.APIConnectionError),
+                                retry_after=_retry_after, name='Claude'):
             results.extend(indented)
 
         if not skip_cache:
-            self.update_cache(cache_key, results)
+            self.cache.append(cache_key, results[num_cached:], request=request)
 
         return cache_key, results[skip_cache_completions:]
 
-    def update_cache(self, cache_key, results):
-        while os.path.exists(self.cache_file + ".tmp") or os.path.exists(self.cache_file + ".lock"):
-            time.sleep(0.1)
-        with open(self.cache_file + ".lock", "w") as f:
-            pass
-        if os.path.exists(self.cache_file):
-            with open(self.cache_file, "r") as f:
-                self.cache = json.load(f)
-        self.cache[cache_key] = results
-        with open(self.cache_file + ".tmp", "w") as f:
-            json.dump(self.cache, f)
-        os.rename(self.cache_file + ".tmp", self.cache_file)
-        os.remove(self.cache_file + ".lock")
-
 
 def setup_claude():
     try:
@@ -136,14 +126,14 @@ def setup_claude():
     except OSError:
         username = os.environ.get('USER') or os.environ.get('LOGNAME')
 
-    model = ClaudeClient(cache='cache.json' if not os.path.exists('/viscam/') else f'cache_{username}.json')
+    model = ClaudeClient(cache='cache.db' if not os.path.exists('/viscam/') else f'cache_{username}.db')
     return model
 
 
 def test_claude():
     cache_dir = Path(PROJ_DIR) / 'cache'
     cache_dir.mkdir(exist_ok=True)
-    cache_file = cache_dir / 'test_claude_client.json'
+    cache_file = cache_dir / 'test_claude_client.db'
     # cache_file.unlink(missing_ok=True)
     model = ClaudeClient(cache=cache_file.as_posix())
     # cache_key, response = model.generate("Generate a random number.", "You are a helpful code assistant.",
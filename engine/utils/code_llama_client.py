@@ -1,26 +1,20 @@
 import os
-import json
 import time
+import hashlib
 import torch
 from pathlib import Path
 from transformers import AutoTokenizer, AutoModelForCausalLM
 
 from engine.constants import MAX_TOKENS, TEMPERATURE, NUM_COMPLETIONS
+from engine.utils.llm_cache import LLMCache, canonical_request
 
 
 class LlamaClient:
-    def __init__(self, model_name="meta-llama/Meta-Llama-3-8B-Instruct", cache="llama_cache.json"):
+    def __init__(self, model_name="meta-llama/Meta-Llama-3-8B-Instruct", cache="llama_cache.db"):
         self.cache_file = cache
         self.model_name = model_name
 
-        # Load cache
-        if os.path.exists(cache):
-            while os.path.exists(self.cache_file + ".tmp") or os.path.exists(self.cache_file + ".lock"):
-                time.sleep(0.1)
-            with open(cache, "r") as f:
-                self.cache = json.load(f)
-        else:
-            self.cache = {}
+        self.cache = LLMCache(cache)
 
         # Load model and tokenizer
         print("Loading tokenizer and model...")
@@ -49,18 +43,19 @@ class LlamaClient:
             {"role": "user", "content": user_prompt}
         ]
 
-        cache_key = str((user_prompt, system_prompt, max_tokens, temperature, stop_sequences, 'llama'))
+        request = canonical_request(provider='llama', model=self.model_name, user_prompt=user_prompt, system_prompt=system_prompt,
+                                    max_tokens=max_tokens, temperature=temperature, stop_sequences=stop_sequences)
+        cache_key = hashlib.sha256(request.encode()).hexdigest()
 
         num_completions = skip_cache_completions + num_completions
-        if cache_key in self.cache:
-            print(f'[INFO] Llama: cache hit {len(self.cache[cache_key])}')
-            if len(self.cache[cache_key]) < num_completions:
-                num_completions -= len(self.cache[cache_key])
-                results = self.cache[cache_key]
+        results = self.cache.get(cache_key)
+        if len(results) > 0:
+            print(f'[INFO] Llama: cache hit {len(results)}')
+            if len(results) < num_completions:
+                num_completions -= len(results)
             else:
-                return cache_key, self.cache[cache_key][skip_cache_completions:num_completions]
-        else:
-            results = []
+                return cache_key, results[skip_cache_completions:num_completions]
+        num_cached = len(results)
 
         print(f'[INFO] Llama: querying for {num_completions=}')
 
@@ -69,7 +64,7 @@ class LlamaClient:
             results.append(response.split('\n'))
             num_completions -= 1
 
-        self.update_cache(cache_key, results)
+        self.cache.append(cache_key, results[num_cached:], request=request)
         return cache_key, results[skip_cache_completions:]
 
     def generate_response(self, messages, max_tokens, temperature):
@@ -105,25 +100,11 @@ class LlamaClient:
         response = outputs[0][input_ids.shape[-1]:]
         return self.tokenizer.decode(response, skip_special_tokens=True), end_time - start_time
 
-    def update_cache(self, cache_key, results):
-        while os.path.exists(self.cache_file + ".tmp") or os.path.exists(self.cache_file + ".lock"):
-            time.sleep(0.1)
-        with open(self.cache_file + ".lock", "w") as f:
-            pass
-        if os.path.exists(self.cache_file):
-            with open(self.cache_file, "r") as f:
-                self.cache = json.load(f)
-        self.cache[cache_key] = results
-        with open(self.cache_file + ".tmp", "w") as f:
-            json.dump(self.cache, f)
-        os.rename(self.cache_file + ".tmp", self.cache_file)
-        os.remove(self.cache_file + ".lock")
-
 def setup_llama():
     try:
         username = os.getlogin()
     except OSError:
         username = os.environ.get('USER') or os.environ.get('LOGNAME')
 
-    model = LlamaClient(cache='llama_cache.json' if not os.path.exists('/viscam/') else f'llama_cache_{username}.json')
+    model = LlamaClient(cache='llama_cache.db' if not os.path.exists('/viscam/') else f'llama_cache_{username}.db')
     return model
@@ -1,11 +1,173 @@
+import json
+import os
+import selectors
+import signal
 import subprocess
 import time
 import sys
 from pathlib import Path
+from typing import Optional
+
+RSS_POLL_INTERVAL = .5  # seconds between memory checks of a running command, after a faster start
+KILL_GRACE = 5.  # seconds to drain the pipes of a killed command
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class _LogTee:
+    # writes a stream to a log file up to `max_bytes`, optionally echoing it to the terminal as it arrives
+    def __init__(self, path: Path, max_bytes: Optional[int], echo=None):
+        self.file = open(path, 'wb')
+        self.max_bytes = max_bytes
+        self.echo = echo
+        self.written = 0
+        self.dropped = 0
+
+    def write(self, chunk: bytes):
+        if self.echo is not None:
+            self.echo.write(chunk)
+            self.echo.flush()
+        if self.max_bytes is not None and self.written + len(chunk) > self.max_bytes:
+            keep = max(self.max_bytes - self.written, 0)
+            if self.dropped == 0:
+                self.file.write(chunk[:keep] + f'\n[WARNING] output truncated after {self.max_bytes} bytes\n'.encode())
+            self.written += keep
+            self.dropped += len(chunk) - keep
+            return
+        self.file.write(chunk)
+        self.written += len(chunk)
+
+    def close(self):
+        if self.dropped > 0:
+            self.file.write(f'[WARNING] {self.dropped} bytes of output were dropped\n'.encode())
+        self.file.close()
+
+
+def _group_rss(pgid: int) -> tuple[int, int]:
+    """
+    Returns:
+        the resident memory of all processes in a process group, and the largest peak resident memory of any one of
+        them since its `exec`, in bytes; zeros where `/proc` is not available
+    """
+    total, peak = 0, 0
+    try:
+        pids = [pid for pid in os.listdir('/proc') if pid.isdigit()]
+    except OSError:
+        return 0, 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat', 'r') as f:
+                stat = f.read()
+            fields = stat[stat.rfind(')') + 2:].split()  # the command name may contain spaces
+            if int(fields[2]) != pgid:
+                continue
+            total += int(fields[21]) * _PAGE_SIZE
+            with open(f'/proc/{pid}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        peak = max(peak, int(line.split()[1]) * 1024)
+        except OSError:
+            continue
+    return total, max(peak, total)
+
+
+def _kill_group(pgid: int):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _run(command: str, save_dir: Path, timeout: Optional[float], max_rss_gb: Optional[float],
+         max_log_mb: Optional[float], print_stdout: bool, print_stderr: bool, cwd) -> dict:
+    start = time.time()
+    max_bytes = None if max_log_mb is None else int(max_log_mb * 1024 ** 2)
+    max_rss = None if max_rss_gb is None else int(max_rss_gb * 1024 ** 3)
+    # a new session makes the shell the leader of its own process group, so that a kill reaches everything it started
+    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd,
+                               start_new_session=True)
+    logs = {
+        process.stdout: _LogTee(save_dir / 'execute_out.txt', max_bytes, sys.stdout.buffer if print_stdout else None),
+        process.stderr: _LogTee(save_dir / 'execute_err.txt', max_bytes, sys.stderr.buffer if print_stderr else None),
+    }
+    selector = selectors.DefaultSelector()
+    for stream in logs:
+        selector.register(stream, selectors.EVENT_READ)
+
+    status, error, peak_rss, killed_at, last_poll = None, None, 0, None, 0.
+    poll_interval = .01  # doubles up to `RSS_POLL_INTERVAL`, so that short commands still get a peak RSS
+    while True:
+        wait = poll_interval
+        if timeout is not None and killed_at is None:
+            wait = max(min(wait, start + timeout - time.time()), 0)
+        if len(selector.get_map()) > 0:
+            for key, _ in selector.select(wait):
+                chunk = os.read(key.fd, 1 << 16)
+                if len(chunk) == 0:
+                    selector.unregister(key.fileobj)
+                else:
+                    logs[key.fileobj].write(chunk)
+        else:
+            # the pipes are closed, but the command may still be running
+            if process.poll() is not None:
+                break
+            time.sleep(wait)
+
+        now = time.time()
+        if killed_at is not None:
+            if now - killed_at > KILL_GRACE:  # e.g. a daemon that left the process group still holds the pipes
+                break
+            continue
+        if timeout is not None and now - start >= timeout:
+            status, error = 'timeout', f'command timed out after {timeout} seconds'
+        elif now - last_poll >= poll_interval:
+            last_poll = now
+            poll_interval = min(2 * poll_interval, RSS_POLL_INTERVAL)
+            rss, peak = _group_rss(process.pid)
+            peak_rss = max(peak_rss, peak)
+            if max_rss is not None and rss > max_rss:
+                status, error = 'memory', f'command exceeded {max_rss_gb} GB of resident memory'
+        if status is not None:
+            _kill_group(process.pid)
+            killed_at = now
+
+    selector.close()
+    for stream, log in logs.items():
+        stream.close()
+        log.close()
+    process.wait()
+
+    if status is not None:
+        returncode = -1
+        with open(save_dir / 'execute_err.txt', 'a') as f:
+            f.write(f'\n[ERROR] {error}\n')
+    else:
+        returncode = process.returncode
+        status = 'ok' if returncode == 0 else ('error' if returncode > 0 else 'crashed')
+    return {'status': status, 'returncode': returncode, 'error': error, 'time': time.time() - start,
+            'pid': process.pid, 'peak_rss_mb': round(peak_rss / 1024 ** 2, 1),
+            'truncated_bytes': {'stdout': logs[process.stdout].dropped, 'stderr': logs[process.stderr].dropped}}
+
+
+def load_exit_record(save_dir: str) -> Optional[dict]:
+    path = Path(save_dir) / 'status.json'
+    if not path.exists():
+        return None
+    with open(path.as_posix(), 'r') as f:
+        return json.load(f)
 
 
 def execute_command(command: str, save_dir: str, timeout=None, dry_run: bool = False,
-                    print_stdout: bool = False, print_stderr: bool = False, cwd=None) -> int:
+                    print_stdout: bool = False, print_stderr: bool = False, cwd=None,
+                    max_rss_gb: Optional[float] = None, max_log_mb: Optional[float] = 64) -> int:
+    """
+    Runs `command` in a shell, streaming its stdout and stderr to `execute_out.txt` and `execute_err.txt` in
+    `save_dir`, each capped at `max_log_mb`. The command and everything it started is killed once it runs longer than
+    `timeout` seconds or its resident memory exceeds `max_rss_gb`. The exit record, with the status, duration and peak
+    RSS, is saved to `status.json`.
+
+    Returns:
+        the exit code of the command, or -1 if it was killed
+    """
     save_dir = Path(save_dir)
     save_dir.mkdir(exist_ok=True, parents=True)
     with open((save_dir / 'impl.sh').as_posix(), 'w') as f:
@@ -16,68 +178,26 @@ def execute_command(command: str, save_dir: str, timeout=None, dry_run: bool = F
         print("[INFO] Dry run, skipping execution.")
         return 0
 
-    # with open(save_dir / "execute_out.txt", 'w') as out_file, open(save_dir / "execute_err.txt", 'w') as err_file:
-    #     process = subprocess.Popen(command, shell=True, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
-    #
-    #     try:
-    #         while True:
-    #             output = process.stdout.readline()
-    #             error = process.stderr.readline()
-    #
-    #             if output == '' and error == '' and process.poll() is not None:
-    #                 break
-    #
-    #             if output:
-    #                 if print_stdout:
-    #                     print(output, end='')
-    #                 out_file.write(output)
-    #                 out_file.flush()
-    #
-    #             if error:
-    #                 if print_stderr:
-    #                     print(error, end='', file=sys.stderr)
-    #                 err_file.write(error)
-    #                 err_file.flush()
-    #             time.sleep(10)
-    #
-    #         process.wait(timeout=timeout)
-    #         returncode = process.returncode
-    #
-    #     except subprocess.TimeoutExpired:
-    #         process.kill()
-    #         out_file.write("\nProcess timed out")
-    #         err_file.write("\nProcess timed out")
-    #         returncode = -1
-    # print(f"[INFO] {returncode=}")
-    # return returncode  # 0 is good
-
-    result = subprocess.run(command, shell=True, text=True, capture_output=True, timeout=timeout, cwd=cwd)
-
-    with open(save_dir / "execute_out.txt", 'w') as f:
-        f.write(result.stdout)
-    with open(save_dir / "execute_err.txt", 'w') as f:
-        f.write(result.stderr)
-
-    print(f"[INFO] {result.returncode=}")
-    if print_stdout:
-        print(result.stdout)
-    if print_stderr:
-        print(result.stderr)
-    return result.returncode  # 0 is good
+    ret = _run(command, save_dir, timeout=timeout, max_rss_gb=max_rss_gb, max_log_mb=max_log_mb,
+               print_stdout=print_stdout, print_stderr=print_stderr, cwd=cwd)
+    with open(save_dir / 'status.json', 'w') as f:
+        json.dump(ret, f)
+    print(f"[INFO] {ret['status']=} {ret['returncode']=} {ret['time']=:.2f} {ret['peak_rss_mb']=}")
+    if ret['error'] is not None:
+        print(f"[ERROR] {ret['error']}")
+    return ret['returncode']  # 0 is good
 
 
 def execute_command_retries(command: str, save_dir: str, retries=3, timeout=30):
-    attempt = 0
-    while attempt < retries:
+    for attempt in range(retries):
+        print(f"[INFO] Attempt {attempt=} of {retries=}")
         try:
-            print(f"[INFO] Attempt {attempt=} of {retries=}")
-            return execute_command(command=command, save_dir=save_dir, timeout=timeout)
-        except subprocess.TimeoutExpired:
-            attempt += 1
-            time.sleep(1)  # Optional: Wait a bit before retrying
+            returncode = execute_command(command=command, save_dir=save_dir, timeout=timeout)
         except Exception as e:
             print(f"[ERROR] An error occurred: {e}, {command=}")
-            import ipdb; ipdb.set_trace()
-            break
+            return None
+        if load_exit_record(save_dir)['status'] != 'timeout':
+            return returncode
+        time.sleep(1)  # Optional: Wait a bit before retrying
     print(f"[ERROR] Failed to execute {command=} after {retries} attempts.")
     return None
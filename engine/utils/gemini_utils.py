@@ -1,32 +1,26 @@
-from engine.constants import PROJ_DIR, GOOGLE_API_KEY, MAX_TOKENS, TEMPERATURE, NUM_COMPLETIONS
+from engine.constants import PROJ_DIR, GOOGLE_API_KEY, MAX_TOKENS, TEMPERATURE, NUM_COMPLETIONS, LLM_CONCURRENCY, LLM_REQUESTS_PER_MINUTE
+from engine.utils.llm_cache import LLMCache, canonical_request
+from engine.utils.llm_concurrency import fan_out, get_rate_limiter
 import copy
+import hashlib
 from pathlib import Path
 import base64
-import json
 import os
-import time
 import random
 from PIL import Image
 import io
 import google
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 
 
 GOOGLE_MODEL_NAME = 'gemini-1.5-flash'
 
 class GeminiClient:
-    def __init__(self, model_name=GOOGLE_MODEL_NAME, cache="cache.json"):
+    def __init__(self, model_name=GOOGLE_MODEL_NAME, cache="cache.db"):
         self.cache_file = cache
         self.model_name = model_name
-        self.exponential_backoff = 1
-        # Load the cache JSON file, if cache file exists. Else, cache is {}
-        if os.path.exists(cache):
-            while os.path.exists(self.cache_file + ".tmp") or os.path.exists(self.cache_file + ".lock"):
-                time.sleep(0.1)
-            with open(cache, "r") as f:
-                self.cache = json.load(f)
-        else:
-            self.cache = {}
+        self.cache = LLMCache(cache)
 
         genai.configure(api_key=GOOGLE_API_KEY)
 
@@ -46,34 +40,37 @@ class GeminiClient:
         cache_key = None
         results = []
         if not skip_cache:
-            cache_key = str((user_prompt, system_prompt, max_tokens, temperature, stop_sequences, 'gemini'))
+            request = canonical_request(provider='gemini', model=self.model_name, user_prompt=user_prompt, system_prompt=system_prompt,
+                                        max_tokens=max_tokens, temperature=temperature, stop_sequences=stop_sequences)
+            cache_key = hashlib.sha256(request.encode()).hexdigest()
 
             num_completions = skip_cache_completions + num_completions
-            if cache_key in self.cache:
-                print(f'[INFO] Gemini: cache hit {len(self.cache[cache_key])}')
-                if len(self.cache[cache_key]) < num_completions:
-                    num_completions -= len(self.cache[cache_key])
-                    results = self.cache[cache_key]
+            results = self.cache.get(cache_key)
+            if len(results) > 0:
+                print(f'[INFO] Gemini: cache hit {len(results)}')
+                if len(results) < num_completions:
+                    num_completions -= len(results)
                 else:
-                    return cache_key, self.cache[cache_key][skip_cache_completions:num_completions]
-
-        while num_completions > 0:
-            self.client = genai.GenerativeModel(
-                self.model_name,
-                system_instruction=system_prompt
-            )
-            while True:
-                try:
-                    response = self.client.generate_content(messages)
-                    break
-                except Exception:
-                    print("Rate limit reached. Waiting before retrying...")
-                    time.sleep(16 * self.exponential_backoff)
-                    self.exponential_backoff *= 2
-            num_completions -= 1
-
-            if response.text:
-              content = [response.text]
+                    return cache_key, results[skip_cache_completions:num_completions]
+        num_cached = len(results)
+
+        self.client = genai.GenerativeModel(
+            self.model_name,
+            system_instruction=system_prompt
+        )
+
+        def complete():
+            return self.client.generate_content(messages)
+
+        # only rate limits and transient server errors are retried; e.g. an invalid argument would fail again
+        responses = fan_out(complete, num_completions, max_concurrency=LLM_CONCURRENCY,
+                            rate_limiter=get_rate_limiter('gemini', LLM_REQUESTS_PER_MINUTE),
+                            retry_on=(google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable,
+                                      google_exceptions.InternalServerError, google_exceptions.DeadlineExceeded),
+                            name='Gemini')
+        for response in responses:
+            # `response.text` raises a `ValueError` for a blocked candidate, which a retry would not fix
+            content = [response.text] if response.text else []
 
             indented = []
             for c in content:
@@ -81,24 +78,10 @@ class GeminiClient:
             results.extend(indented)
 
         if not skip_cache:
-            self.update_cache(cache_key, results)
+            self.cache.append(cache_key, results[num_cached:], request=request)
 
         return cache_key, results[skip_cache_completions:]
 
-    def update_cache(self, cache_key, results):
-        while os.path.exists(self.cache_file + ".tmp") or os.path.exists(self.cache_file + ".lock"):
-            time.sleep(0.1)
-        with open(self.cache_file + ".lock", "w") as f:
-            pass
-        if os.path.exists(self.cache_file):
-            with open(self.cache_file, "r") as f:
-                self.cache = json.load(f)
-        self.cache[cache_key] = results
-        with open(self.cache_file + ".tmp", "w") as f:
-            json.dump(self.cache, f)
-        os.rename(self.cache_file + ".tmp", self.cache_file)
-        os.remove(self.cache_file + ".lock")
-
 
 def setup_gemini():
     try:
@@ -106,5 +89,5 @@ def setup_gemini():
     except OSError:
         username = os.environ.get('USER') or os.environ.get('LOGNAME')
 
-    model = GeminiClient(cache='cache.json' if not os.path.exists('/viscam/') else f'cache_{username}.json')
+    model = GeminiClient(cache='cache.db' if not os.path.exists('/viscam/') else f'cache_{username}.db')
     return model
\ No newline at end of file
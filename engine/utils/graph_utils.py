@@ -1,61 +1,102 @@
+from typing import Callable, Iterable
 
-def strongly_connected_components(defined_fns):
-    # Identify the nodes reachable from each node
-    reachable = {fn_name: {fn_name} for fn_name in defined_fns}
-    changed = True
-    while changed:
-        changed = False
-        # Loop through all the pairs of fn_name and the functions reachable from it
-        for fn_name, fns_reachable in reachable.items():
-            # Loop through all the functions reachable from fn_name
-            for fn_reachable_name in fns_reachable.copy():
-                fn = defined_fns[fn_reachable_name]
-                # Loop through all the children of the functions reachable from fn_name
-                for child in fn.children:
-                    initial_len = len(reachable[fn_name])
-                    # Try to add the child to the set of functions reachable from fn_name
-                    reachable[fn_name].add(child.name)
-                    # # If the child has no asserts, it also depends on the parent
-                    # if not child.asserts and not CONSTS['implicit_assert'] and consider_asserts:
-                    #     initial_len_2 = len(reachable[child.name])
-                    #     reachable[child.name].add(fn_reachable_name)
-                    #     if len(reachable[child.name]) > initial_len_2:
-                    #         changed = True
-                    if len(reachable[fn_name]) > initial_len:
-                        changed = True
-                # Reachability is transitive, so add everything reachable from anything reachable from fn_name
-                for fn_reachable_name_2 in fns_reachable.copy():
-                    initial_len = len(reachable[fn_name])
-                    reachable[fn_name].update(reachable[fn_reachable_name_2])
-                    if len(reachable[fn_name]) > initial_len:
-                        changed = True
-
-    # Identify the strongly connected components
+
+def tarjan_scc(nodes: Iterable[str], successors: Callable[[str], Iterable[str]]) -> list[list[str]]:
+    """
+    Tarjan's algorithm, iterative so that deep call chains do not hit the recursion limit. O(V + E).
+
+    Returns:
+        strongly connected components in reverse topological order: edges only point to the same or earlier components
+    """
+    index: dict[str, int] = {}
+    lowlink: dict[str, int] = {}
+    stack: list[str] = []
+    on_stack: set[str] = set()
     sccs = []
-    remaining_nodes = set(defined_fns)
-    for fn_name in defined_fns.keys():
-        if fn_name not in remaining_nodes:
+    for start in nodes:
+        if start in index:
             continue
-        remaining_nodes.remove(fn_name)
-        scc = {fn_name}
-        for child_name in reachable[fn_name]:
-            if fn_name in reachable[child_name]:
-                if child_name in remaining_nodes:
-                    scc.add(child_name)
-                    remaining_nodes.remove(child_name)
-        sccs.append(scc)
-
-    # Identify the relationships between the strongly connected components
-    scc_edges = []
-    for scc_1_idx, scc_1 in enumerate(sccs):
-        scc_1_edges = []
-        for scc_2_idx, scc_2 in enumerate(sccs):
-            if scc_1_idx == scc_2_idx:
-                continue
-            if list(scc_2)[0] in reachable[list(scc_1)[0]]:
-                scc_1_edges += [scc_2_idx]
-        scc_edges.append(scc_1_edges)
-    return sccs, scc_edges
+        index[start] = lowlink[start] = len(index)
+        stack.append(start)
+        on_stack.add(start)
+        work = [(start, iter(successors(start)))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(successors(child))))
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    scc = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        scc.append(member)
+                        if member == node:
+                            break
+                    sccs.append(scc)
+    return sccs
+
+
+def condensation(defined_fns) -> tuple[list[list[str]], dict[str, int], list[set[int]]]:
+    """
+    Returns:
+        the strongly connected components of the call graph in reverse topological order (callees first),
+        the component of each function, and the edges between components
+    """
+    def children(fn_name):
+        return [child.name for child in defined_fns[fn_name].children or ()]
+
+    sccs = tarjan_scc(defined_fns, children)
+    scc_of = {fn_name: idx for idx, scc in enumerate(sccs) for fn_name in scc}
+    scc_edges = [set() for _ in sccs]
+    for fn_name in defined_fns:
+        for child_name in children(fn_name):
+            if scc_of[child_name] != scc_of[fn_name]:
+                scc_edges[scc_of[fn_name]].add(scc_of[child_name])
+    return sccs, scc_of, scc_edges
+
+
+def reachable_sccs(scc_edges: list[set[int]]) -> list[int]:
+    # bitsets of the components reachable from each component, given components in reverse topological order
+    reachable = [0] * len(scc_edges)
+    for idx, edges in enumerate(scc_edges):
+        for child_idx in edges:
+            reachable[idx] |= reachable[child_idx] | (1 << child_idx)
+    return reachable
+
+
+def strongly_connected_components(defined_fns):
+    sccs, scc_of, scc_edges = condensation(defined_fns)
+    reachable = reachable_sccs(scc_edges)
+
+    # Number the components by their first function in `defined_fns`
+    order = {}
+    for fn_name in defined_fns:
+        order.setdefault(scc_of[fn_name], len(order))
+    # For each component, all components reachable from it, not only its direct children
+    ordered_edges = [[] for _ in order]
+    for idx, new_idx in order.items():
+        bits = reachable[idx]
+        while bits:
+            low = bits & -bits
+            ordered_edges[new_idx].append(order[low.bit_length() - 1])
+            bits ^= low
+        ordered_edges[new_idx].sort()
+    ordered_sccs = [set() for _ in order]
+    for idx, new_idx in order.items():
+        ordered_sccs[new_idx] = set(sccs[idx])
+    return ordered_sccs, ordered_edges
 
 
 def get_ancestors(node, visited=None):
@@ -70,62 +111,46 @@ def get_ancestors(node, visited=None):
 
 def get_root(defined_fns) -> str:
     # Identify a function which is the parent of all other functions
-    # We allow for cycles, so we can't use just parents
-    shared_ancestors = None
-    for fn in defined_fns.values():
-        anc = get_ancestors(fn)
-        # print(f'{fn.name=}: {anc=}')
-        if shared_ancestors is None:
-            shared_ancestors = set(anc) | {fn.name}
-        else:
-            shared_ancestors.intersection_update(anc)
-    shared_defined = shared_ancestors & set(defined_fns.keys())
-    return shared_defined.pop()
+    # We allow for cycles, so we can't use just parents: the root is any function in the only component of defined
+    # functions that has no other component of defined functions above it
+    nodes = {fn.name: fn for fn in defined_fns.values()}
+    todo = list(nodes.values())
+    while todo:
+        for parent in todo.pop().parents:
+            if parent.name not in nodes:
+                nodes[parent.name] = parent
+                todo.append(parent)
+
+    # with edges from children to parents, ancestors come first
+    sccs = tarjan_scc(nodes, lambda name: [parent.name for parent in nodes[name].parents])
+    scc_of = {name: idx for idx, scc in enumerate(sccs) for name in scc}
+    is_defined = [any(name in defined_fns for name in scc) for scc in sccs]
+    has_defined_above = [False] * len(sccs)
+    for idx, scc in enumerate(sccs):
+        for name in scc:
+            for parent in nodes[name].parents:
+                parent_idx = scc_of[parent.name]
+                if parent_idx != idx and (is_defined[parent_idx] or has_defined_above[parent_idx]):
+                    has_defined_above[idx] = True
+    top_sccs = [idx for idx in range(len(sccs)) if is_defined[idx] and not has_defined_above[idx]]
+    if len(top_sccs) != 1:
+        raise KeyError(f'no function is an ancestor of all functions, found {len(top_sccs)} top-level components')
+    return next(fn_name for fn_name in defined_fns if scc_of[fn_name] == top_sccs[0])
 
 
 def calculate_node_depths(defined_fns, root):
-    depths = {fn_name: -1 for fn_name in defined_fns}  # Start with -1 (undefined depth)
-    sccs, _ = strongly_connected_components(defined_fns)
-    scc_map = {node: idx for idx, scc in enumerate(sccs) for node in scc}
-    reduced_graph = {i: set() for i in range(len(sccs))}
-
-    for node, fn in defined_fns.items():
-        current_scc = scc_map[node]
-        for child in fn.children:
-            child_scc = scc_map[child.name]
-            if current_scc != child_scc:
-                reduced_graph[current_scc].add(child_scc)
+    # Longest distance from the component of `root` in the condensed call graph; -1 if unreachable
+    sccs, scc_of, scc_edges = condensation(defined_fns)
     depths = [-1] * len(sccs)
-
-    def dfs(_scc_index, current_depth):
-        if depths[_scc_index] < current_depth:
-            depths[_scc_index] = current_depth
-            for neighbor in reduced_graph[_scc_index]:
-                dfs(neighbor, current_depth + 1)
-
-    for scc_index in reduced_graph:
-        if root in sccs[scc_index]:
-            dfs(scc_index, 0)
-            break
-
-    # # Find root nodes in the reduced graph
-    # all_children = set(c for neighbors in reduced_graph.values() for c in neighbors)
-    # root_sccs = [scc_index for scc_index in reduced_graph if scc_index not in all_children]
-    # root = get_root(defined_fns)
-    # for root_scc in root_sccs:
-    #     if root not in sccs[root_scc]:
-    #         print(f'Warning: root {root} not in root sccs {root_sccs}')
-    #     # raise RuntimeError()
-    #
-    # # Calculate depths starting from each root SCC
-    # for root_scc in root_sccs:
-    #     dfs(root_scc, 0)
+    if root in scc_of:
+        depths[scc_of[root]] = 0
+        for idx in reversed(range(len(sccs))):  # topological order, callers first
+            if depths[idx] >= 0:
+                for child_idx in scc_edges[idx]:
+                    depths[child_idx] = max(depths[child_idx], depths[idx] + 1)
 
     # Map SCC depths back to individual nodes
-    node_depths = {}
-    for node, scc_index in scc_map.items():
-        node_depths[node] = depths[scc_index]
-    return node_depths
+    return {fn_name: depths[scc_of[fn_name]] for fn_name in defined_fns}
 
 
 def overwrite_dependency(defined_fns, defined_fns_transfer_from):
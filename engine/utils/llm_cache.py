@@ -0,0 +1,196 @@
+import argparse
+import ast
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+# fields of the legacy `str(tuple)` cache keys, by the provider tag at the end of the tuple;
+# `CodeGen` keys have no tag and an optional trailing `presence_penalty`
+LEGACY_FIELDS = {
+    'claude': ('user_prompt', 'system_prompt', 'max_tokens', 'temperature', 'stop_sequences'),
+    'gemini': ('user_prompt', 'system_prompt', 'max_tokens', 'temperature', 'stop_sequences'),
+    'llama': ('user_prompt', 'system_prompt', 'max_tokens', 'temperature', 'stop_sequences'),
+    'gpt': ('messages', 'max_tokens', 'temperature', 'stop', 'indented', 'indented_after_first_line', 'require',
+            'presence_penalty'),
+}
+
+
+def _image_digest(image: Any) -> Optional[str]:
+    # images enter cache keys by content: file paths (Claude) and base64 data URLs (`CodeGen`) hash to the same digest
+    if isinstance(image, dict):
+        image = image.get('url')
+    if not isinstance(image, str):
+        return None
+    if image.startswith('data:') and ';base64,' in image:
+        return hashlib.sha256(base64.b64decode(image.split(';base64,', 1)[1])).hexdigest()
+    if os.path.isfile(image):
+        with open(image, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    return None
+
+
+def _canonicalize(value: Any) -> Any:
+    if isinstance(value, dict):
+        if value.get('type') == 'image_url':
+            digest = _image_digest(value.get('image_url'))
+            if digest is not None:
+                return {'type': 'image', 'sha256': digest}
+        return {str(k): _canonicalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonicalize(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+def canonical_request(**request) -> str:
+    return json.dumps(_canonicalize(request), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def request_key(**request) -> str:
+    """
+    Cache key of an LLM request, e.g. `request_key(provider='claude', model=..., user_prompt=..., system_prompt=...,
+    max_tokens=..., temperature=..., stop_sequences=...)`. Tuples and lists are equivalent, and images are keyed by
+    the SHA-256 of their contents.
+    """
+    return hashlib.sha256(canonical_request(**request).encode()).hexdigest()
+
+
+class LLMCache:
+    """
+    SQLite cache of LLM completions, shared by all provider clients and safe for concurrent processes.
+
+    Each key maps to an append-only list of completions, stored one row per completion, so that writers only insert
+    new rows instead of rewriting the cache. The database runs in WAL mode: readers never block, and concurrent
+    writers are serialized by SQLite's busy handler instead of a lock file.
+    """
+
+    def __init__(self, path: str, timeout: float = 60.):
+        self.path = str(path)
+        self.timeout = timeout
+        self._local = threading.local()
+        legacy_path = Path(self.path).with_suffix('.json')
+        if not os.path.exists(self.path) and legacy_path.exists():
+            print(f'[INFO] Found legacy cache {legacy_path}, migrate it with '
+                  f'`python -m engine.utils.llm_cache {legacy_path} {self.path}`')
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS completions ('
+                         'key TEXT NOT NULL, idx INTEGER NOT NULL, completion TEXT NOT NULL, '
+                         'PRIMARY KEY (key, idx)) WITHOUT ROWID')
+            conn.execute('CREATE TABLE IF NOT EXISTS requests (key TEXT PRIMARY KEY, request TEXT NOT NULL)')
+
+    def _connect(self) -> sqlite3.Connection:
+        # one connection per thread and process; connections must not be shared across `fork`
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            Path(self.path).parent.mkdir(exist_ok=True, parents=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str) -> list:
+        rows = self._connect().execute('SELECT completion FROM completions WHERE key = ? ORDER BY idx', (key,))
+        return [json.loads(row[0]) for row in rows]
+
+    def __contains__(self, key: str) -> bool:
+        return self._connect().execute('SELECT 1 FROM completions WHERE key = ? LIMIT 1', (key,)).fetchone() is not None
+
+    def __getitem__(self, key: str) -> list:
+        return self.get(key)
+
+    def __len__(self) -> int:
+        return self._connect().execute('SELECT COUNT(DISTINCT key) FROM completions').fetchone()[0]
+
+    def append(self, key: str, completions: list, request: Optional[str] = None):
+        if len(completions) == 0:
+            return
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')  # takes the write lock up front, so that the index below stays valid
+        try:
+            start = conn.execute('SELECT COALESCE(MAX(idx) + 1, 0) FROM completions WHERE key = ?', (key,)).fetchone()[0]
+            conn.executemany('INSERT INTO completions (key, idx, completion) VALUES (?, ?, ?)',
+                             [(key, start + i, json.dumps(c)) for i, c in enumerate(completions)])
+            if request is not None:
+                conn.execute('INSERT OR IGNORE INTO requests (key, request) VALUES (?, ?)', (key, request))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _legacy_request(legacy_key: str) -> Optional[dict[str, Any]]:
+    try:
+        values = ast.literal_eval(legacy_key)
+    except (ValueError, SyntaxError):
+        return None
+    if not isinstance(values, tuple):
+        return None
+    if len(values) == len(LEGACY_FIELDS['claude']) + 1 and values[-1] in LEGACY_FIELDS:
+        return {'provider': values[-1], **dict(zip(LEGACY_FIELDS[values[-1]], values[:-1]))}
+    if len(values) in (len(LEGACY_FIELDS['gpt']) - 1, len(LEGACY_FIELDS['gpt'])):
+        return {'provider': 'gpt', 'presence_penalty': 0., **dict(zip(LEGACY_FIELDS['gpt'], values))}
+    return None
+
+
+def migrate_json_cache(json_path: str, db_path: str, models: dict[str, str]) -> dict[str, int]:
+    """
+    Copies a legacy JSON cache into an `LLMCache`. Legacy keys do not record the model, so `models` maps each provider
+    tag to the model that produced its entries; entries of other providers are skipped. Re-running is a no-op.
+    """
+    with open(json_path, 'r') as f:
+        legacy = json.load(f)
+    cache = LLMCache(db_path)
+    conn = cache._connect()
+    stats = {'migrated': 0, 'skipped': 0}
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for legacy_key, completions in legacy.items():
+            request = _legacy_request(legacy_key)
+            if request is None or request['provider'] not in models or not isinstance(completions, list):
+                stats['skipped'] += 1
+                continue
+            request['model'] = models[request['provider']]
+            canonical = canonical_request(**request)
+            key = hashlib.sha256(canonical.encode()).hexdigest()
+            conn.executemany('INSERT OR IGNORE INTO completions (key, idx, completion) VALUES (?, ?, ?)',
+                             [(key, i, json.dumps(c)) for i, c in enumerate(completions)])
+            conn.execute('INSERT OR IGNORE INTO requests (key, request) VALUES (?, ?)', (key, canonical))
+            stats['migrated'] += 1
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    cache.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate a legacy JSON LLM cache to SQLite.')
+    parser.add_argument('json_path')
+    parser.add_argument('db_path')
+    parser.add_argument('--model', action='append', default=[], metavar='PROVIDER=MODEL',
+                        help='model that produced the entries of a provider (claude, gemini, llama, gpt), repeatable')
+    args = parser.parse_args()
+    models = dict(m.split('=', 1) for m in args.model)
+    if len(models) == 0:
+        print('[ERROR] no --model given, nothing to migrate')
+        return
+    stats = migrate_json_cache(args.json_path, args.db_path, models)
+    print(f'[INFO] migrated {args.json_path} to {args.db_path}: {stats}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+R = TypeVar('R')
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: holds up to `capacity` tokens and refills at `rate` tokens per second.
+
+    `acquire` sleeps exactly until enough tokens are available instead of polling. `pause` empties the bucket for a
+    while, so that after a rate limit error every thread sharing the bucket backs off, not only the one that got it.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if now > self.updated:  # `updated` is in the future during a pause
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def acquire(self, tokens: float = 1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = max(self.updated - now, 0) + (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = 0
+            self.updated = max(self.updated, now + seconds)  # refilling starts once the pause is over
+
+
+_rate_limiters: dict[str, TokenBucket] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, requests_per_minute: float) -> TokenBucket:
+    # one bucket per provider, shared by all clients in the process
+    with _rate_limiters_lock:
+        if name not in _rate_limiters:
+            rate = requests_per_minute / 60
+            _rate_limiters[name] = TokenBucket(rate=rate, capacity=max(1., rate))
+        return _rate_limiters[name]
+
+
+def fan_out(fn: Callable[[], R], n: int, max_concurrency: int, rate_limiter: Optional[TokenBucket],
+            retry_on: tuple[type[BaseException], ...], max_retries: int = 8, base_delay: float = 1., max_delay: float = 60.,
+            retry_after: Callable[[BaseException], Optional[float]] = lambda e: None, name: str = 'LLM') -> list[R]:
+    """
+    Calls `fn` `n` times with at most `max_concurrency` calls in flight, each call taking one token from
+    `rate_limiter`. Calls failing with `retry_on` are retried with capped exponential backoff and jitter, which starts
+    over for every call; `retry_after` may extract a server-provided delay from the error.
+
+    Returns:
+        results in call order
+    """
+    def call(i: int) -> R:
+        for attempt in range(max_retries + 1):
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            try:
+                return fn()
+            except retry_on as e:
+                if attempt == max_retries:
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(.5, 1.)
+                print(f'[INFO] {name}: {type(e).__name__} for completion {i}, retrying in {delay:.1f} seconds')
+                if rate_limiter is not None:
+                    rate_limiter.pause(delay)  # the next `acquire` waits out the pause
+                else:
+                    time.sleep(delay)
+
+    if n <= 0:
+        return []
+    if n == 1 or max_concurrency <= 1:
+        return [call(i) for i in range(n)]
+    with ThreadPoolExecutor(max_workers=min(n, max_concurrency)) as executor:
+        return list(executor.map(call, range(n)))
@@ -6,6 +6,8 @@ from pathlib import Path
 import numpy as np
 from .type_utils import BBox
 from typing import Optional
+import xml.etree.ElementTree as ET
+import re
 
 T = mi.scalar_rgb.Transform4f
 
@@ -284,3 +286,102 @@ def apply_gravity(shape_dict: dict, aux_scene_dict: dict = None) -> dict:
     y_offset = np.asarray(sh.bbox().min)[1]
     shape_dict['to_world'] = T.translate([0, -y_offset, 0]) @ shape_dict['to_world']
     return shape_dict
+
+
+# tags of XML elements that instantiate a plugin and become nested dicts with a 'type' key
+XML_PLUGIN_TAGS = ('scene', 'integrator', 'sensor', 'film', 'sampler', 'rfilter', 'emitter', 'shape', 'bsdf',
+                   'texture', 'medium', 'phase', 'volume')
+
+
+def _parse_floats(value: str) -> list[float]:
+    return [float(v) for v in re.split(r'[\s,]+', value.strip()) if v != '']
+
+
+def _parse_vector(elem: ET.Element, default: float) -> list[float]:
+    if 'value' in elem.attrib:
+        values = _parse_floats(elem.get('value'))
+        return values * 3 if len(values) == 1 else values
+    return [float(elem.get(k, default)) for k in 'xyz']
+
+
+def _parse_transform(elem: ET.Element) -> T:
+    ret = T()
+    for op in elem:
+        if op.tag == 'translate':
+            ret = T.translate(_parse_vector(op, default=0)) @ ret
+        elif op.tag == 'scale':
+            ret = T.scale(_parse_vector(op, default=1)) @ ret
+        elif op.tag == 'rotate':
+            axis = _parse_floats(op.get('value')) if 'value' in op.attrib else [float(op.get(k, 0)) for k in 'xyz']
+            ret = T.rotate(axis, float(op.get('angle'))) @ ret
+        elif op.tag == 'matrix':
+            values = _parse_floats(op.get('value'))
+            matrix = np.eye(4)
+            if len(values) == 9:
+                matrix[:3, :3] = np.reshape(values, (3, 3))
+            else:
+                matrix = np.reshape(values, (4, 4))
+            ret = T(matrix) @ ret
+        elif op.tag == 'lookat':
+            ret = T.look_at(origin=_parse_floats(op.get('origin')), target=_parse_floats(op.get('target')),
+                            up=_parse_floats(op.get('up', '0, 1, 0'))) @ ret
+        else:
+            raise NotImplementedError(f'unsupported transform operation: {op.tag}')
+    return ret
+
+
+def _parse_xml_element(elem: ET.Element, defaults: dict[str, str], base_dir: Path):
+    if elem.tag in XML_PLUGIN_TAGS:
+        ret = {'type': elem.get('type', elem.tag)}  # `scene` has no type attribute
+        for i, child in enumerate(elem):
+            if child.tag == 'default':
+                continue
+            key = child.get('name') or child.get('id') or f'{child.tag}_{i:03d}'
+            if elem.tag == 'scene':  # top-level objects are referenced by their id
+                key = child.get('id') or key
+            ret[key] = _parse_xml_element(child, defaults, base_dir)
+        return ret
+    if elem.tag == 'ref':
+        return {'type': 'ref', 'id': elem.get('id')}
+    if elem.tag == 'transform':
+        return _parse_transform(elem)
+    value = elem.get('value')
+    if elem.tag == 'float':
+        return float(value)
+    if elem.tag == 'integer':
+        return int(value)
+    if elem.tag == 'boolean':
+        return value.lower() == 'true'
+    if elem.tag == 'string':
+        if elem.get('name') == 'filename' and not Path(value).is_absolute():
+            return (base_dir / value).as_posix()
+        return value
+    if elem.tag in ('rgb', 'spectrum'):
+        if ':' in value:  # wavelength:value pairs
+            return {'type': elem.tag, 'value': [tuple(map(float, pair.split(':'))) for pair in value.split(',')]}
+        values = _parse_floats(value)
+        return {'type': elem.tag, 'value': values[0] if len(values) == 1 else values}
+    if elem.tag in ('point', 'vector'):
+        return mi.scalar_rgb.ScalarPoint3f(_parse_vector(elem, default=0))
+    raise NotImplementedError(f'unsupported XML element: {elem.tag}')
+
+
+def _substitute_defaults(elem: ET.Element, defaults: dict[str, str]):
+    for k, v in elem.attrib.items():
+        if '$' in v:
+            elem.set(k, re.sub(r'\$(\w+)', lambda m: defaults.get(m.group(1), m.group(0)), v))
+    for child in elem:
+        _substitute_defaults(child, defaults)
+
+
+def xml_to_dict(path: str) -> dict:
+    """
+    Converts a Mitsuba XML scene file into the equivalent `mi.load_dict` scene dictionary.
+    Supports the subset of the format used by the scene presets, i.e. no `include`, `alias` or `path` elements.
+    `$name` parameters take the values of their `default` elements; relative file names are resolved against the
+    directory of `path`.
+    """
+    root = ET.parse(path).getroot()
+    defaults = {child.get('name'): child.get('value') for child in root.iter('default')}
+    _substitute_defaults(root, defaults)
+    return _parse_xml_element(root, defaults, base_dir=Path(path).parent.absolute())
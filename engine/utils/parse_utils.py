@@ -1,9 +1,14 @@
 import re
+import sys
 import difflib
 import ast
+import builtins
+import functools
+import importlib
 import astor
 from typing import Optional
 from pathlib import Path
+from engine.utils.graph_utils import get_root
 
 
 PRIMITIVES = {'cube', 'sphere'}  # {'cube', 'sphere', 'cylinder', 'cone'}
@@ -183,6 +188,305 @@ def remove_repeated_functions(program: str) -> str:
     return cleaned_script
 
 
+def _is_register(decorator: ast.expr) -> bool:
+    func = decorator.func if isinstance(decorator, ast.Call) else decorator
+    return (isinstance(func, ast.Name) and func.id == 'register') or (isinstance(func, ast.Attribute) and func.attr == 'register')
+
+
+def _is_register_animation(decorator: ast.expr) -> bool:
+    func = decorator.func if isinstance(decorator, ast.Call) else decorator
+    return isinstance(func, ast.Name) and func.id == 'register_animation'
+
+
+def _register_docstring(func: ast.FunctionDef) -> Optional[str]:
+    # `None` if the docstring is computed at runtime
+    for decorator in func.decorator_list:
+        if not _is_register(decorator) or not isinstance(decorator, ast.Call):
+            continue
+        args = decorator.args[:1] + [kw.value for kw in decorator.keywords if kw.arg == 'docstring']
+        if len(args) == 0 or (isinstance(args[0], ast.Constant) and args[0].value is None):
+            return func.name
+        if isinstance(args[0], ast.Constant) and isinstance(args[0].value, str):
+            return args[0].value
+        return None
+    return func.name
+
+
+class _CallSiteVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.calls: list[str] = []  # `library_call` names, in order
+        self.helpers: set[str] = set()  # names of other functions called, which may call `library_call` themselves
+        self.dynamic = False
+
+    def visit_FunctionDef(self, node):
+        # nested registered functions are nodes of their own; nested helpers run on behalf of the enclosing function
+        if not any(_is_register(d) for d in node.decorator_list):
+            self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Call(self, node):
+        func = node.func
+        if (isinstance(func, ast.Name) and func.id == 'library_call') or (isinstance(func, ast.Attribute) and func.attr == 'library_call'):
+            names = node.args[:1] + [kw.value for kw in node.keywords if kw.arg == 'func_name']
+            if len(names) > 0 and isinstance(names[0], ast.Constant) and isinstance(names[0].value, str):
+                self.calls.append(names[0].value)
+            else:
+                self.dynamic = True
+            for child in node.args + node.keywords:
+                self.visit(child)
+            return
+        if isinstance(func, ast.Name):
+            self.helpers.add(func.id)
+        self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id == 'library_call':  # passed around as a value, e.g. `map(library_call, names)`
+            self.dynamic = True
+
+
+def _collect_functions(programs) -> tuple[dict[str, tuple[Optional[str], _CallSiteVisitor]], dict[str, _CallSiteVisitor]]:
+    # registered functions -> (docstring, call sites), and module-level helpers -> call sites
+    registered: dict[str, tuple[Optional[str], _CallSiteVisitor]] = {}
+    helpers: dict[str, _CallSiteVisitor] = {}
+    for program in programs:
+        tree = program if isinstance(program, ast.Module) else ast.parse(program)
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and any(_is_register(d) for d in node.decorator_list):
+                visitor = _CallSiteVisitor()
+                for stmt in node.body:
+                    visitor.visit(stmt)
+                registered[node.name] = (_register_docstring(node), visitor)
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and not any(_is_register(d) for d in node.decorator_list):
+                helpers[node.name] = visitor = _CallSiteVisitor()
+                for stmt in node.body:
+                    visitor.visit(stmt)
+            elif isinstance(node, ast.Assign) and isinstance(node.value, ast.Lambda):
+                visitor = _CallSiteVisitor()
+                visitor.visit(node.value.body)
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        helpers[target.id] = visitor
+    return registered, helpers
+
+
+def _resolve_calls(registered, helpers) -> Optional[dict[str, list[Optional[str]]]]:
+    # registered function -> the functions its `library_call`s resolve to, None for names that resolve to nothing
+    def resolve(call: str) -> Optional[str]:
+        # same lookup as `library_call`: by name, then by docstring, then by the first part of the docstring
+        if call in registered:
+            return call
+        if any(docstring is None for docstring, _ in registered.values()):
+            raise ValueError(call)
+        for match in [lambda d: d == call, lambda d: d.split(';')[0] == call]:
+            for name, (docstring, _) in registered.items():
+                if match(docstring):
+                    return name
+        return None  # `library_call` only prints a warning
+
+    resolved = {}
+    for name, (docstring, visitor) in registered.items():
+        calls, dynamic = list(visitor.calls), visitor.dynamic
+        visited, todo = set(), list(visitor.helpers)
+        while todo:
+            helper = todo.pop()
+            if helper in visited or helper not in helpers or helper in registered:
+                continue
+            visited.add(helper)
+            calls += helpers[helper].calls
+            dynamic |= helpers[helper].dynamic
+            todo += helpers[helper].helpers
+        if dynamic:
+            return None
+        try:
+            resolved[name] = [(call, resolve(call)) for call in calls]
+        except ValueError:
+            return None
+    return resolved
+
+
+def extract_call_graph(*programs: str) -> Optional[dict[str, dict]]:
+    """
+    Statically extracts the functions registered with `@register` and the functions each of them calls via
+    `library_call('<literal>')`, including calls in lambdas, `loop` bodies, nested helpers and module-level helpers.
+    Later programs overwrite functions of earlier ones, like executing them in order.
+
+    Returns:
+        function name -> {'docstring': ..., 'children': [...]} in registration order, or None if some call name is
+        computed at runtime and the graph can only be traced
+    """
+    registered, helpers = _collect_functions(programs)
+    resolved = _resolve_calls(registered, helpers)
+    if resolved is None:
+        return None
+    return {name: {'docstring': docstring,
+                   'children': list(dict.fromkeys(child for _, child in resolved[name] if child is not None))}
+            for name, (docstring, _) in registered.items()}
+
+
+_MODULE_NAMES = {'__name__', '__file__', '__doc__', '__builtins__', '__spec__', '__loader__', '__package__',
+                 '__annotations__', '__cached__'}
+
+
+def _bound_names(tree: ast.AST, search_dirs: tuple[str, ...]) -> Optional[set[str]]:
+    # every name bound anywhere in `tree`, regardless of scope; None if a star import cannot be resolved
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, (ast.ExceptHandler, ast.MatchAs, ast.MatchStar)) and node.name is not None:
+            names.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest is not None:
+            names.add(node.rest)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name != '*':
+                    names.add(alias.asname or alias.name.split('.')[0])
+                    continue
+                exports = module_exports(node.module, search_dirs) if node.level == 0 else None
+                if exports is None:
+                    return None
+                names.update(exports)
+    return names
+
+
+@functools.lru_cache(maxsize=None)
+def module_exports(module: str, search_dirs: tuple[str, ...] = ()) -> Optional[frozenset[str]]:
+    """
+    Names bound by `from <module> import *`, without importing it if it is a source file in `search_dirs`, e.g.
+    `helper` and everything it imports from `scripts/prompts`. Other modules are only imported from the standard
+    library.
+
+    Returns:
+        the names, or None if they are unknown
+    """
+    for search_dir in search_dirs:
+        path = Path(search_dir) / f'{module.replace(".", "/")}.py'
+        if not path.exists():
+            continue
+        tree = ast.parse(path.read_text())
+        exports = None
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == '__all__' for t in node.targets):
+                try:
+                    exports = frozenset(ast.literal_eval(node.value))
+                except ValueError:
+                    return None
+        if exports is not None:
+            return exports
+        # the public names at the top level of the module
+        top_level = ast.Module(body=[node for node in tree.body if not isinstance(node, (
+            ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))], type_ignores=[])
+        names = _bound_names(top_level, search_dirs)
+        if names is None:
+            return None
+        names.update(node.name for node in tree.body if isinstance(node, (
+            ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)))
+        return frozenset(name for name in names if not name.startswith('_'))
+    if module.split('.')[0] not in sys.stdlib_module_names:
+        return None
+    mod = importlib.import_module(module)
+    return frozenset(getattr(mod, '__all__', [name for name in dir(mod) if not name.startswith('_')]))
+
+
+class _CallGraphNode:
+    def __init__(self, name: str):
+        self.name = name
+        self.children = set()
+        self.parents = set()
+
+
+def _reachable_code(tree: ast.Module) -> list[ast.AST]:
+    # module-level code, registered functions, and the module-level functions and lambdas any of these may call
+    functions = {}
+    code = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions[node.name] = node.body
+            # decorators, defaults and annotations are evaluated when the function is defined
+            code += node.decorator_list + [node.args] + ([node.returns] if node.returns is not None else [])
+        elif isinstance(node, ast.Assign) and isinstance(node.value, ast.Lambda) and all(
+                isinstance(target, ast.Name) for target in node.targets):
+            for target in node.targets:
+                functions[target.id] = [node.value.body]
+        else:
+            code.append(node)
+    registered = [node for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+                  and any(_is_register(d) or _is_register_animation(d) for d in node.decorator_list)]
+    reached = {node.name for node in registered}
+    todo = code + [stmt for node in registered for stmt in node.body]
+    reachable = []
+    while todo:
+        node = todo.pop()
+        reachable.append(node)
+        for child in ast.walk(node):
+            # called, or passed to e.g. `loop`
+            if isinstance(child, ast.Name) and child.id in functions and child.id not in reached:
+                reached.add(child.id)
+                todo += functions[child.id]
+    return reachable
+
+
+def validate_program(program: str, search_dirs: tuple[str, ...] = ()) -> tuple[list[str], list[str], Optional[str]]:
+    """
+    Checks a program for errors that are certain to make its execution fail, without running it: syntax errors,
+    names in code that may run that are defined neither in the program nor by its imports, and programs that register
+    no function. `library_call` names that match no registered function are only warnings, since `library_call`
+    returns an empty shape for them.
+
+    Returns:
+        the errors and warnings found, and the root function if it can be determined statically
+    """
+    try:
+        tree = ast.parse(program)
+        compile(tree, '<program>', 'exec')  # e.g. `return` outside of a function
+    except SyntaxError as e:
+        return [f'SyntaxError: {e.msg} (line {e.lineno})'], [], None
+
+    errors, warnings = [], []
+    bound = _bound_names(tree, search_dirs)
+    if bound is not None:
+        defined = bound | set(dir(builtins)) | _MODULE_NAMES
+        undefined = {}
+        for code in _reachable_code(tree):
+            for node in ast.walk(code):
+                if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in defined:
+                    undefined[node.id] = min(undefined.get(node.id, node.lineno), node.lineno)
+        errors += [f"NameError: name '{name}' is not defined (line {lineno})"
+                   for name, lineno in sorted(undefined.items(), key=lambda item: item[1])]
+
+    registered, helpers = _collect_functions([tree])
+    if len(registered) == 0 and not any(isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and any(
+            _is_register_animation(d) for d in node.decorator_list) for node in ast.walk(tree)):
+        errors.append('no function is registered with `@register`')
+    resolved = _resolve_calls(registered, helpers)
+    if resolved is None:
+        return errors, warnings, None
+    for name, calls in resolved.items():
+        for call, child in calls:
+            if child is None:
+                warnings.append(f"`{name}` calls `library_call('{call}')`, but no function is registered as '{call}'")
+
+    nodes = {name: _CallGraphNode(name) for name in registered}
+    for name, calls in resolved.items():
+        for _, child in calls:
+            if child is not None:
+                nodes[name].children.add(nodes[child])
+                nodes[child].parents.add(nodes[name])
+    try:
+        root = get_root(nodes) if len(nodes) > 0 else None
+    except KeyError:
+        root = None
+    return errors, warnings, root
+
+
 def add_function_prefix(path: str, root: str, save_path: str):
     with open(path, 'r') as file:
         source = file.read()
@@ -1,4 +1,5 @@
 from engine.constants import PROJ_DIR, OPENAI_API_KEY, MAX_TOKENS, TEMPERATURE, NUM_COMPLETIONS
+from engine.utils.llm_cache import LLMCache, canonical_request
 try:
     from openai import OpenAI
     import openai
@@ -8,7 +9,7 @@ from typing import Optional
 from PIL import Image
 import io
 import base64
-import json
+import hashlib
 import os
 import time
 import random
@@ -25,28 +26,12 @@ MAX_TOKENS = 4000
 
 class CodeGen:
 
-    def __init__(self, model_name=MODEL_NAME, cache="cache.json"):
+    def __init__(self, model_name=MODEL_NAME, cache="cache.db"):
 
         self.cache_file = cache
         self.model_name = model_name
         self.exponential_backoff = 1
-        # Load the cache JSON file, if cache file exists. Else, cache is {}
-        if os.path.exists(self.cache_file):
-            cache = None
-            print(f'[INFO] Loading cache file from {self.cache_file}...')
-            while cache is None:
-                while os.path.exists(self.cache_file + ".tmp") or os.path.exists(self.cache_file + ".lock"):
-                    time.sleep(1)
-                try:
-                    with open(self.cache_file, "r") as f:
-                        cache = json.load(f)
-                except Exception as e:
-                    print(e)
-                    time.sleep(1)
-            print('[INFO] Loading cache done!')
-            self.cache = cache
-        else:
-            self.cache = {}
+        self.cache = LLMCache(self.cache_file)
 
         self.client = OpenAI(api_key=OPENAI_API_KEY)
 
@@ -100,21 +85,20 @@ class CodeGen:
         else:
             cache_key_base = tuple((s['role'], s['content']) for s in messages)
         # cache_key_base = codex_in if cache_key is None else cache_key
-        cache_key_list = (cache_key_base, max_tokens, temperature, stop, indented, indented_after_first_line, require)
-        if presence_penalty != 0.0:
-            cache_key_list = cache_key_list + (presence_penalty,)
-        cache_key = str(cache_key_list)
-        if cache_key in self.cache:
-            if len(self.cache[cache_key]) < num_completions:
-                num_completions -= len(self.cache[cache_key])
-                results = self.cache[cache_key]
+        request = canonical_request(provider='gpt', model=self.model_name, messages=cache_key_base, max_tokens=max_tokens,
+                                    temperature=temperature, stop=stop, indented=indented,
+                                    indented_after_first_line=indented_after_first_line, require=require,
+                                    presence_penalty=presence_penalty)
+        cache_key = hashlib.sha256(request.encode()).hexdigest()
+        results = self.cache.get(cache_key)
+        if len(results) > 0:
+            if len(results) < num_completions:
+                num_completions -= len(results)
             else:
-                cur_implementations = self.cache[cache_key].copy()
+                cur_implementations = results
                 # if "shuffle_implementations" in CONSTS and CONSTS["shuffle_implementations"]:
                 #     random.shuffle(cur_implementations)
                 return None, cur_implementations[:num_completions]
-        else:
-            results = []
 
         print(f"Calling {self.model_name} for {num_completions=}!")
         # raise Exception("Codex is not available")
@@ -144,6 +128,7 @@ class CodeGen:
                     print("Rate limit reached. Waiting before retrying...")
                     time.sleep(16 * self.exponential_backoff)
                     self.exponential_backoff *= 2
+            num_saved = len(results)
             for completion in completions:
                 result = []
                 for line_idx, line in enumerate(completion.message.content.split("\n")):
@@ -154,22 +139,8 @@ class CodeGen:
                     result += [line]
                 results.append(result)
 
-            # Save updated cache - reopen in case multiple processes running
-            # Save to a temp file first, then rename
-            # Check if a temp file exists, and if so, wait for it to be deleted
-            while os.path.exists(self.cache_file + ".tmp") or os.path.exists(self.cache_file + ".lock"):
-                time.sleep(0.1)
-            # create an empty file to indicate that we are writing to the cache
-            with open(self.cache_file + ".lock", "w") as f:
-                pass
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, "r") as f:
-                    self.cache = json.load(f)
-            self.cache[cache_key] = results
-            with open(self.cache_file + ".tmp", "w") as f:
-                json.dump(self.cache, f)
-            os.rename(self.cache_file + ".tmp", self.cache_file)
-            os.remove(self.cache_file + ".lock")
+            # Save after every API call, so that completions survive a crash in a later call
+            self.cache.append(cache_key, results[num_saved:], request=request)
             total_tokens -= num_completions * max_tokens
         return None, results
 
@@ -184,5 +155,5 @@ def setup_gpt():
         username = os.getlogin()
     except OSError:
         username = os.environ.get('USER') or os.environ.get('LOGNAME')
-    model = CodeGen(MODEL_NAME, 'cache.json' if not os.path.exists('/viscam/') else f'cache_{username}.json')
+    model = CodeGen(MODEL_NAME, 'cache.db' if not os.path.exists('/viscam/') else f'cache_{username}.db')
     return model
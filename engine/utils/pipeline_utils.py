@@ -0,0 +1,95 @@
+import json
+import queue
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Optional
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Any], Optional[Iterable[Any]]]  # yields the items passed to the next stage
+    num_workers: int = 1
+    # counters, updated by the stage's workers
+    num_in: int = 0
+    num_out: int = 0
+    num_errors: int = 0
+    busy_time: float = 0.
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def stats(self, wall_time: float) -> dict[str, Any]:
+        return {'workers': self.num_workers, 'in': self.num_in, 'out': self.num_out, 'errors': self.num_errors,
+                'busy_time': round(self.busy_time, 2), 'items_per_min': round(60 * self.num_in / max(wall_time, 1e-6), 2),
+                'utilization': round(self.busy_time / max(wall_time * self.num_workers, 1e-6), 3)}
+
+
+class Pipeline:
+    """
+    Runs items through a chain of stages, each with its own pool of worker threads, connected by bounded queues.
+
+    A stage function may yield any number of items for the next stage, e.g. one item per LLM completion. A full queue
+    blocks the upstream stage, so at most `queue_size` items wait between two stages. Exceptions are printed and
+    counted, and do not stop other items.
+    """
+
+    def __init__(self, stages: list[Stage], queue_size: int = 8):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+
+    def _work(self, index: int):
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                return
+            start = time.time()
+            outputs = []
+            try:
+                outputs = list(stage.fn(item) or [])
+            except Exception:
+                print(f'[ERROR] pipeline stage {stage.name} failed:\n{traceback.format_exc()}')
+                with stage.lock:
+                    stage.num_errors += 1
+            with stage.lock:
+                stage.num_in += 1
+                stage.num_out += len(outputs)
+                stage.busy_time += time.time() - start
+            if outbox is not None:
+                for output in outputs:
+                    outbox.put(output)
+
+    def run(self, items: Iterable[Any]) -> dict[str, dict[str, Any]]:
+        start = time.time()
+        workers = []
+        for index, stage in enumerate(self.stages):
+            threads = [threading.Thread(target=self._work, args=(index,), daemon=True, name=f'{stage.name}_{k}')
+                       for k in range(stage.num_workers)]
+            for thread in threads:
+                thread.start()
+            workers.append(threads)
+        for item in items:
+            self.queues[0].put(item)
+        # a stage is done once all of its workers have stopped; only then can the next stage be told to stop
+        for index, threads in enumerate(workers):
+            for _ in threads:
+                self.queues[index].put(_DONE)
+            for thread in threads:
+                thread.join()
+        wall_time = time.time() - start
+        return {stage.name: stage.stats(wall_time) for stage in self.stages} | {'wall_time': round(wall_time, 2)}
+
+
+def report_pipeline_stats(stats: dict[str, Any], save_path: Optional[str] = None):
+    for name, stage_stats in stats.items():
+        if isinstance(stage_stats, dict):
+            print(f'[INFO] pipeline stage {name}: {stage_stats}')
+    print(f"[INFO] pipeline wall time: {stats['wall_time']} seconds")
+    if save_path is not None:
+        with open(save_path, 'w') as f:
+            json.dump(stats, f, indent=2)
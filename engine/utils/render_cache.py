@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+
+@lru_cache(maxsize=4096)
+def _file_digest_cached(path: str, mtime_ns: int, size: int) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    # content digest, recomputed only when the file changes
+    stat = os.stat(path)
+    return _file_digest_cached(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+class RenderCache:
+    """
+    Content-addressed on-disk cache of rendered images.
+
+    Entries are stored as `cache_dir/<key[:2]>/<key>.png` and written atomically, so concurrent runs can share a cache
+    directory. Hits refresh the modification time of an entry; when the cache grows beyond `max_bytes`, the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+        self.max_bytes = max_bytes
+        self.total_bytes: Optional[int] = None  # computed lazily on the first write
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f'{key}.png'
+
+    def get(self, key: str, save_to: str) -> bool:
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, save_to)
+            os.utime(path)
+        except FileNotFoundError:  # also covers entries evicted by another process in between
+            self.stats['misses'] += 1
+            return False
+        self.stats['hits'] += 1
+        return True
+
+    def put(self, key: str, src: str):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(f'.{key}.{uuid.uuid4()}.tmp')
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, path)
+        self.stats['writes'] += 1
+        if self.total_bytes is None:
+            self.total_bytes = sum(p.stat().st_size for p in self.cache_dir.glob('*/*.png'))
+        else:
+            self.total_bytes += path.stat().st_size
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for p in self.cache_dir.glob('*/*.png'):
+            try:
+                stat = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, p))
+        entries.sort()
+        self.total_bytes = sum(size for _, size, _ in entries)
+        # evict down to 90% of the budget so that eviction does not run on every write
+        for _, size, p in entries:
+            if self.total_bytes <= self.max_bytes * .9:
+                break
+            p.unlink(missing_ok=True)
+            self.total_bytes -= size
+            self.stats['evictions'] += 1
+
+    def dump_stats(self, path: str):
+        with open(path, 'w') as f:
+            json.dump({**self.stats, 'cache_dir': self.cache_dir.as_posix(), 'max_bytes': self.max_bytes}, f, indent=2)
@@ -0,0 +1,357 @@
+import json
+import multiprocessing as mp
+import os
+import queue
+import runpy
+import select
+import signal
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+PROMPTS_DIR = (Path(__file__).parent.parent.parent / 'scripts' / 'prompts').as_posix()
+_environ_lock = threading.Lock()
+
+
+@contextmanager
+def _environ(env: dict[str, str]):
+    # spawned processes inherit `os.environ` when they start; the lock keeps concurrent starts from mixing environments
+    with _environ_lock:
+        orig_env = {k: os.environ.get(k) for k in env}
+        os.environ.update(env)
+        try:
+            yield
+        finally:
+            for k, v in orig_env.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+
+
+def _fork_supported() -> bool:
+    # CUDA and LLVM cannot be used in a child forked after the zygote initialised them, and reserve more address space
+    # than the per-job limit; workers import Mitsuba with the variant `engine.constants` picks
+    import engine.constants  # sets `MI_DEFAULT_VARIANT`
+    return hasattr(os, 'fork') and os.environ.get('MI_DEFAULT_VARIANT', 'scalar_rgb').startswith('scalar_')
+
+
+def _prewarm(engine_mode: str):
+    # import everything `impl_preset.py` / `impl_minecraft.py` needs, including the preset scenes in `mi_helper`
+    modules = ['helper', 'dsl_utils', 'engine_utils', 'impl_utils', 'engine.utils.graph_utils', 'example_postprocess']
+    if engine_mode == 'minecraft':
+        modules += ['minecraft_helper']
+    else:
+        modules += ['mi_helper', 'impl_helper', 'prompt_helper', 'impl_parse_dependency', 'imageio', 'PIL.Image']
+    for module in modules:
+        try:
+            __import__(module)
+        except Exception as e:
+            print(f'[ERROR] failed to prewarm {module}: {e}')
+    if engine_mode == 'minecraft':
+        # `minecraft_helper` loads spaCy lazily; a zygote loads it once for all of its forked jobs
+        try:
+            import minecraft_helper
+            minecraft_helper.get_nlp()
+        except Exception as e:
+            print(f'[ERROR] failed to prewarm the spaCy model: {e}')
+
+
+def _reset_state(orig_primitive_call):
+    # every job starts from an empty `dsl_utils.library`, as if `impl.py` ran in a fresh interpreter
+    import dsl_utils
+    import engine_utils
+    dsl_utils.clear_library()
+    engine_utils.inner_primitive_call = orig_primitive_call
+
+
+@contextmanager
+def _redirect_fds(out_path: str, err_path: str):
+    # redirect at the file descriptor level, so that logs from Mitsuba and other native code are captured too
+    sys.stdout.flush()
+    sys.stderr.flush()
+    orig_fds = os.dup(1), os.dup(2)
+    with open(out_path, 'w') as out_file, open(err_path, 'w') as err_file:
+        os.dup2(out_file.fileno(), 1)
+        os.dup2(err_file.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(orig_fds[0], 1)
+            os.dup2(orig_fds[1], 2)
+            os.close(orig_fds[0])
+            os.close(orig_fds[1])
+
+
+def _run_job(impl_path: str, save_dir: str) -> dict:
+    save_dir = Path(save_dir)
+    save_dir.mkdir(exist_ok=True, parents=True)
+    start = time.time()
+    status, returncode, error = 'ok', 0, None
+    orig_argv = sys.argv
+    with _redirect_fds((save_dir / 'execute_out.txt').as_posix(), (save_dir / 'execute_err.txt').as_posix()):
+        sys.argv = [impl_path]
+        try:
+            runpy.run_path(impl_path, run_name='__main__')
+        except SystemExit as e:
+            returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            status = 'ok' if returncode == 0 else 'error'
+        except BaseException:
+            error = traceback.format_exc()
+            print(error, file=sys.stderr)
+            status, returncode = 'error', 1
+        finally:
+            sys.argv = orig_argv
+    return {'status': status, 'returncode': returncode, 'error': error,
+            'time': time.time() - start, 'pid': os.getpid()}
+
+
+def _fork_job(impl_path: str, save_dir: str, orig_primitive_call, timeout: Optional[float],
+              max_memory_gb: Optional[float]) -> dict:
+    # the worker is a zygote: each job runs in a forked child that shares the pre-imported modules copy-on-write, so
+    # that nothing a program does to module globals outlives it, and a timeout or crash only kills the child
+    start = time.time()
+    sys.stdout.flush()  # or the child would print the zygote's buffered output again
+    sys.stderr.flush()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        ret = None
+        try:
+            os.setpgid(0, 0)  # its own process group, so that a timeout also kills the processes it started
+            if max_memory_gb:
+                import resource
+                limit = int(max_memory_gb * 1024 ** 3)
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+            _reset_state(orig_primitive_call)
+            ret = _run_job(impl_path, save_dir)
+        finally:
+            try:
+                os.write(write_fd, json.dumps(ret).encode())
+            finally:
+                os._exit(0)
+
+    os.close(write_fd)
+    try:
+        os.setpgid(pid, pid)  # also from the parent, in case the timeout hits before the child got to it
+    except OSError:
+        pass
+    # the pipe reaches EOF when the child exits, whether it reported a result or crashed
+    ready, _, _ = select.select([read_fd], [], [], timeout)
+    if len(ready) == 0:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    data = b''
+    while len(ready) > 0:
+        chunk = os.read(read_fd, 1 << 16)
+        if len(chunk) == 0:
+            break
+        data += chunk
+    os.close(read_fd)
+    _, wait_status = os.waitpid(pid, 0)
+
+    ret = json.loads(data) if len(data) > 0 else None
+    if ret is None:
+        if len(ready) == 0:
+            ret = {'status': 'timeout', 'returncode': -1, 'error': f'job timed out after {timeout} seconds'}
+        else:
+            # e.g. killed by the OOM killer, or a segfault in native code
+            returncode = os.waitstatus_to_exitcode(wait_status)
+            ret = {'status': 'crashed', 'returncode': returncode, 'error': f'job exited with code {returncode}'}
+        ret.update({'time': time.time() - start, 'pid': pid})
+        with open(Path(save_dir) / 'execute_err.txt', 'a') as f:
+            f.write(f"\n[ERROR] {ret['error']}\n")
+    return ret
+
+
+def _worker_main(conn, engine_mode: str, env: dict[str, str], fork: bool = False, timeout: Optional[float] = None,
+                 max_memory_gb: Optional[float] = None):
+    # `env` is already set when the process starts, since a spawned process re-imports the parent's main module (and
+    # with it, possibly `engine.constants`) before it runs this
+    os.environ.update(env)
+    sys.path.insert(0, PROMPTS_DIR)
+    _prewarm(engine_mode)
+    import engine_utils
+    orig_primitive_call = engine_utils.inner_primitive_call
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        if fork:
+            Path(job['save_dir']).mkdir(exist_ok=True, parents=True)
+            conn.send(_fork_job(**job, orig_primitive_call=orig_primitive_call, timeout=timeout,
+                                max_memory_gb=max_memory_gb))
+            continue
+        _reset_state(orig_primitive_call)
+        conn.send(_run_job(**job))
+        _reset_state(orig_primitive_call)
+
+
+class _Worker:
+    def __init__(self, ctx, engine_mode: str, env: dict[str, str], **options):
+        self.ctx = ctx
+        self.engine_mode = engine_mode
+        self.env = env
+        self.options = options
+        self.start()
+
+    def start(self):
+        self.conn, child_conn = self.ctx.Pipe()
+        self.process = self.ctx.Process(target=_worker_main, args=(child_conn, self.engine_mode, self.env),
+                                        kwargs=self.options, daemon=True)
+        with _environ(self.env):
+            self.process.start()
+        child_conn.close()
+
+    def restart(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+        self.start()
+
+    def run(self, job: dict, timeout: Optional[float]) -> dict:
+        start = time.time()
+        try:
+            self.conn.send(job)
+            # `poll` also returns when the worker dies and the pipe is closed
+            ready = self.conn.poll(timeout)
+            ret = self.conn.recv() if ready else None
+        except (EOFError, OSError):
+            ready, ret = True, None
+        if ret is not None:
+            return ret
+        self.process.join(timeout=1)
+        if ready:
+            ret = {'status': 'crashed', 'returncode': self.process.exitcode,
+                   'error': f'worker exited with code {self.process.exitcode}'}
+        else:
+            ret = {'status': 'timeout', 'returncode': -1, 'error': f'job timed out after {timeout} seconds'}
+        ret.update({'time': time.time() - start, 'pid': self.process.pid})
+        with open(Path(job['save_dir']) / 'execute_err.txt', 'a') as f:
+            f.write(f"\n[ERROR] {ret['error']}\n")
+        self.restart()
+        return ret
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class RenderPool:
+    """
+    Long-lived pool of pre-warmed worker processes that execute `impl.py` files.
+
+    Workers are spawned lazily per engine mode, since `engine.constants.ENGINE_MODE` is fixed at import time. Each
+    job runs with a fresh `dsl_utils.library` and writes `execute_out.txt` and `execute_err.txt` to its output
+    directory, like `execute_utils.execute_command`. A worker that crashes or times out is replaced without affecting
+    the other workers.
+
+    With `fork` (POSIX and scalar Mitsuba variants only), workers are zygotes that run each job in a forked child,
+    with a wall-clock `timeout` and an address space limit of `max_memory_gb` per job.
+    """
+
+    def __init__(self, num_workers: int = 1, timeout: Optional[float] = None, debug: bool = False, fork: bool = False,
+                 max_memory_gb: Optional[float] = None):
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.debug = debug
+        self.fork = fork and _fork_supported()
+        if fork and not self.fork:
+            print(f"[WARNING] render pool cannot fork with Mitsuba variant {os.environ.get('MI_DEFAULT_VARIANT')}, "
+                  f"running jobs in the workers instead")
+        self.max_memory_gb = max_memory_gb
+        self.ctx = mp.get_context('spawn')
+        self.queues: dict[str, queue.Queue] = {}
+        self.threads: list[threading.Thread] = []
+        self.lock = threading.Lock()
+
+    def _serve(self, jobs: queue.Queue, engine_mode: str):
+        env = {'ENGINE_MODE': engine_mode, 'DEBUG': '1' if self.debug else '0'}
+        if self.fork:
+            worker = _Worker(self.ctx, engine_mode, env=env, fork=True, timeout=self.timeout,
+                             max_memory_gb=self.max_memory_gb)
+            # the zygote enforces the timeout; this one only catches a zygote that stopped responding
+            timeout = None if self.timeout is None else self.timeout + 60
+        else:
+            worker = _Worker(self.ctx, engine_mode, env=env)
+            timeout = self.timeout
+        while True:
+            item = jobs.get()
+            if item is None:
+                break
+            job, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(worker.run(job, timeout=timeout))
+            except Exception as e:
+                future.set_exception(e)
+        worker.close()
+
+    def submit(self, impl_path: str, engine_mode: str, save_dir: str) -> Future:
+        with self.lock:
+            if engine_mode not in self.queues:
+                self.queues[engine_mode] = queue.Queue()
+                for _ in range(self.num_workers):
+                    thread = threading.Thread(target=self._serve, args=(self.queues[engine_mode], engine_mode), daemon=True)
+                    thread.start()
+                    self.threads.append(thread)
+        future = Future()
+        self.queues[engine_mode].put(({'impl_path': impl_path, 'save_dir': save_dir}, future))
+        return future
+
+    def run(self, impl_path: str, engine_mode: str, save_dir: str) -> dict:
+        print(f'[INFO] Executing {impl_path} with {engine_mode=} in render pool')
+        print(f'[INFO] Outputs will be saved to {Path(save_dir).resolve().as_posix()}')
+        ret = self.submit(impl_path, engine_mode, save_dir).result()
+        with open(Path(save_dir) / 'status.json', 'w') as f:
+            json.dump(ret, f)
+        print(f"[INFO] {ret['status']=} {ret['returncode']=} {ret['time']=:.2f}")
+        return ret
+
+    def shutdown(self):
+        with self.lock:
+            for jobs in self.queues.values():
+                for _ in range(self.num_workers):
+                    jobs.put(None)
+            self.queues.clear()
+        for thread in self.threads:
+            thread.join()
+        self.threads.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+
+_render_pool: Optional[RenderPool] = None
+_render_pool_lock = threading.Lock()
+
+
+def setup_render_pool(num_workers: int, debug: bool = False, **options) -> RenderPool:
+    global _render_pool
+    with _render_pool_lock:  # callers may be threads, e.g. concurrent experts
+        if _render_pool is None:
+            _render_pool = RenderPool(num_workers=num_workers, debug=debug, **options)
+    return _render_pool
@@ -0,0 +1,94 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import mitsuba as mi
+mi.set_variant('scalar_rgb')
+from engine.utils.bbox_utils import compute_aabbs, bbox_from_corners
+from engine.utils.mitsuba_utils import compute_bbox, compute_bboxes
+
+
+def random_rigid_transform(rng: np.random.Generator, uniform_scale: bool) -> np.ndarray:
+    q, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+    scale = rng.uniform(.2, 3) * np.ones(3) if uniform_scale else rng.uniform(.2, 3, size=3)
+    ret = np.eye(4)
+    ret[:3, :3] = q @ np.diag(scale)
+    ret[:3, 3] = rng.uniform(-5, 5, size=3)
+    return ret
+
+
+class TestBBoxUtils(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def random_shape(self, shape_type: str) -> dict:
+        if shape_type == 'cube':
+            return {'type': 'cube', 'to_world': random_rigid_transform(self.rng, uniform_scale=False)}
+        if shape_type == 'sphere':  # Mitsuba spheres only support uniform scaling
+            return {'type': 'sphere', 'to_world': random_rigid_transform(self.rng, uniform_scale=True)}
+        if shape_type == 'cylinder':
+            return {'type': 'cylinder', 'to_world': random_rigid_transform(self.rng, uniform_scale=True),
+                    'p0': self.rng.uniform(-1, 1, size=3), 'p1': self.rng.uniform(-1, 1, size=3),
+                    'radius': self.rng.uniform(.05, .5)}
+        fd, filename = tempfile.mkstemp(suffix='.txt', dir=self.tmp_dir.name)
+        with os.fdopen(fd, 'w') as f:
+            for _ in range(self.rng.integers(4, 8)):  # B-splines need at least four control points
+                x, y, z = self.rng.uniform(-1, 1, size=3)
+                f.write(f'{x} {y} {z} {self.rng.uniform(.01, .2)}\n')
+        return {'type': shape_type, 'filename': filename, 'to_world': random_rigid_transform(self.rng, uniform_scale=True)}
+
+    def to_mitsuba(self, s: dict) -> dict:
+        s = {k: (mi.ScalarTransform4f(v) if k == 'to_world' else v) for k, v in s.items()}
+        if s['type'] == 'cylinder':
+            s['p0'] = mi.ScalarPoint3f(*s['p0'])
+            s['p1'] = mi.ScalarPoint3f(*s['p1'])
+        return s
+
+    def assert_matches_mitsuba(self, shape: list[dict]):
+        box_min, box_max, analytic = compute_aabbs([s['type'] for s in shape], np.stack([s['to_world'] for s in shape]), shape)
+        self.assertTrue(analytic.all())
+        scene_dict = {'type': 'scene', **{f'{i:03d}': self.to_mitsuba(s) for i, s in enumerate(shape)}}
+        for lo, hi, box in zip(box_min, box_max, compute_bboxes(scene_dict)):
+            np.testing.assert_allclose(lo, box.min, rtol=1e-4, atol=1e-4)
+            np.testing.assert_allclose(hi, box.max, rtol=1e-4, atol=1e-4)
+        box = compute_bbox(scene_dict)
+        np.testing.assert_allclose(bbox_from_corners(box_min.min(axis=0), box_max.max(axis=0)).sizes, box.sizes, rtol=1e-4, atol=1e-4)
+
+    def test_cube(self):
+        self.assert_matches_mitsuba([self.random_shape('cube') for _ in range(32)])
+
+    def test_sphere(self):
+        self.assert_matches_mitsuba([self.random_shape('sphere') for _ in range(32)])
+
+    def test_non_uniform_sphere(self):
+        # Mitsuba renders a sphere of radius |to_world[:3, 0]| rather than an ellipsoid
+        shape = [{'type': 'sphere', 'to_world': np.diag([1., 3., 1., 1.])}]
+        shape += [{'type': 'sphere', 'to_world': random_rigid_transform(self.rng, uniform_scale=False)} for _ in range(8)]
+        box_min, box_max, _ = compute_aabbs(['sphere'], shape[0]['to_world'][None], [{}])
+        np.testing.assert_allclose(box_min[0], -np.ones(3))
+        np.testing.assert_allclose(box_max[0], np.ones(3))
+        self.assert_matches_mitsuba(shape)
+
+    def test_cylinder(self):
+        self.assert_matches_mitsuba([self.random_shape('cylinder') for _ in range(32)])
+
+    def test_curves(self):
+        self.assert_matches_mitsuba([self.random_shape(t) for t in ['linearcurve', 'bsplinecurve'] * 8])
+
+    def test_mixed(self):
+        types = ['cube', 'sphere', 'cylinder', 'linearcurve', 'bsplinecurve']
+        self.assert_matches_mitsuba([self.random_shape(types[i]) for i in self.rng.integers(0, len(types), size=64)])
+
+    def test_mesh_is_not_analytic(self):
+        box_min, box_max, analytic = compute_aabbs(['cube', 'ply'], np.stack([np.eye(4)] * 2), [{}, {'filename': 'mesh.ply'}])
+        np.testing.assert_array_equal(analytic, [True, False])
+        np.testing.assert_allclose(box_min[0], -np.ones(3))
+        self.assertTrue(np.isnan(box_min[1]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
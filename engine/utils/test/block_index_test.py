@@ -0,0 +1,156 @@
+import unittest
+import difflib
+import importlib.util
+import runpy
+import tempfile
+from pathlib import Path
+import numpy as np
+from engine.utils.block_index import BlockIndex, BlockAliasStore, alias_version
+
+VALID_BLOCKS = runpy.run_path((Path(__file__).parents[3] / 'scripts' / 'prompts' / 'minecraft_types.py').as_posix())['valid_blocks']
+
+# misspellings and paraphrases seen in generated programs
+REGRESSION_QUERIES = [
+    'minecraft:oak_plank', 'minecraft:stone_brick', 'minecraft:cobble_stone', 'minecraft:redstone_lamps',
+    'minecraft:glass_pane_block', 'minecraft:birch_wood_planks', 'minecraft:grass', 'minecraft:dirt_block',
+    'minecraft:white_wool_carpet', 'minecraft:torchh', 'minecraft:lantern_block', 'minecraft:watter',
+    'minecraft:spruce_leaf', 'minecraft:brick_wall_block', 'minecraft:quartz pillar', 'minecraft:wooden_door',
+    'minecraft:stone_slabs', 'minecraft:dark_oak_wood_stairs', 'minecraft:light_blue_glass', 'minecraft:gold',
+    'minecraft:iron_bar', 'minecraft:flower_pot_with_rose', 'minecraft:seaLantern', 'minecraft:',
+    'minecraft:log', 'minecraft:wood', 'minecraft:leaves', 'minecraft:planks', 'stone', 'glowstone_block',
+]
+
+
+def reference_closest_match(query, valid_blocks, nlp, char_weight=0.6, sem_weight=0.4):
+    # the per-block loop `minecraft_helper.find_closest_match` used before `BlockIndex`
+    if query in valid_blocks:
+        return query
+    parse = lambda s: s[len('minecraft:'):].replace('_', ' ')
+    query_doc = nlp(parse(query).replace('_', ' '))
+    max_similarity = -1
+    closest_match = None
+    for block in valid_blocks:
+        block_doc = nlp(parse(block))
+        char_sim = difflib.SequenceMatcher(None, query, block).ratio()
+        sem_sim = query_doc.similarity(block_doc)
+        combined_sim = (char_weight * char_sim) + (sem_weight * sem_sim)
+        if combined_sim > max_similarity:
+            max_similarity = combined_sim
+            closest_match = block
+    return closest_match
+
+
+def perturb(rng: np.random.Generator, name: str) -> str:
+    chars = list(name)
+    for _ in range(rng.integers(1, 4)):
+        i = rng.integers(len('minecraft:'), len(chars))
+        op = rng.integers(0, 3)
+        if op == 0 and len(chars) > len('minecraft:') + 1:
+            del chars[i]
+        elif op == 1:
+            chars.insert(i, 'abcdefghijklmnopqrstuvwxyz_'[rng.integers(0, 27)])
+        else:
+            chars[i] = 'abcdefghijklmnopqrstuvwxyz_'[rng.integers(0, 27)]
+    return ''.join(chars)
+
+
+@unittest.skipIf(importlib.util.find_spec('spacy') is None, 'spaCy is not installed')
+class TestBlockIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import spacy
+        # a blank pipeline with random word vectors, so that the test does not depend on a downloaded model;
+        # every fifth word is left out of the vocabulary to exercise OOV tokens and zero vectors
+        cls.nlp = spacy.blank('en')
+        rng = np.random.default_rng(0)
+        words = sorted({w for name in VALID_BLOCKS for w in name[len('minecraft:'):].split('_')})
+        for word in words[::5]:
+            words.remove(word)
+        for word in words + ['wooden', 'rose', 'bar', 'wood']:
+            cls.nlp.vocab.set_vector(word, rng.normal(size=(16,)).astype(np.float32))
+        cls.index = BlockIndex.build(VALID_BLOCKS, cls.nlp)
+
+    def assert_matches_reference(self, queries):
+        for query in queries:
+            with self.subTest(query=query):
+                if self.index.lookup(query) not in (None, query):
+                    continue  # normalized exact matches intentionally differ from the reference
+                self.assertEqual(self.index.resolve(query, self.nlp), reference_closest_match(query, VALID_BLOCKS, self.nlp))
+
+    def test_regression_set(self):
+        self.assert_matches_reference(REGRESSION_QUERIES)
+
+    def test_random_misspellings(self):
+        rng = np.random.default_rng(0)
+        self.assert_matches_reference([perturb(rng, VALID_BLOCKS[i]) for i in rng.integers(0, len(VALID_BLOCKS), size=64)])
+
+    def test_weights(self):
+        for query in REGRESSION_QUERIES[:8]:
+            self.assertEqual(self.index.resolve(query, self.nlp, char_weight=.2, sem_weight=.8),
+                             reference_closest_match(query, VALID_BLOCKS, self.nlp, char_weight=.2, sem_weight=.8))
+
+    def test_lookup(self):
+        self.assertEqual(self.index.lookup('minecraft:oak_planks'), 'minecraft:oak_planks')
+        self.assertEqual(self.index.lookup('Oak Planks'), 'minecraft:oak_planks')
+        self.assertEqual(self.index.lookup('minecraft:Oak-Planks'), 'minecraft:oak_planks')
+        self.assertIsNone(self.index.lookup('minecraft:oak_plank'))
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index = BlockIndex.load_or_build(VALID_BLOCKS, self.nlp, cache_dir=tmp_dir)
+            self.assertEqual(len(list(Path(tmp_dir).glob('*.npz'))), 1)
+            loaded = BlockIndex.load_or_build(VALID_BLOCKS, self.nlp, cache_dir=tmp_dir)
+        self.assertEqual(loaded.names, index.names)
+        self.assertEqual(loaded.tokens, index.tokens)
+        np.testing.assert_array_equal(loaded.vectors, index.vectors)
+        for query in REGRESSION_QUERIES[:8]:
+            self.assertEqual(loaded.resolve(query, self.nlp), index.resolve(query, self.nlp))
+
+    def test_score(self):
+        for query in REGRESSION_QUERIES[:8]:
+            match, score = self.index.resolve_with_score(query, self.nlp)
+            self.assertEqual(match, self.index.resolve(query, self.nlp))
+            self.assertAlmostEqual(score, .6 * difflib.SequenceMatcher(None, query, match).ratio() +
+                                   .4 * self.nlp(query[len('minecraft:'):].replace('_', ' ')).similarity(
+                                       self.nlp(match[len('minecraft:'):].replace('_', ' '))), places=5)
+        self.assertEqual(self.index.resolve_with_score('Oak Planks', self.nlp), ('minecraft:oak_planks', 1.))
+
+
+class TestBlockAliasStore(unittest.TestCase):
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = (Path(tmp_dir) / 'aliases.db').as_posix()
+            version = alias_version(VALID_BLOCKS, 'en_core_web_md', .6, .4)
+            store = BlockAliasStore(path, version)
+            self.assertIsNone(store.get('minecraft:oak_plank'))
+            store.put('minecraft:oak_plank', 'minecraft:oak_planks', .9)
+            store.close()
+
+            store = BlockAliasStore(path, version)  # e.g. the next run
+            self.assertEqual(store.get('minecraft:oak_plank'), ('minecraft:oak_planks', .9))
+            self.assertEqual(len(store), 1)
+            store.close()
+
+            self.assertNotEqual(alias_version(VALID_BLOCKS, 'en_core_web_md', .2, .8), version)
+            new_version = alias_version(VALID_BLOCKS[:-1], 'en_core_web_md', .6, .4)
+            self.assertNotEqual(new_version, version)
+            store = BlockAliasStore(path, new_version)  # `valid_blocks` changed, e.g. in a concurrent run
+            self.assertIsNone(store.get('minecraft:oak_plank'))
+            store.put('minecraft:oak_plank', 'minecraft:oak_log', .5)
+            store.close()
+            store = BlockAliasStore(path, version)  # versions in use keep their rows
+            self.assertEqual(store.get('minecraft:oak_plank'), ('minecraft:oak_planks', .9))
+            store.close()
+
+            store = BlockAliasStore(path, new_version)
+            self.assertEqual(store.prune(max_age_days=1), 0)
+            self.assertEqual(store.prune(max_age_days=0), 1)  # as if `version` was last used before now
+            self.assertEqual(store.get('minecraft:oak_plank'), ('minecraft:oak_log', .5))
+            store.close()
+            store = BlockAliasStore(path, version)
+            self.assertEqual(len(store), 0)
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from engine.utils.block_scene import write_block_scene, read_block_scene, is_block_scene, SUFFIX
+from engine.utils.voxel_grid import VoxelGrid
+
+PALETTE = [None] + [{'type': f'minecraft:block_{i}', 'properties': {}, 'stack': ['scene']} for i in range(5)]
+
+
+def random_animation(rng: np.random.Generator, shape, num_frames: int, changes: int) -> list[np.ndarray]:
+    # a random first frame, then a few boxes changing per frame
+    volume = rng.integers(0, len(PALETTE), size=shape).astype(np.uint32)
+    volume[rng.random(shape) < .5] = 0
+    frames = [volume.copy()]
+    for _ in range(num_frames - 1):
+        for _ in range(changes):
+            start = rng.integers(0, shape)
+            end = start + rng.integers(1, 4, size=3)
+            volume[start[0]:end[0], start[1]:end[1], start[2]:end[2]] = rng.integers(0, len(PALETTE))
+        frames.append(volume.copy())
+    return frames
+
+
+def box_scene(rng: np.random.Generator, shape, num_frames: int, num_boxes: int):
+    # terrain layers and random boxes, then a box moving through the scene, as grids
+    grid = VoxelGrid()
+    for value, (y0, y1) in enumerate([(0, 4), (4, 7), (7, 8)], start=1):
+        grid.fill_box((0, y0, 0), (shape[0], y1, shape[2]), value)
+    for _ in range(num_boxes):
+        start = rng.integers(0, shape)
+        grid.fill_box(start, np.minimum(start + rng.integers(1, 12, size=3), shape), int(rng.integers(1, len(PALETTE))),
+                      hollow=bool(rng.random() < .5))
+    grids = []
+    for frame in range(num_frames):
+        moving = VoxelGrid()
+        moving.palette, moving.palette_index = grid.palette, grid.palette_index
+        moving.chunks = {key: chunk.copy() for key, chunk in grid.chunks.items()}
+        x = frame % (shape[0] - 4)
+        moving.fill_box((x, 8, 0), (x + 4, 12, 4), 4)
+        grids.append(moving)
+    return grids
+
+
+def json_frames(grids: list[VoxelGrid]) -> list[list[dict]]:
+    # the boxes `minecraft_helper` writes to JSON for the same frames
+    json_frames = []
+    for grid in grids:
+        starts, ends, values = grid.boxes()
+        json_frames.append([{'start': start, 'end': end, 'fill': True, **PALETTE[value]}
+                            for start, end, value in zip(starts.tolist(), ends.tolist(), values.tolist())])
+    return json_frames
+
+
+class TestBlockScene(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / f'scene{SUFFIX}'
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        rng = np.random.default_rng(0)
+        for shape, num_frames in [((7, 5, 3), 1), ((20, 11, 13), 6), ((1, 1, 1), 3)]:
+            with self.subTest(shape=shape, num_frames=num_frames):
+                frames = random_animation(rng, shape, num_frames, changes=3)
+                header = write_block_scene(self.path, frames, PALETTE, block_counts={'minecraft:block_0': 1})
+                self.assertTrue(is_block_scene(self.path))
+                read_header, read_frames = read_block_scene(self.path)
+                self.assertEqual(read_header, json.loads(json.dumps(header)))
+                self.assertEqual(read_header['block_counts'], {'minecraft:block_0': 1})
+                self.assertEqual((read_header['width'], read_header['height'], read_header['depth']), shape)
+                self.assertEqual(len(read_frames), num_frames)
+                for frame, read_frame in zip(frames, read_frames):
+                    np.testing.assert_array_equal(read_frame, frame)
+
+    def test_delta(self):
+        # unchanged frames only cost their run count
+        frames = random_animation(np.random.default_rng(0), (32, 32, 32), 1, changes=0)
+        write_block_scene(self.path, frames, PALETTE)
+        size = os.path.getsize(self.path)
+        write_block_scene(self.path, frames * 50, PALETTE)
+        self.assertLess(os.path.getsize(self.path), size + 1024)
+        np.testing.assert_array_equal(read_block_scene(self.path)[1][-1], frames[0])
+
+    def test_empty(self):
+        write_block_scene(self.path, [np.zeros((0, 0, 0), dtype=np.uint32)], PALETTE)
+        header, frames = read_block_scene(self.path)
+        self.assertEqual((header['num_frames'], frames[0].shape), (1, (0, 0, 0)))
+        json_path = Path(self.tmp_dir.name) / 'scene.json'
+        json_path.write_text('{}')
+        self.assertFalse(is_block_scene(json_path))
+        with self.assertRaises(ValueError):
+            read_block_scene(json_path)
+
+
+def benchmark(shape=(128, 64, 128), num_frames=50, num_boxes=300):
+    # python -m engine.utils.test.block_scene_test --benchmark
+    rng = np.random.default_rng(0)
+    print(f'{"frames":>7} {"json (KiB)":>11} {"json load (s)":>14} {"binary (KiB)":>13} {"binary load (s)":>16}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        grids = box_scene(rng, shape, num_frames, num_boxes)
+        for frames in [1, num_frames]:
+            json_path, binary_path = Path(tmp_dir) / 'scene.json', Path(tmp_dir) / f'scene{SUFFIX}'
+            with open(json_path, 'w') as f:
+                json.dump({'width': shape[0], 'height': shape[1], 'depth': shape[2],
+                           'frames': json_frames(grids[:frames])}, f, indent=4)
+            write_block_scene(binary_path, (grid.dense((0, 0, 0), shape) for grid in grids[:frames]), PALETTE)
+            start = time.perf_counter()
+            with open(json_path, 'r') as f:
+                json.load(f)
+            json_time = time.perf_counter() - start
+            start = time.perf_counter()
+            read_block_scene(binary_path)
+            binary_time = time.perf_counter() - start
+            print(f'{frames:>7} {os.path.getsize(json_path) / 1024:>11.1f} {json_time:>14.4f} '
+                  f'{os.path.getsize(binary_path) / 1024:>13.1f} {binary_time:>16.4f}')
+
+
+if __name__ == '__main__':
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        unittest.main()
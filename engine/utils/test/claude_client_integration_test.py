@@ -1,17 +1,17 @@
 import unittest
 from engine.utils.claude_client import ClaudeClient  
+from engine.utils.llm_cache import LLMCache
 import os
 import tempfile
 import shutil
 import time
-import json
 import threading
 
 
 class TestClaudeClient(unittest.TestCase):
     current_script = os.path.abspath(__file__)
     parent_dir = os.path.dirname(current_script)
-    _test_cache_path = parent_dir + '/test_cache.json' 
+    _test_cache_path = parent_dir + '/test_cache.db' 
 
     def setUp(self):
         """Set up a ClaudeClient with a temporary cache file."""
@@ -19,8 +19,10 @@ class TestClaudeClient(unittest.TestCase):
 
     def tearDown(self):
         """Clean up by deleting the cache file after each test."""
-        if os.path.exists(self._test_cache_path):
-            os.remove(self._test_cache_path)
+        self.generator.cache.close()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(self._test_cache_path + suffix):
+                os.remove(self._test_cache_path + suffix)
     
     def test_generate_basic_query(self):
         """Test a basic generation query to the API."""
@@ -31,15 +33,14 @@ class TestClaudeClient(unittest.TestCase):
         self.assertTrue(os.path.exists(self.generator.cache_file))
 
         # Confirm that it is in the cache
-        with open(self.generator.cache_file, "r") as f:
-            cache = json.load(f)
-            self.assertTrue(cache_key in cache)
-            self.assertTrue("Paris" in cache[cache_key][0])
+        cache = LLMCache(self.generator.cache_file)
+        self.assertTrue(cache_key in cache)
+        self.assertTrue("Paris" in cache[cache_key][0])
 
     def test_concurrent_cache_updates(self):
-        """Test concurrent updates to ensure .tmp and .lock files are managed correctly."""
+        """Test concurrent updates to ensure no completion is lost."""
         def update_cache():
-            self.generator.update_cache("test_key", {"data": "value"})
+            LLMCache(self.generator.cache_file).append("test_key", [{"data": "value"}])
 
         # Start multiple threads to update the cache simultaneously
         threads = [threading.Thread(target=update_cache) for _ in range(2)]
@@ -48,9 +49,7 @@ class TestClaudeClient(unittest.TestCase):
         for thread in threads:
             thread.join()
 
-        # Check for presence of .lock or .tmp files indicating incomplete or overlapping operations
-        self.assertFalse(os.path.exists(self.generator.cache_file + ".lock"), ".lock file should not exist after operations complete.")
-        self.assertFalse(os.path.exists(self.generator.cache_file + ".tmp"), ".tmp file should not exist after operations complete.")
+        self.assertEqual(self.generator.cache["test_key"], [{"data": "value"}] * 2)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'scripts', 'prompts'))
+import dsl_utils
+from dsl_utils import register, library_call, set_memoize_enabled, get_memo_stats
+from shape_utils import transform_shape, concat_shapes
+
+
+def box(x: float) -> list[dict]:
+    to_world = np.eye(4)
+    to_world[0, 3] = x
+    return [{'type': 'cube', 'to_world': to_world, 'info': {'stack': []}}]
+
+
+def define_program():
+    @register()
+    def random_leaf() -> list[dict]:
+        return box(np.random.uniform())
+
+    @register()
+    def fixed_leaf(x: float) -> list[dict]:
+        return box(x)
+
+    @register()
+    def mirrored(x: float) -> list[dict]:
+        # both primitives share the `info` of the leaf, so `scene` extends its stack twice
+        shape = library_call('fixed_leaf', x=x)
+        return concat_shapes(shape, transform_shape(shape, np.diag([-1, 1, 1, 1])))
+
+    @register()
+    def scene() -> list[dict]:
+        return concat_shapes(*[library_call('random_leaf') for _ in range(4)],
+                             *[library_call('mirrored', x=x) for x in [1, 2, 1, 1]])
+
+
+def run(memoize: bool) -> tuple[list[tuple], dict]:
+    # the primitives with their call ids renumbered in order of appearance
+    dsl_utils.clear_library()
+    define_program()
+    np.random.seed(0)
+    with set_memoize_enabled(memoize):
+        shape = library_call('scene')
+        stats = get_memo_stats()
+    call_ids = {}
+    return [(s['to_world'][0, 3], tuple((name, call_ids.setdefault(call_id, len(call_ids)))
+                                        for name, call_id in s['info']['stack'])) for s in shape], stats
+
+
+class TestMemoize(unittest.TestCase):
+    def tearDown(self):
+        dsl_utils.clear_library()
+
+    def test_same_as_without_memoization(self):
+        expected, _ = run(memoize=False)
+        actual, stats = run(memoize=True)
+        self.assertEqual(len(set(x for x, _ in expected[:4])), 4)  # random leaves are drawn anew on every call
+        self.assertEqual(actual, expected)
+        self.assertEqual(stats['hits'], 2)  # `mirrored(x=1)` twice; random calls and their callers are not cached
+
+
+if __name__ == '__main__':
+    unittest.main()
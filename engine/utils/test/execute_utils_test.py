@@ -0,0 +1,70 @@
+import unittest
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from engine.utils.execute_utils import execute_command, load_exit_record
+
+
+class TestExecuteCommand(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.save_dir = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read(self, name: str) -> str:
+        with open(Path(self.save_dir) / name, 'r') as f:
+            return f.read()
+
+    def test_ok(self):
+        self.assertEqual(execute_command('echo out; echo err >&2', self.save_dir), 0)
+        self.assertEqual(self.read('execute_out.txt'), 'out\n')
+        self.assertEqual(self.read('execute_err.txt'), 'err\n')
+        record = load_exit_record(self.save_dir)
+        self.assertEqual(record['status'], 'ok')
+
+    def test_error(self):
+        self.assertEqual(execute_command('exit 3', self.save_dir), 3)
+        self.assertEqual(load_exit_record(self.save_dir)['status'], 'error')
+        self.assertEqual(execute_command('kill -SEGV $$', self.save_dir), -11)
+        self.assertEqual(load_exit_record(self.save_dir)['status'], 'crashed')
+
+    def test_timeout_kills_group(self):
+        done_path = Path(self.save_dir) / 'done.txt'
+        start = time.time()
+        # the background child keeps the pipes open, so the whole process group has to be killed
+        returncode = execute_command(f'(sleep 2; touch {done_path}) & sleep 100', self.save_dir, timeout=1)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(returncode, -1)
+        self.assertEqual(load_exit_record(self.save_dir)['status'], 'timeout')
+        self.assertIn('timed out', self.read('execute_err.txt'))
+        time.sleep(1.5)
+        self.assertFalse(done_path.exists())
+
+    def test_timeout_closed_pipes(self):
+        start = time.time()
+        self.assertEqual(execute_command('exec > /dev/null 2>&1; sleep 100', self.save_dir, timeout=1), -1)
+        self.assertLess(time.time() - start, 5)
+
+    def test_log_cap(self):
+        command = f'{sys.executable} -c "print(\'x\' * 3 * 1024 ** 2)"'
+        self.assertEqual(execute_command(command, self.save_dir, max_log_mb=1), 0)
+        self.assertLess(os.path.getsize(Path(self.save_dir) / 'execute_out.txt'), 1024 ** 2 + 200)
+        self.assertIn('truncated', self.read('execute_out.txt'))
+        self.assertGreater(load_exit_record(self.save_dir)['truncated_bytes']['stdout'], 2 * 1024 ** 2)
+
+    @unittest.skipUnless(os.path.exists('/proc/self/stat'), 'needs /proc')
+    def test_memory_limit(self):
+        command = f'{sys.executable} -c "import time; x = bytearray(512 * 1024 ** 2); time.sleep(100)"'
+        self.assertEqual(execute_command(command, self.save_dir, timeout=30, max_rss_gb=.25), -1)
+        record = load_exit_record(self.save_dir)
+        self.assertEqual(record['status'], 'memory')
+        self.assertGreater(record['peak_rss_mb'], 256)
+        self.assertLess(record['time'], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import unittest
+import random
+import sys
+import time
+from engine.utils.graph_utils import strongly_connected_components, get_root, calculate_node_depths, get_ancestors
+
+
+class Node:
+    def __init__(self, name):
+        self.name = name
+        self.children = set()
+        self.parents = set()
+
+    def __repr__(self):
+        return f'Node({self.name})'
+
+
+def random_graph(rng: random.Random, num_nodes: int, num_edges: int, rooted: bool = False) -> dict[str, Node]:
+    defined_fns = {f'fn_{i}': Node(f'fn_{i}') for i in rng.sample(range(num_nodes), num_nodes)}
+    nodes = list(defined_fns.values())
+
+    def connect(parent, child):
+        parent.children.add(child)
+        child.parents.add(parent)
+
+    for _ in range(num_edges):
+        connect(rng.choice(nodes), rng.choice(nodes))
+    if rooted:
+        for node in nodes[1:]:
+            connect(nodes[0], node)
+    return defined_fns
+
+
+def reference_strongly_connected_components(defined_fns):
+    # the all-pairs fixpoint `graph_utils` used before Tarjan
+    reachable = {fn_name: {fn_name} for fn_name in defined_fns}
+    changed = True
+    while changed:
+        changed = False
+        for fn_name, fns_reachable in reachable.items():
+            for fn_reachable_name in fns_reachable.copy():
+                for child in defined_fns[fn_reachable_name].children:
+                    initial_len = len(reachable[fn_name])
+                    reachable[fn_name].add(child.name)
+                    if len(reachable[fn_name]) > initial_len:
+                        changed = True
+                for fn_reachable_name_2 in fns_reachable.copy():
+                    initial_len = len(reachable[fn_name])
+                    reachable[fn_name].update(reachable[fn_reachable_name_2])
+                    if len(reachable[fn_name]) > initial_len:
+                        changed = True
+
+    sccs = []
+    remaining_nodes = set(defined_fns)
+    for fn_name in defined_fns.keys():
+        if fn_name not in remaining_nodes:
+            continue
+        remaining_nodes.remove(fn_name)
+        scc = {fn_name}
+        for child_name in reachable[fn_name]:
+            if fn_name in reachable[child_name] and child_name in remaining_nodes:
+                scc.add(child_name)
+                remaining_nodes.remove(child_name)
+        sccs.append(scc)
+
+    scc_edges = []
+    for scc_1_idx, scc_1 in enumerate(sccs):
+        scc_edges.append([scc_2_idx for scc_2_idx, scc_2 in enumerate(sccs)
+                          if scc_1_idx != scc_2_idx and list(scc_2)[0] in reachable[list(scc_1)[0]]])
+    return sccs, scc_edges
+
+
+def reference_root_candidates(defined_fns) -> set[str]:
+    # the old `get_root` popped an arbitrary element of this set
+    shared_ancestors = None
+    for fn in defined_fns.values():
+        anc = get_ancestors(fn)
+        if shared_ancestors is None:
+            shared_ancestors = set(anc) | {fn.name}
+        else:
+            shared_ancestors.intersection_update(anc)
+    return shared_ancestors & set(defined_fns.keys())
+
+
+def reference_node_depths(defined_fns, root):
+    sccs, _ = reference_strongly_connected_components(defined_fns)
+    scc_map = {node: idx for idx, scc in enumerate(sccs) for node in scc}
+    reduced_graph = {i: set() for i in range(len(sccs))}
+    for node, fn in defined_fns.items():
+        for child in fn.children:
+            if scc_map[node] != scc_map[child.name]:
+                reduced_graph[scc_map[node]].add(scc_map[child.name])
+    depths = [-1] * len(sccs)
+
+    def dfs(_scc_index, current_depth):
+        if depths[_scc_index] < current_depth:
+            depths[_scc_index] = current_depth
+            for neighbor in reduced_graph[_scc_index]:
+                dfs(neighbor, current_depth + 1)
+
+    for scc_index in reduced_graph:
+        if root in sccs[scc_index]:
+            dfs(scc_index, 0)
+            break
+    return {node: depths[scc_index] for node, scc_index in scc_map.items()}
+
+
+class TestGraphUtils(unittest.TestCase):
+    def test_random_equivalence(self):
+        rng = random.Random(0)
+        for trial in range(300):
+            num_nodes = rng.randint(1, 30)
+            defined_fns = random_graph(rng, num_nodes, rng.randint(0, 2 * num_nodes), rooted=rng.random() < .5)
+            with self.subTest(trial=trial):
+                self.assertEqual(strongly_connected_components(defined_fns),
+                                 reference_strongly_connected_components(defined_fns))
+
+                candidates = reference_root_candidates(defined_fns)
+                if len(candidates) == 0:
+                    with self.assertRaises(KeyError):
+                        get_root(defined_fns)
+                else:
+                    self.assertIn(get_root(defined_fns), candidates)
+
+                root = rng.choice(list(defined_fns))
+                self.assertEqual(calculate_node_depths(defined_fns, root), reference_node_depths(defined_fns, root))
+
+    def test_cycles(self):
+        defined_fns = {name: Node(name) for name in ['a', 'b', 'c', 'd']}
+        for parent, child in [('a', 'b'), ('b', 'c'), ('c', 'b'), ('c', 'd')]:
+            defined_fns[parent].children.add(defined_fns[child])
+            defined_fns[child].parents.add(defined_fns[parent])
+        self.assertEqual(strongly_connected_components(defined_fns), ([{'a'}, {'b', 'c'}, {'d'}], [[1, 2], [2], []]))
+        self.assertEqual(get_root(defined_fns), 'a')
+        self.assertEqual(calculate_node_depths(defined_fns, 'a'), {'a': 0, 'b': 1, 'c': 1, 'd': 2})
+        self.assertEqual(calculate_node_depths(defined_fns, 'b'), {'a': -1, 'b': 0, 'c': 0, 'd': 1})
+
+    def test_deep_chain(self):
+        # deeper than the recursion limit
+        nodes = [Node(f'fn_{i}') for i in range(3 * sys.getrecursionlimit())]
+        for parent, child in zip(nodes, nodes[1:]):
+            parent.children.add(child)
+            child.parents.add(parent)
+        defined_fns = {node.name: node for node in nodes}
+        sccs, _ = strongly_connected_components(defined_fns)
+        self.assertEqual(len(sccs), len(nodes))
+        self.assertEqual(get_root(defined_fns), 'fn_0')
+        self.assertEqual(calculate_node_depths(defined_fns, 'fn_0')[nodes[-1].name], len(nodes) - 1)
+
+
+def benchmark(sizes=(25, 50, 100, 200, 500, 1000), max_reference_size=200):
+    # python -m engine.utils.test.graph_utils_test --benchmark
+    rng = random.Random(0)
+    print(f'{"functions":>10} {"reference (s)":>14} {"tarjan (s)":>11}')
+    for num_nodes in sizes:
+        defined_fns = random_graph(rng, num_nodes, 2 * num_nodes, rooted=True)
+        root = next(iter(defined_fns))
+        reference_time = float('nan')  # the reference takes minutes beyond a few hundred functions
+        if num_nodes <= max_reference_size:
+            start = time.perf_counter()
+            reference_strongly_connected_components(defined_fns)
+            reference_root_candidates(defined_fns)
+            reference_node_depths(defined_fns, root)
+            reference_time = time.perf_counter() - start
+        start = time.perf_counter()
+        strongly_connected_components(defined_fns)
+        get_root(defined_fns)
+        calculate_node_depths(defined_fns, root)
+        tarjan_time = time.perf_counter() - start
+        print(f'{num_nodes:>10} {reference_time:>14.4f} {tarjan_time:>11.4f}')
+
+
+if __name__ == '__main__':
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        unittest.main()
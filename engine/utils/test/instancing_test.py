@@ -0,0 +1,99 @@
+import unittest
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'scripts', 'prompts'))
+from mi_helper import mi, _preprocess_shape, _find_repeated_subtrees, _instanced_scene_dict
+import dsl_utils
+from dsl_utils import register, library_call
+from shape_utils import transform_shape, concat_shapes
+from math_utils import translation_matrix, rotation_matrix, scale_matrix, reflection_matrix
+from engine_utils import primitive_call
+from type_utils import Shape
+
+
+def define_program():
+    @register()
+    def piece(height: float) -> Shape:
+        # a base and an off-center column, so that rotations and mirroring are visible
+        return concat_shapes(
+            transform_shape(primitive_call('cube', shape_kwargs={'scale': (.8, .2, .6)}, color=(.2, .2, .2)),
+                            translation_matrix((0, .1, 0))),
+            primitive_call('cylinder', shape_kwargs={'radius': .15, 'p0': (-.15, .2, 0), 'p1': (-.15, .2 + height, 0)}),
+        )
+
+    @register()
+    def topped_piece(height: float) -> Shape:
+        return concat_shapes(
+            library_call('piece', height=height),
+            transform_shape(primitive_call('sphere', shape_kwargs={'radius': .15}, color=(.8, .1, .1)),
+                            translation_matrix((.2, .35 + height, .1))),
+        )
+
+    @register()
+    def board() -> Shape:
+        pieces = []
+        for i in range(8):
+            for j in range(8):
+                pose = translation_matrix((1.2 * i, 0, 1.2 * j))
+                pose = pose @ rotation_matrix(np.pi / 7 * (i + j), (0, 1, 0), (0, 0, 0))
+                pose = pose @ scale_matrix(.5 + .1 * (i % 4), (0, 0, 0))
+                if j % 2 == 1:
+                    pose = pose @ reflection_matrix((0, 0, 0), (1, 0, 0))
+                name = 'piece' if i < 4 else 'topped_piece'
+                pieces.append(transform_shape(library_call(name, height=1. + (i + j) % 2), pose))
+        return concat_shapes(*pieces)
+
+    @register()
+    def pair() -> Shape:
+        # both copies share the `info` of one call, so they are a single subtree
+        shape = library_call('piece', height=1.)
+        return concat_shapes(shape, transform_shape(shape, translation_matrix((3, 0, 0))))
+
+
+def cast_rays(scene: mi.Scene, resolution: int = 48) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # parallel rays from above at an angle over the board; returns hit mask, distances and shading normals, as the
+    # geometric normals of mirrored meshes depend on their winding
+    d = mi.ScalarVector3f(*(np.array([.3, -1., .2]) / np.linalg.norm([.3, -1., .2])))
+    valid, t, n = [], [], []
+    for x in np.linspace(-1, 10, resolution):
+        for z in np.linspace(-1, 10, resolution):
+            si = scene.ray_intersect(mi.Ray3f(mi.ScalarPoint3f(x, 10, z), d))
+            valid.append(bool(si.is_valid()))
+            t.append(float(si.t) if si.is_valid() else 0.)
+            n.append(np.array(si.sh_frame.n) if si.is_valid() else np.zeros(3))
+    return np.array(valid), np.array(t), np.stack(n)
+
+
+class TestInstancing(unittest.TestCase):
+    def setUp(self):
+        dsl_utils.clear_library()
+        define_program()
+
+    def tearDown(self):
+        dsl_utils.clear_library()
+
+    def test_same_as_flat(self):
+        # rotated, scaled and mirrored placements, on a board without coplanar overlaps
+        shape = library_call('board')
+        groups = _find_repeated_subtrees(shape)
+        # mirrored placements of `topped_piece` only instance the nested `piece`, as Mitsuba shades mirrored spheres
+        # inside out but not spheres in a mirrored instance
+        self.assertEqual(sorted(len(g['local']) for g in groups), [2, 2, 3, 3])
+        self.assertEqual(sorted(len(g['indices']) for g in groups), [8, 8, 24, 24])
+        preprocessed = _preprocess_shape(shape)
+        flat = mi.load_dict({'type': 'scene', **{f'{i:02d}': s for i, s in enumerate(preprocessed)}})
+        instanced = mi.load_dict({'type': 'scene', **_instanced_scene_dict(preprocessed, groups)})
+        valid, t, n = cast_rays(flat)
+        self.assertGreater(valid.sum(), 100)
+        valid_instanced, t_instanced, n_instanced = cast_rays(instanced)
+        np.testing.assert_array_equal(valid_instanced, valid)
+        np.testing.assert_allclose(t_instanced, t, atol=1e-3)
+        np.testing.assert_allclose(n_instanced, n, atol=1e-3)
+
+    def test_shared_info_is_not_instanced(self):
+        self.assertEqual(_find_repeated_subtrees(library_call('pair')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 from engine.utils.code_llama_client import LlamaClient  
+from engine.utils.llm_cache import LLMCache
 import os
-import json
 import threading
 import torch
 
@@ -9,7 +9,7 @@ import torch
 class TestLlamaClient(unittest.TestCase):
     current_script = os.path.abspath(__file__)
     parent_dir = os.path.dirname(current_script)
-    _test_cache_path = os.path.join(parent_dir, 'test_llama_cache.json')
+    _test_cache_path = os.path.join(parent_dir, 'test_llama_cache.db')
     print(f"Test cache path: {_test_cache_path}")
 
     @classmethod
@@ -20,8 +20,10 @@ class TestLlamaClient(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         """Clean up by deleting the cache file after all tests."""
-        if os.path.exists(cls._test_cache_path):
-            os.remove(cls._test_cache_path)
+        cls.generator.cache.close()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(cls._test_cache_path + suffix):
+                os.remove(cls._test_cache_path + suffix)
         # Clear CUDA cache
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
@@ -39,10 +41,9 @@ class TestLlamaClient(unittest.TestCase):
         self.assertTrue(os.path.exists(self.generator.cache_file))
 
         # Confirm that it is in the cache
-        with open(self.generator.cache_file, "r") as f:
-            cache = json.load(f)
-            self.assertTrue(cache_key in cache)
-            self.assertTrue(any("Paris" in resp for resp in cache[cache_key][0]), "Expected 'Paris' in the cached response")
+        cache = LLMCache(self.generator.cache_file)
+        self.assertTrue(cache_key in cache)
+        self.assertTrue(any("Paris" in resp for resp in cache[cache_key][0]), "Expected 'Paris' in the cached response")
 
     def test_multiple_completions(self):
         """Test generating multiple completions."""
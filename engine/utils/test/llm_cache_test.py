@@ -0,0 +1,93 @@
+import unittest
+import base64
+import json
+import multiprocessing as mp
+import os
+import tempfile
+from engine.utils.llm_cache import LLMCache, request_key, migrate_json_cache
+
+
+def append_many(path: str, key: str, worker: int, n: int):
+    cache = LLMCache(path)
+    for i in range(n):
+        cache.append(key, [[f'worker {worker}', f'completion {i}']])
+
+
+class TestLLMCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'cache.db')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_append_get(self):
+        cache = LLMCache(self.path)
+        self.assertEqual(cache.get('a'), [])
+        self.assertFalse('a' in cache)
+        cache.append('a', [['line 1', 'line 2']])
+        cache.append('a', [['line 3'], ['line 4']])
+        self.assertTrue('a' in cache)
+        self.assertEqual(cache['a'], [['line 1', 'line 2'], ['line 3'], ['line 4']])
+        self.assertEqual(LLMCache(self.path).get('a'), cache.get('a'))
+        self.assertEqual(len(cache), 1)
+
+    def test_concurrent_writers(self):
+        ctx = mp.get_context('spawn')
+        processes = [ctx.Process(target=append_many, args=(self.path, 'key', worker, 25)) for worker in range(4)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+        results = LLMCache(self.path).get('key')
+        self.assertEqual(len(results), 100)
+        for worker in range(4):  # each writer's completions stay in order
+            self.assertEqual([r[1] for r in results if r[0] == f'worker {worker}'], [f'completion {i}' for i in range(25)])
+
+    def test_request_key(self):
+        request = dict(provider='claude', model='m', system_prompt='s', max_tokens=10, temperature=.5, stop_sequences=None)
+        self.assertEqual(request_key(user_prompt=['a', ('b', 'c')], **request), request_key(user_prompt=['a', ['b', 'c']], **request))
+        self.assertNotEqual(request_key(user_prompt='a', **request), request_key(user_prompt='a', **{**request, 'model': 'n'}))
+
+        image_path = os.path.join(self.tmp_dir.name, 'image.png')
+        with open(image_path, 'wb') as f:
+            f.write(b'image bytes')
+        data_url = f'data:image/png;base64,{base64.b64encode(b"image bytes").decode()}'
+        # a path and a data URL with the same contents give the same key
+        self.assertEqual(request_key(user_prompt=[{'type': 'image_url', 'image_url': image_path}], **request),
+                         request_key(user_prompt=[{'type': 'image_url', 'image_url': {'url': data_url, 'detail': 'low'}}], **request))
+        key = request_key(user_prompt=[{'type': 'image_url', 'image_url': image_path}], **request)
+        with open(image_path, 'wb') as f:
+            f.write(b'other image bytes')
+        self.assertNotEqual(request_key(user_prompt=[{'type': 'image_url', 'image_url': image_path}], **request), key)
+
+    def test_migrate(self):
+        messages = (('system', 'You are a helpful assistant.'), ('user', 'hi'))
+        legacy = {
+            str(('hello', 'system', 100, .5, None, 'claude')): [['a'], ['b']],
+            str((messages, 100, .5, None, False, False, None)): [['c']],
+            str((messages, 100, .5, None, False, False, None, .2)): [['d']],
+            str(('hello', 'system', 100, .5, None, 'gemini')): [['e']],
+            'not a tuple': [['f']],
+        }
+        json_path = os.path.join(self.tmp_dir.name, 'cache.json')
+        with open(json_path, 'w') as f:
+            json.dump(legacy, f)
+        models = {'claude': 'claude-model', 'gpt': 'gpt-model'}
+        self.assertEqual(migrate_json_cache(json_path, self.path, models), {'migrated': 3, 'skipped': 2})
+        self.assertEqual(migrate_json_cache(json_path, self.path, models), {'migrated': 3, 'skipped': 2})
+
+        # keys are computed the same way as in the clients
+        cache = LLMCache(self.path)
+        self.assertEqual(cache.get(request_key(provider='claude', model='claude-model', user_prompt='hello', system_prompt='system',
+                                               max_tokens=100, temperature=.5, stop_sequences=None)), [['a'], ['b']])
+        gpt_request = dict(provider='gpt', model='gpt-model', messages=messages, max_tokens=100, temperature=.5, stop=None,
+                           indented=False, indented_after_first_line=False, require=None)
+        self.assertEqual(cache.get(request_key(presence_penalty=0., **gpt_request)), [['c']])
+        self.assertEqual(cache.get(request_key(presence_penalty=.2, **gpt_request)), [['d']])
+        self.assertEqual(len(cache), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from engine.utils.llm_concurrency import TokenBucket, fan_out
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # mimics the Anthropic messages endpoint: slow responses, and a 429 for every `rate_limit_every`-th request
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.num_requests += 1
+            index = server.num_requests
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+        if server.rate_limit_every and index % server.rate_limit_every == 0:
+            payload = json.dumps({'type': 'error', 'error': {'type': 'rate_limit_error', 'message': 'slow down'}}).encode()
+            self.send_response(429)
+            self.send_header('retry-after', '0')
+        else:
+            payload = json.dumps({
+                'id': f'msg_{index}', 'type': 'message', 'role': 'assistant', 'model': body['model'],
+                'content': [{'type': 'text', 'text': f'completion {index}\nsecond line'}],
+                'stop_reason': 'end_turn', 'stop_sequence': None, 'usage': {'input_tokens': 1, 'output_tokens': 1},
+            }).encode()
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(11):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, .45)
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=1000, capacity=10)
+        bucket.pause(.2)
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, .19)
+
+    def test_fan_out_retries(self):
+        attempts = []
+
+        def fn():
+            with lock:
+                attempts.append(None)
+                if len(attempts) <= 2:
+                    raise ConnectionError
+            return len(attempts)
+
+        lock = threading.Lock()
+        results = fan_out(fn, 4, max_concurrency=2, rate_limiter=None, retry_on=(ConnectionError,), base_delay=.01)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(attempts), 6)
+        with self.assertRaises(ConnectionError):
+            fan_out(lambda: (_ for _ in ()).throw(ConnectionError), 1, max_concurrency=1, rate_limiter=None,
+                    retry_on=(ConnectionError,), max_retries=2, base_delay=.01)
+
+
+@unittest.skipIf(importlib.util.find_spec('anthropic') is None, 'anthropic is not installed')
+class TestClaudeFanOut(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.num_requests = self.server.in_flight = self.server.max_in_flight = 0
+        self.server.delay = .3
+        self.server.rate_limit_every = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        from engine.utils import claude_client, llm_concurrency
+        self.claude_client = claude_client
+        claude_client.LLM_CONCURRENCY = 4
+        llm_concurrency._rate_limiters['claude'] = TokenBucket(rate=100, capacity=100)
+        self.client = claude_client.ClaudeClient(cache=os.path.join(self.tmp_dir.name, 'cache.db'))
+        self.client.client = claude_client.anthropic.Anthropic(
+            api_key='test', base_url=f'http://127.0.0.1:{self.server.server_port}', max_retries=0)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_concurrent_completions(self):
+        start = time.monotonic()
+        _, results = self.client.generate('prompt', 'system', num_completions=4, temperature=.5)
+        self.assertLess(time.monotonic() - start, 4 * self.server.delay)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(self.server.max_in_flight, 4)
+        self.assertEqual(sorted(r[0] for r in results), [f'completion {i}' for i in range(1, 5)])
+
+    def test_concurrency_limit(self):
+        self.claude_client.LLM_CONCURRENCY = 2
+        self.client.generate('prompt', 'system', num_completions=6, temperature=.5)
+        self.assertEqual(self.server.num_requests, 6)
+        self.assertEqual(self.server.max_in_flight, 2)
+
+    def test_rate_limit_retry(self):
+        self.server.delay = .05
+        self.server.rate_limit_every = 3
+        _, results = self.client.generate('prompt', 'system', num_completions=4, temperature=.5)
+        self.assertEqual(len(results), 4)
+        self.assertGreater(self.server.num_requests, 4)
+
+    def test_partial_cache_hit(self):
+        key, first = self.client.generate('prompt', 'system', num_completions=2, temperature=.5)
+        self.assertEqual(self.server.num_requests, 2)
+        _, results = self.client.generate('prompt', 'system', num_completions=3, temperature=.5)
+        self.assertEqual(self.server.num_requests, 3)  # only the missing completion is requested
+        self.assertEqual(results[:2], first)
+        _, results = self.client.generate('prompt', 'system', num_completions=2, skip_cache_completions=1, temperature=.5)
+        self.assertEqual(self.server.num_requests, 3)
+        self.assertEqual(results, self.client.cache.get(key)[1:3])
+        self.client.generate('prompt', 'system', num_completions=1, skip_cache=True, temperature=.5)
+        self.assertEqual(self.server.num_requests, 4)
+        self.assertEqual(len(self.client.cache.get(key)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import os
+import sys
+import tempfile
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'scripts', 'prompts'))
+from mi_helper import mi, SCENE_PRESETS
+from engine.utils.mitsuba_utils import xml_to_dict
+
+
+def render(scene: mi.Scene, sensor: mi.Sensor) -> np.ndarray:
+    return np.asarray(mi.render(scene, sensor=sensor, spp=4, seed=0))
+
+
+class TestXMLToDict(unittest.TestCase):
+    def test_presets(self):
+        # every preset loads to the same scene from the dict as from the file
+        xml_paths = sorted(set(preset['xml_path'] for preset in SCENE_PRESETS.values() if os.path.exists(preset['xml_path'])))
+        self.assertGreater(len(xml_paths), 0)
+        for xml_path in xml_paths:
+            with self.subTest(xml_path=xml_path):
+                expected = mi.load_file(xml_path)
+                actual = mi.load_dict(xml_to_dict(xml_path))
+                self.assertEqual(len(actual.shapes()), len(expected.shapes()))
+                self.assertEqual(len(actual.emitters()), len(expected.emitters()))
+                np.testing.assert_allclose(np.asarray(actual.bbox().min), np.asarray(expected.bbox().min), atol=1e-5)
+                np.testing.assert_allclose(np.asarray(actual.bbox().max), np.asarray(expected.bbox().max), atol=1e-5)
+                sensor, = expected.sensors()
+                actual_sensor, = actual.sensors()
+                np.testing.assert_allclose(actual_sensor.world_transform().matrix, sensor.world_transform().matrix, atol=1e-5)
+                np.testing.assert_array_equal(actual_sensor.film().size(), sensor.film().size())
+                # a small copy of the preset camera keeps the renders cheap
+                small = mi.load_dict({'type': 'perspective', 'to_world': sensor.world_transform(),
+                                      'fov': mi.traverse(sensor)['x_fov'], 'fov_axis': 'x',
+                                      'film': {'type': 'hdrfilm', 'width': 48, 'height': 40, 'rfilter': {'type': 'box'}}})
+                np.testing.assert_allclose(render(actual, small), render(expected, small), atol=1e-4)
+
+    def test_unsupported_element(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            xml_path = os.path.join(tmp_dir, 'scene.xml')
+            with open(xml_path, 'w') as f:
+                f.write('<scene version="3.0.0"><include filename="other.xml"/></scene>')
+            with self.assertRaisesRegex(NotImplementedError, 'unsupported XML element: include'):
+                xml_to_dict(xml_path)
+            with open(xml_path, 'w') as f:
+                f.write('<scene version="3.0.0"><shape type="cube"><transform name="to_world">'
+                        '<skew value="1"/></transform></shape></scene>')
+            with self.assertRaisesRegex(NotImplementedError, 'unsupported transform operation: skew'):
+                xml_to_dict(xml_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
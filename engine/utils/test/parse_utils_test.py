@@ -0,0 +1,128 @@
+import unittest
+import tempfile
+from pathlib import Path
+from engine.utils.parse_utils import extract_call_graph, module_exports, validate_program
+
+PROGRAM = '''
+from helper import *
+
+
+def make_leg(size):
+    return library_call('leg', size=size)
+
+
+@register('a table top; flat')
+def top() -> Shape:
+    return primitive_call('cube', shape_kwargs={'scale': (1, .1, 1)})
+
+
+@register()
+def leg(size: float) -> Shape:
+    return primitive_call('cube', shape_kwargs={'scale': (.1, size, .1)})
+
+
+@register()
+def table() -> Shape:
+    def legs():
+        return loop(4, lambda i: make_leg(size=1.))
+    return concat_shapes(library_call('a table top'), legs())
+
+
+@register()
+def room() -> Shape:
+    @register()
+    def rug() -> Shape:
+        return library_call('leg', size=.01)
+    return concat_shapes(library_call('table'), library_call(func_name='rug'), library_call('room') if False else [])
+'''
+
+
+class TestExtractCallGraph(unittest.TestCase):
+    def test_call_graph(self):
+        graph = extract_call_graph(PROGRAM)
+        self.assertEqual(list(graph.keys()), ['top', 'leg', 'table', 'room', 'rug'])
+        self.assertEqual(graph['top'], {'docstring': 'a table top; flat', 'children': []})
+        self.assertEqual(graph['table']['children'], ['top', 'leg'])  # docstring lookup, lambda in a nested helper
+        self.assertEqual(graph['room']['children'], ['table', 'rug', 'room'])
+        self.assertEqual(graph['rug']['children'], ['leg'])
+
+    def test_overwrite(self):
+        graph = extract_call_graph(PROGRAM, '@register()\ndef table() -> Shape:\n    return library_call("leg", size=1.)\n')
+        self.assertEqual(graph['table']['children'], ['leg'])
+
+    def test_unknown_name(self):
+        graph = extract_call_graph('@register()\ndef a() -> Shape:\n    return library_call("b")\n')
+        self.assertEqual(graph, {'a': {'docstring': 'a', 'children': []}})
+
+    def test_dynamic(self):
+        for body in ['library_call(f"leg_{i}")', 'library_call(name)', 'concat_shapes(*map(library_call, ["leg"]))']:
+            with self.subTest(body=body):
+                self.assertIsNone(extract_call_graph(PROGRAM + f'\n@register()\ndef extra(name: str, i: int) -> Shape:\n    return {body}\n'))
+        # a computed docstring only matters for calls that do not match a function name
+        program = '@register(DOC)\ndef a() -> Shape:\n    return []\n\n@register()\ndef b() -> Shape:\n    return library_call("{}")\n'
+        self.assertEqual(extract_call_graph(program.format('a'))['b']['children'], ['a'])
+        self.assertIsNone(extract_call_graph(program.format('something')))
+
+
+class TestValidateProgram(unittest.TestCase):
+    def setUp(self):
+        # `helper` re-exports the `__all__` of `shapes` and its own public names, like `scripts/prompts/helper.py`
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        Path(self.tmp_dir.name, 'shapes.py').write_text(
+            "__all__ = ['primitive_call', 'concat_shapes']\n\ndef primitive_call(): pass\n\ndef concat_shapes(): pass\n"
+            "\ndef _private(): pass\n")
+        Path(self.tmp_dir.name, 'helper.py').write_text(
+            'import numpy as np\nfrom math import *\nfrom shapes import *\n\ndef register(docstring=None): pass\n'
+            '\ndef library_call(name, **kwargs): pass\n\ndef loop(n, fn): pass\n\nShape = list\n_hidden = 0\n')
+        self.search_dirs = (self.tmp_dir.name,)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def validate(self, program: str):
+        return validate_program('from helper import *\n' + program, self.search_dirs)
+
+    def test_module_exports(self):
+        exports = module_exports('helper', self.search_dirs)
+        self.assertTrue({'np', 'pi', 'sqrt', 'primitive_call', 'register', 'Shape'} <= exports)
+        self.assertFalse({'_private', '_hidden'} & exports)
+        self.assertIsNone(module_exports('unknown_module', self.search_dirs))
+
+    def test_valid(self):
+        self.assertEqual(self.validate(PROGRAM), ([], [], 'room'))
+        errors, _, _ = self.validate('@register()\ndef a(n: int = 2) -> Shape:\n    x = [sqrt(i) * np.pi for i in range(n)]\n'
+                                  '    try:\n        pass\n    except Exception as e:\n        print(e)\n'
+                                  '    return loop(n, lambda i: primitive_call())\n')
+        self.assertEqual(errors, [])
+
+    def test_errors(self):
+        self.assertEqual(self.validate('@register()\ndef a() -> Shape:\n    return [\n')[0],
+                         ["SyntaxError: '[' was never closed (line 4)"])
+        self.assertEqual(self.validate('@register()\ndef a() -> Shape:\n    return make_cube(size)\n')[0],
+                         ["NameError: name 'make_cube' is not defined (line 4)",
+                          "NameError: name 'size' is not defined (line 4)"])
+        # `library_call` returns an empty shape for unknown names, so the program still runs
+        self.assertEqual(self.validate('@register()\ndef a() -> Shape:\n    return library_call("b")\n'),
+                         ([], ["`a` calls `library_call('b')`, but no function is registered as 'b'"], 'a'))
+        self.assertEqual(self.validate('def a() -> Shape:\n    return []\n')[0],
+                         ['no function is registered with `@register`'])
+
+    def test_unreachable_code(self):
+        # only code that may run is checked: module-level code, registered functions and what they call
+        helpers = ('def unused():\n    return undefined_thing\n\nunused_lambda = lambda: undefined_lambda\n\n'
+                   'def used(i):\n    return [missing_in_used]\n\ndef nested():\n    return [missing_in_nested]\n\n'
+                   'def calls_nested(i):\n    return nested()\n\nscale = module_level\n\n')
+        program = helpers + '@register()\ndef a() -> Shape:\n    return loop(2, used) + calls_nested(0)\n'
+        errors, warnings, root = self.validate(program)
+        self.assertEqual([e.split(' (')[0] for e in errors], [f"NameError: name '{name}' is not defined" for name in
+                                                              ['missing_in_used', 'missing_in_nested', 'module_level']])
+        self.assertEqual((warnings, root), ([], 'a'))
+
+    def test_unknown_star_import(self):
+        # names cannot be checked, but the rest can
+        errors, warnings, root = validate_program('from somewhere import *\n' + PROGRAM + '\nx = undefined_name\n')
+        self.assertEqual((errors, warnings, root), ([], [], 'room'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+from engine.utils.pipeline_utils import Pipeline, Stage
+
+
+class Collector:
+    # a final stage that records the items reaching it and how many of its workers ran at once
+    def __init__(self, delay: float = 0.):
+        self.items = []
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, item):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.items.append(item)
+            self.running -= 1
+
+
+class TestPipeline(unittest.TestCase):
+    def run_pipeline(self, pipeline: Pipeline, items) -> dict:
+        # fails instead of hanging if some worker never stops
+        ret = {}
+        thread = threading.Thread(target=lambda: ret.update(pipeline.run(items)), daemon=True)
+        thread.start()
+        thread.join(timeout=30)
+        self.assertFalse(thread.is_alive())
+        return ret
+
+    def test_fan_out(self):
+        collector = Collector()
+        stats = self.run_pipeline(Pipeline([
+            Stage('split', lambda n: ((n, k) for k in range(n))),
+            Stage('square', lambda item: [item[0] * 100 + item[1] ** 2]),
+            Stage('collect', collector),
+        ], queue_size=2), range(6))
+        self.assertEqual(sorted(collector.items), sorted(n * 100 + k ** 2 for n in range(6) for k in range(n)))
+        self.assertEqual(stats['split'] | {'busy_time': 0, 'items_per_min': 0, 'utilization': 0},
+                         {'workers': 1, 'in': 6, 'out': 15, 'errors': 0, 'busy_time': 0, 'items_per_min': 0, 'utilization': 0})
+        self.assertEqual((stats['square']['in'], stats['square']['out']), (15, 15))
+        self.assertEqual(stats['collect']['in'], 15)
+
+    def test_errors(self):
+        def check(n):
+            if n % 3 == 0:
+                raise ValueError(n)
+            yield n
+
+        collector = Collector()
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            stats = self.run_pipeline(Pipeline([Stage('check', check, num_workers=2), Stage('collect', collector)],
+                                               queue_size=1), range(20))
+        self.assertEqual(sorted(collector.items), [n for n in range(20) if n % 3 != 0])
+        self.assertEqual((stats['check']['in'], stats['check']['out'], stats['check']['errors']), (20, 13, 7))
+        self.assertEqual(stdout.getvalue().count('[ERROR] pipeline stage check failed'), 7)
+
+    def test_several_workers(self):
+        # every worker of every stage stops, and the slow stage runs its items in parallel
+        collector = Collector(delay=.05)
+        stats = self.run_pipeline(Pipeline([
+            Stage('pass', lambda n: [n], num_workers=3),
+            Stage('collect', collector, num_workers=4),
+        ]), range(16))
+        self.assertEqual(sorted(collector.items), list(range(16)))
+        self.assertGreater(collector.max_running, 1)
+        self.assertEqual(stats['collect']['workers'], 4)
+        self.assertFalse(any(thread.name.startswith(('pass_', 'collect_')) for thread in threading.enumerate()))
+
+
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'scripts'))
+        import run
+        self.run = run
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def main(self, generate: mock.Mock, execute_impl: mock.Mock):
+        argv = ['run.py', '--tasks', 'a chair', '--resume-dir', self.tmp_dir.name, '--num-completions', '2']
+        with mock.patch.object(sys, 'argv', argv), mock.patch.object(self.run, 'generate', generate), \
+                mock.patch.object(self.run, 'execute_impl', execute_impl), contextlib.redirect_stdout(io.StringIO()):
+            self.run.main()
+
+    def test_resume(self):
+        completions = [['```python', 'from helper import *', '```'], ['```python', 'from helper import *', '```']]
+        generate, execute_impl = mock.Mock(return_value=completions), mock.Mock(return_value=0)
+        self.main(generate, execute_impl)
+        self.assertEqual((generate.call_count, execute_impl.call_count), (1, 2))
+        task_dir, = [p for p in Path(self.tmp_dir.name).iterdir() if p.is_dir()]
+        with open(task_dir / 'results.json') as f:
+            self.assertEqual(json.load(f), completions)
+
+        # finished work is skipped
+        self.main(generate, execute_impl)
+        self.assertEqual((generate.call_count, execute_impl.call_count), (1, 2))
+
+        # only the trial without an execution status runs again
+        (task_dir / '1' / 'execute_status.json').unlink()
+        self.main(generate, execute_impl)
+        self.assertEqual((generate.call_count, execute_impl.call_count), (1, 3))
+        self.assertEqual(Path(execute_impl.call_args.args[2]), task_dir / '1')
+
+        # results with fewer completions than requested are generated again
+        with open(task_dir / 'results.json', 'w') as f:
+            json.dump(completions[:1], f)
+        self.main(generate, execute_impl)
+        self.assertEqual((generate.call_count, execute_impl.call_count), (2, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
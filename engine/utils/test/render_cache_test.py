@@ -0,0 +1,101 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'scripts', 'prompts'))
+from mi_helper import _scene_digest
+from engine.utils.render_cache import RenderCache
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = RenderCache(os.path.join(self.tmp_dir.name, 'cache'), max_bytes=1000)
+        self.src = os.path.join(self.tmp_dir.name, 'image.png')
+        with open(self.src, 'wb') as f:
+            f.write(b'x' * 100)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def put(self, keys: list[str]):
+        # entries with increasing, well separated modification times
+        now = time.time()
+        for i, key in enumerate(keys):
+            self.cache.put(key, self.src)
+            os.utime(self.cache._path(key), (now - 1000 + i, now - 1000 + i))
+
+    def cached_keys(self) -> set[str]:
+        return {p.stem for p in self.cache.cache_dir.glob('*/*.png')}
+
+    def test_get(self):
+        save_to = os.path.join(self.tmp_dir.name, 'out.png')
+        self.assertFalse(self.cache.get('ab0', save_to))
+        self.put(['ab0'])
+        mtime = self.cache._path('ab0').stat().st_mtime
+        self.assertTrue(self.cache.get('ab0', save_to))
+        with open(save_to, 'rb') as f:
+            self.assertEqual(f.read(), b'x' * 100)
+        self.assertGreater(self.cache._path('ab0').stat().st_mtime, mtime + 500)
+        self.assertEqual(self.cache.stats, {'hits': 1, 'misses': 1, 'writes': 1, 'evictions': 0})
+
+    def test_evict_least_recently_used(self):
+        keys = [f'{i:02d}key' for i in range(10)]
+        self.put(keys)  # exactly at the budget
+        self.assertEqual(self.cached_keys(), set(keys))
+        self.cache.get(keys[0], os.path.join(self.tmp_dir.name, 'out.png'))
+        self.put(['10key'])
+        # down to 90% of the budget, skipping the entry that was just read
+        self.assertEqual(self.cached_keys(), set(keys) - {keys[1], keys[2]} | {'10key'})
+        self.assertEqual(self.cache.total_bytes, 900)
+        self.assertEqual(self.cache.stats['evictions'], 2)
+
+    def test_put_is_atomic(self):
+        self.put([f'{i:02d}key' for i in range(5)])
+        self.put(['00key'])  # overwriting an entry
+        files = [name for _, _, names in os.walk(self.cache.cache_dir) for name in names]
+        self.assertEqual(sorted(files), [f'{i:02d}key.png' for i in range(5)])
+
+
+class TestSceneDigest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.curve_path = os.path.join(self.tmp_dir.name, 'curve.txt')
+        with open(self.curve_path, 'w') as f:
+            f.write('0 0 0 .1\n0 1 0 .1\n')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def shape(self) -> list[dict]:
+        return [{'type': 'cube', 'to_world': np.eye(4),
+                 'bsdf': {'type': 'diffuse', 'reflectance': {'type': 'rgb', 'value': (1, 0, 0)}},
+                 'info': {'stack': [('leaf', 0)]}},
+                {'type': 'linearcurve', 'to_world': np.eye(4), 'filename': self.curve_path,
+                 'info': {'stack': [('curve', 1)]}}]
+
+    def test_digest(self):
+        digest = _scene_digest(self.shape(), 'rover_background')
+        shape = self.shape()
+        shape[0]['info'] = {'stack': [('other', 2)], 'docstring': 'unused'}
+        shape[1]['filename'] = shutil.copy(self.curve_path, os.path.join(self.tmp_dir.name, 'copy.txt'))
+        self.assertEqual(_scene_digest(shape, 'rover_background'), digest)
+
+        shape = self.shape()
+        shape[0]['to_world'] = np.diag([1, 2, 1, 1])
+        self.assertNotEqual(_scene_digest(shape, 'rover_background'), digest)
+
+        shape = self.shape()
+        shape[0]['bsdf']['reflectance']['value'] = (0, 1, 0)
+        self.assertNotEqual(_scene_digest(shape, 'rover_background'), digest)
+
+        with open(self.curve_path, 'w') as f:
+            f.write('0 0 0 .1\n0 2 0 .1\n')
+        self.assertNotEqual(_scene_digest(self.shape(), 'rover_background'), digest)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+from engine.utils.render_pool import RenderPool
+
+IMPL = '''\
+import os
+import sys
+from helper import *
+import mitsuba as mi
+
+
+@register()
+def box() -> Shape:
+    return primitive_call('cube', shape_kwargs={'scale': (1, 1, 1)})
+
+
+print(f'variant {mi.variant()} pid {os.getpid()} primitives {len(library_call("box"))}')
+sys.exit(RETURNCODE)
+'''
+
+
+class TestRenderPool(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_impl(self, name: str, source: str) -> str:
+        path = self.root / f'{name}.py'
+        path.write_text(source)
+        return path.as_posix()
+
+    def test_fork(self):
+        with RenderPool(num_workers=1, fork=True, timeout=10, max_memory_gb=16) as pool:
+            self.assertTrue(pool.fork)
+            ok = pool.submit(self.write_impl('ok', IMPL.replace('RETURNCODE', '0')), 'exposed', (self.root / 'ok').as_posix())
+            error = pool.submit(self.write_impl('error', IMPL.replace('RETURNCODE', '3')), 'exposed', (self.root / 'error').as_posix())
+            hang = pool.submit(self.write_impl('hang', 'import time\ntime.sleep(60)\n'), 'exposed', (self.root / 'hang').as_posix())
+            again = pool.submit(self.write_impl('again', IMPL.replace('RETURNCODE', '0')), 'exposed', (self.root / 'again').as_posix())
+            ok, error, hang, again = ok.result(), error.result(), hang.result(), again.result()
+        self.assertEqual((ok['status'], ok['returncode']), ('ok', 0))
+        # each job runs in its own child, with a library as empty as in a fresh interpreter
+        out = (self.root / 'ok' / 'execute_out.txt').read_text()
+        self.assertEqual(out.strip(), f"variant scalar_rgb pid {ok['pid']} primitives 1")
+        self.assertEqual((error['status'], error['returncode']), ('error', 3))
+        self.assertEqual(hang['status'], 'timeout')
+        self.assertIn('timed out', (self.root / 'hang' / 'execute_err.txt').read_text())
+        self.assertEqual((again['status'], again['returncode']), ('ok', 0))
+        self.assertNotEqual(again['pid'], ok['pid'])
+
+    def test_no_fork_with_gpu_variants(self):
+        with mock.patch.dict(os.environ, {'MI_DEFAULT_VARIANT': 'cuda_ad_rgb'}):
+            self.assertFalse(RenderPool(fork=True).fork)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'scripts', 'prompts'))
+from _shape_batch_utils import ShapeBatch, _freeze
+from shape_utils import transform_shape, concat_shapes, _batch_shapes_context
+
+COLORS = [(1, 0, 0), (0, 1, 0), (.5, .5, .5)]
+
+
+def random_pose(rng: np.random.Generator) -> np.ndarray:
+    q, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+    pose = np.eye(4)
+    pose[:3, :3] = q @ np.diag(rng.uniform(.5, 2, size=3))
+    pose[:3, 3] = rng.uniform(-3, 3, size=3)
+    return pose
+
+
+def random_shape(rng: np.random.Generator, n: int) -> list[dict]:
+    # primitives with repeated BSDFs, optional BSDFs and `info`, and extra keys, as `primitive_call` returns them
+    shape = []
+    for i in range(n):
+        kind = rng.integers(3)
+        s = {'type': ['cube', 'sphere', 'cylinder'][kind], 'to_world': random_pose(rng)}
+        if kind == 2:
+            s['p0'], s['p1'], s['radius'] = (0, 0, 0), (0, 1, 0), .5
+        if rng.random() < .8:
+            s['bsdf'] = {'type': 'diffuse', 'reflectance': {'type': 'rgb', 'value': COLORS[rng.integers(len(COLORS))]}}
+        if rng.random() < .8:
+            s['info'] = {'stack': [('leaf', i)]}
+        shape.append(s)
+    return shape
+
+
+class TestShapeBatch(unittest.TestCase):
+    def assertShapesEqual(self, batched, listed):
+        batched, listed = list(batched), list(listed)
+        self.assertEqual(len(batched), len(listed))
+        for b, s in zip(batched, listed):
+            np.testing.assert_allclose(b['to_world'], s['to_world'], atol=1e-12)
+            self.assertEqual({k: v for k, v in b.items() if k != 'to_world'},
+                             {k: v for k, v in s.items() if k != 'to_world'})
+            self.assertEqual(_freeze({**b, 'to_world': np.round(b['to_world'], 9)}),
+                             _freeze({**s, 'to_world': np.round(s['to_world'], 9)}))
+
+    def test_round_trip(self):
+        shape = random_shape(np.random.default_rng(0), 20)
+        batch = ShapeBatch.from_shape(shape)
+        self.assertLessEqual(len(batch.bsdfs), len(COLORS))
+        self.assertShapesEqual(batch.to_shape(), shape)
+        self.assertShapesEqual(batch[3:7], shape[3:7])
+        self.assertShapesEqual([batch[-1]], [shape[-1]])
+
+    def test_transform_and_concat(self):
+        rng = np.random.default_rng(0)
+        for trial in range(20):
+            parts = [random_shape(rng, rng.integers(0, 6)) for _ in range(3)]
+            single = random_shape(rng, 1)[0]
+            poses = [random_pose(rng) for _ in range(3)]
+            results = {}
+            for flag in [False, True]:
+                with _batch_shapes_context(flag):
+                    shape = concat_shapes(*[transform_shape(part, pose) for part, pose in zip(parts, poses)], single)
+                    results[flag] = transform_shape(concat_shapes(shape, []), poses[0])
+            with self.subTest(trial=trial):
+                self.assertIsInstance(results[True], ShapeBatch)
+                self.assertShapesEqual(results[True], results[False])
+
+    def test_freeze(self):
+        # equal values freeze to equal keys regardless of dict order and array identity
+        self.assertEqual(_freeze({'a': 1, 'b': np.arange(3)}), _freeze({'b': np.arange(3), 'a': 1}))
+        self.assertNotEqual(_freeze({'a': (1, 2)}), _freeze({'a': [1, 2]}))
+        self.assertNotEqual(_freeze(np.zeros(3)), _freeze(np.zeros(3, dtype=np.float32)))
+        hash(_freeze({'a': [{'b': np.eye(2)}], 'c': {1, 2}}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+from engine.utils.voxel_grid import VoxelGrid
+
+
+def reference_fill(dense: np.ndarray, offset: np.ndarray, start, end, value: int, hollow: bool):
+    # sets a dense array the way `fill_box` sets the grid
+    start, end = np.asarray(start) - offset, np.asarray(end) - offset
+    if np.any(end <= start):
+        return
+    box = dense[start[0]:end[0], start[1]:end[1], start[2]:end[2]]
+    if hollow and np.all(end - start > 2):
+        box[[0, -1], :, :] = value
+        box[:, [0, -1], :] = value
+        box[:, :, [0, -1]] = value
+    else:
+        box[...] = value
+
+
+class TestVoxelGrid(unittest.TestCase):
+    def test_random_equivalence(self):
+        rng = np.random.default_rng(0)
+        offset = np.asarray([-40, -40, -40])
+        for trial in range(100):
+            grid, dense = VoxelGrid(), np.zeros((80, 80, 80), dtype=np.int64)
+            for _ in range(rng.integers(1, 20)):
+                start = rng.integers(-40, 20, size=3)
+                end = start + rng.integers(-2, 7, size=3) * rng.integers(1, 4)  # stays inside `dense`
+                state = None if rng.random() < .2 else f'block_{rng.integers(3)}'
+                hollow = bool(rng.random() < .3)
+                grid.fill_box(start, end, state, hollow=hollow)
+                reference_fill(dense, offset, start, end, grid.state_id(state), hollow)
+            with self.subTest(trial=trial):
+                occupied = np.argwhere(dense != 0)
+                if len(occupied) == 0:
+                    self.assertIsNone(grid.bounds())
+                else:
+                    lo, hi = grid.bounds()
+                    np.testing.assert_array_equal(lo, occupied.min(axis=0) + offset)
+                    np.testing.assert_array_equal(hi, occupied.max(axis=0) + 1 + offset)
+                values, counts = np.unique(dense[dense != 0], return_counts=True)
+                self.assertEqual(grid.block_counts(),
+                                 {grid.palette[v]: int(n) for v, n in zip(values.tolist(), counts.tolist())})
+
+                # the boxes are disjoint and cover exactly the non-empty voxels
+                rebuilt = np.zeros_like(dense)
+                covered = np.zeros_like(dense)
+                for start, end, value in zip(*grid.boxes()):
+                    reference_fill(rebuilt, offset, start, end, value, hollow=False)
+                    covered[tuple(slice(s, e) for s, e in zip(start - offset, end - offset))] += 1
+                    self.assertEqual(value, dense[tuple(start - offset)])
+                np.testing.assert_array_equal(rebuilt, dense)
+                self.assertLessEqual(covered.max(), 1)
+                self.assertEqual(sum(int(np.prod(e - s)) for s, e, _ in zip(*grid.boxes())), len(grid))
+
+    def test_merged_boxes(self):
+        grid = VoxelGrid()
+        grid.fill_box((-20, 0, 5), (30, 40, 6), 'stone')  # spans several chunks
+        starts, ends, values = grid.boxes()
+        np.testing.assert_array_equal(starts, [[-20, 0, 5]])
+        np.testing.assert_array_equal(ends, [[30, 40, 6]])
+        self.assertEqual(grid.states(values), ['stone'])
+
+    def test_hollow_and_clear(self):
+        grid = VoxelGrid()
+        grid.fill_box((0, 0, 0), (5, 5, 5), 'glass', hollow=True)
+        self.assertEqual(grid.block_counts(), {'glass': 5 ** 3 - 3 ** 3})
+        grid.fill_box((0, 0, 0), (2, 2, 5), 'glass', hollow=True)  # too thin to be hollow
+        grid.fill_box((0, 4, 0), (5, 5, 5), None)
+        self.assertEqual(grid.block_counts(), {'glass': 5 ** 3 - 3 ** 3 + 3 - 25})
+        np.testing.assert_array_equal(grid.bounds()[1], [5, 4, 5])
+        grid.fill_box((0, 0, 0), (5, 5, 5), None)
+        self.assertIsNone(grid.bounds())
+        self.assertEqual(len(grid), 0)
+        self.assertEqual(len(grid.boxes()[0]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+from engine.utils.voxel_mesh import greedy_mesh
+
+
+def exposed_faces(volume: np.ndarray, label: int) -> np.ndarray:
+    # counts per axis and sign of the unit faces of `label` voxels next to empty voxels
+    solid = np.pad(volume != 0, 1)
+    counts = np.zeros((3, 2), dtype=np.int64)
+    for axis in range(3):
+        for j, sign in enumerate([1, -1]):
+            neighbor = np.roll(solid, -sign, axis=axis)[1:-1, 1:-1, 1:-1]
+            counts[axis, j] = np.count_nonzero((volume == label) & ~neighbor)
+    return counts
+
+
+class TestVoxelMesh(unittest.TestCase):
+    def test_random_surface(self):
+        # the triangles of each label cover its exposed faces exactly once, with outward normals
+        rng = np.random.default_rng(0)
+        for trial in range(50):
+            volume = rng.integers(1, 4, size=rng.integers(1, 9, size=3))
+            volume[rng.random(volume.shape) < .4] = 0
+            meshes = greedy_mesh(volume)
+            self.assertEqual(set(meshes), set(np.unique(volume[volume != 0]).tolist()))
+            for label, (vertices, faces) in meshes.items():
+                with self.subTest(trial=trial, label=label):
+                    triangles = vertices[faces]
+                    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]) / 2
+                    areas = np.zeros((3, 2))
+                    for axis in range(3):
+                        np.testing.assert_allclose(np.delete(normals, axis, axis=1)[normals[:, axis] != 0], 0)
+                        areas[axis] = normals[normals[:, axis] > 0, axis].sum(), -normals[normals[:, axis] < 0, axis].sum()
+                    np.testing.assert_allclose(areas, exposed_faces(volume, label))
+                    # each triangle faces away from the voxel it belongs to
+                    centers = triangles.mean(axis=1)
+                    inside = np.floor(centers - np.sign(normals) * .5).astype(int)
+                    np.testing.assert_array_equal(volume[tuple(inside.T)], label)
+
+    def test_merged_box(self):
+        volume = np.zeros((10, 6, 4), dtype=np.int64)
+        volume[1:9, :, 1:3] = 2
+        vertices, faces = greedy_mesh(volume)[2]
+        self.assertEqual(len(faces), 12)
+        np.testing.assert_array_equal(vertices.min(axis=0), [1, 0, 1])
+        np.testing.assert_array_equal(vertices.max(axis=0), [9, 6, 3])
+        self.assertEqual(greedy_mesh(np.zeros((3, 3, 3), dtype=np.int64)), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
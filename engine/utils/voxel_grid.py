@@ -0,0 +1,185 @@
+from typing import Any, Hashable, Optional, Sequence
+import numpy as np
+
+CHUNK = 16
+EMPTY = 0  # palette index of empty voxels, e.g. `minecraft:air`
+
+
+class VoxelGrid:
+    """
+    Sparse voxel grid made of `CHUNK`³ chunks of palette indices, for assembling scenes from overlapping boxes.
+
+    `fill_box` writes boxes in call order, so the last write to a voxel wins and clearing a box with `None` removes
+    what earlier boxes put there. Chunks that were never written take no memory. Per-chunk block counts and bounds
+    are cached and only recomputed for chunks written since, so `bounds` and `block_counts` take time proportional to
+    the number of chunks rather than voxels.
+    """
+
+    def __init__(self):
+        self.chunks: dict[tuple[int, int, int], np.ndarray] = {}
+        self.palette: list[Optional[Hashable]] = [None]
+        self.palette_index: dict[Hashable, int] = {}
+        self.dtype = np.uint16
+        self._stats: dict[tuple[int, int, int], tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    def state_id(self, state: Optional[Hashable]) -> int:
+        if state is None:
+            return EMPTY
+        if state not in self.palette_index:
+            self.palette_index[state] = len(self.palette)
+            self.palette.append(state)
+            if len(self.palette) > np.iinfo(self.dtype).max + 1:
+                self.dtype = np.uint32
+                self.chunks = {key: chunk.astype(self.dtype) for key, chunk in self.chunks.items()}
+        return self.palette_index[state]
+
+    def fill_box(self, start: Sequence[int], end: Sequence[int], state: Optional[Hashable], hollow: bool = False):
+        """
+        Sets the voxels in `[start, end)` to `state`, or clears them for `None`. A hollow box only sets its six faces
+        and keeps what is inside. Boxes with a non-positive extent set nothing.
+        """
+        start, end = [int(v) for v in start], [int(v) for v in end]
+        if any(e <= s for s, e in zip(start, end)):
+            return
+        if hollow and all(e - s > 2 for s, e in zip(start, end)):
+            for axis in range(3):
+                for lo, hi in [(start[axis], start[axis] + 1), (end[axis] - 1, end[axis])]:
+                    face_start, face_end = list(start), list(end)
+                    face_start[axis], face_end[axis] = lo, hi
+                    self.fill_box(face_start, face_end, state)
+            return
+        value = self.state_id(state)
+        (x0, y0, z0), (x1, y1, z1) = start, end
+        for cx in range(x0 // CHUNK, (x1 - 1) // CHUNK + 1):
+            for cy in range(y0 // CHUNK, (y1 - 1) // CHUNK + 1):
+                for cz in range(z0 // CHUNK, (z1 - 1) // CHUNK + 1):
+                    key = (cx, cy, cz)
+                    chunk = self.chunks.get(key)
+                    if chunk is None:
+                        if value == EMPTY:
+                            continue
+                        chunk = self.chunks[key] = np.zeros((CHUNK, CHUNK, CHUNK), dtype=self.dtype)
+                    ox, oy, oz = cx * CHUNK, cy * CHUNK, cz * CHUNK
+                    chunk[max(x0 - ox, 0):min(x1 - ox, CHUNK), max(y0 - oy, 0):min(y1 - oy, CHUNK),
+                          max(z0 - oz, 0):min(z1 - oz, CHUNK)] = value
+                    self._stats.pop(key, None)
+
+    def _chunk_stats(self, key) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # counts per palette index, and the bounds of the non-empty voxels in the chunk
+        if key not in self._stats:
+            chunk = self.chunks[key]
+            counts = np.bincount(chunk.ravel(), minlength=len(self.palette))
+            occupied = [np.flatnonzero(chunk.any(axis=axes)) for axes in [(1, 2), (0, 2), (0, 1)]]
+            if len(occupied[0]) == 0:
+                lo = hi = np.zeros((3,), dtype=np.int64)
+            else:
+                lo = np.asarray([o[0] for o in occupied]) + np.asarray(key) * CHUNK
+                hi = np.asarray([o[-1] + 1 for o in occupied]) + np.asarray(key) * CHUNK
+            self._stats[key] = counts, lo, hi
+        return self._stats[key]
+
+    def bounds(self) -> Optional[tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns:
+            the smallest `[lo, hi)` containing all non-empty voxels, or None if there are none
+        """
+        lo, hi = None, None
+        for key in list(self.chunks):
+            counts, chunk_lo, chunk_hi = self._chunk_stats(key)
+            if counts[EMPTY] == CHUNK ** 3:
+                continue
+            lo = chunk_lo if lo is None else np.minimum(lo, chunk_lo)
+            hi = chunk_hi if hi is None else np.maximum(hi, chunk_hi)
+        return None if lo is None else (lo, hi)
+
+    def block_counts(self) -> dict[Hashable, int]:
+        total = np.zeros((len(self.palette),), dtype=np.int64)
+        for key in list(self.chunks):
+            counts = self._chunk_stats(key)[0]
+            total[:len(counts)] += counts
+        return {self.palette[i]: int(total[i]) for i in np.flatnonzero(total) if i != EMPTY}
+
+    def __len__(self) -> int:
+        return sum(self.block_counts().values())
+
+    def voxels(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            (N, 3) coordinates and (N,) palette indices of all non-empty voxels, sorted by x, then y, then z
+        """
+        coords, values = [np.zeros((0, 3), dtype=np.int64)], [np.zeros((0,), dtype=self.dtype)]
+        for key, chunk in self.chunks.items():
+            local = np.argwhere(chunk != EMPTY)
+            coords.append(local + np.asarray(key) * CHUNK)
+            values.append(chunk[local[:, 0], local[:, 1], local[:, 2]])
+        coords, values = np.concatenate(coords), np.concatenate(values)
+        order = np.lexsort((coords[:, 2], coords[:, 1], coords[:, 0]))
+        return coords[order], values[order]
+
+    def dense(self, lo: Sequence[int], hi: Sequence[int]) -> np.ndarray:
+        """
+        Returns:
+            the palette indices of the voxels in `[lo, hi)`, as an array of shape `hi - lo` indexed by x, y, z
+        """
+        lo, hi = [int(v) for v in lo], [int(v) for v in hi]
+        volume = np.zeros([max(h - l, 0) for l, h in zip(lo, hi)], dtype=self.dtype)
+        for key, chunk in self.chunks.items():
+            origin = [k * CHUNK for k in key]
+            src_lo = [max(l - o, 0) for l, o in zip(lo, origin)]
+            src_hi = [min(h - o, CHUNK) for h, o in zip(hi, origin)]
+            if any(h <= l for l, h in zip(src_lo, src_hi)):
+                continue
+            volume[tuple(slice(o + l - d, o + h - d) for l, h, o, d in zip(src_lo, src_hi, origin, lo))] = \
+                chunk[tuple(slice(l, h) for l, h in zip(src_lo, src_hi))]
+        return volume
+
+    def boxes(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Decomposes the non-empty voxels into disjoint boxes of one state each, by merging runs along x, then runs of
+        equal rows along z, then equal slabs along y, first within each chunk and then across chunks. E.g. a box filled
+        with one state stays one box.
+
+        Returns:
+            (N, 3) starts, (N, 3) exclusive ends and (N,) palette indices
+        """
+        boxes = [np.zeros((0, 7), dtype=np.int64)]
+        for key, chunk in self.chunks.items():
+            rows = chunk.transpose(1, 2, 0).astype(np.int64)  # (y, z, x), so that `argwhere` lists each row in x order
+            occupied = rows != EMPTY
+            changed = np.ones(rows.shape, dtype=bool)
+            changed[:, :, 1:] = rows[:, :, 1:] != rows[:, :, :-1]
+            last = np.ones(rows.shape, dtype=bool)
+            last[:, :, :-1] = changed[:, :, 1:]
+            run_starts, run_ends = np.argwhere(occupied & changed), np.argwhere(occupied & last)
+            if len(run_starts) == 0:
+                continue
+            y, z, x0, x1 = run_starts[:, 0], run_starts[:, 1], run_starts[:, 2], run_ends[:, 2] + 1
+            origin = np.asarray(key) * CHUNK
+            chunk_boxes = np.stack([x0 + origin[0], x1 + origin[0], y + origin[1], y + 1 + origin[1],
+                                    z + origin[2], z + 1 + origin[2], rows[y, z, x0]], axis=1)
+            for axis in [2, 1]:
+                chunk_boxes = _merge_along(chunk_boxes, axis)
+            boxes.append(chunk_boxes)
+        boxes = np.concatenate(boxes)
+        for axis in [0, 2, 1]:
+            boxes = _merge_along(boxes, axis)
+        return boxes[:, [0, 2, 4]], boxes[:, [1, 3, 5]], boxes[:, 6]
+
+    def states(self, values: np.ndarray) -> list[Any]:
+        return [self.palette[v] for v in values.tolist()]
+
+
+def _merge_along(boxes: np.ndarray, axis: int) -> np.ndarray:
+    # merges boxes that are adjacent along `axis` and agree on their extent in the other axes and on their value
+    if len(boxes) == 0:
+        return boxes
+    lo, hi = 2 * axis, 2 * axis + 1
+    others = [c for c in range(7) if c not in (lo, hi)]
+    order = np.lexsort([boxes[:, lo]] + [boxes[:, c] for c in reversed(others)])
+    boxes = boxes[order]
+    same = np.all(boxes[1:, others] == boxes[:-1, others], axis=1) & (boxes[1:, lo] == boxes[:-1, hi])
+    starts = np.flatnonzero(np.concatenate([[True], ~same]))
+    ends = np.concatenate([starts[1:], [len(boxes)]]) - 1
+    merged = boxes[starts].copy()
+    merged[:, hi] = boxes[ends, hi]
+    return merged
@@ -0,0 +1,60 @@
+import numpy as np
+from engine.utils.voxel_grid import EMPTY, _merge_along
+
+
+def _runs(labels: np.ndarray, axis: int) -> np.ndarray:
+    # boxes of the runs of equal non-empty labels along `axis`, with columns (x0, x1, y0, y1, z0, z1, label)
+    moved = np.moveaxis(labels, axis, -1)
+    changed = np.ones(moved.shape, dtype=bool)
+    changed[..., 1:] = moved[..., 1:] != moved[..., :-1]
+    last = np.ones(moved.shape, dtype=bool)
+    last[..., :-1] = changed[..., 1:]
+    occupied = moved != EMPTY
+    starts, ends = np.argwhere(occupied & changed), np.argwhere(occupied & last)  # one of each per run, in row order
+    boxes = np.zeros((len(starts), 7), dtype=np.int64)
+    for j, other in enumerate(a for a in range(3) if a != axis):
+        boxes[:, 2 * other], boxes[:, 2 * other + 1] = starts[:, j], starts[:, j] + 1
+    boxes[:, 2 * axis], boxes[:, 2 * axis + 1] = starts[:, 2], ends[:, 2] + 1
+    boxes[:, 6] = moved[tuple(starts.T)]
+    return boxes
+
+
+def _quads(boxes: np.ndarray, axis: int, sign: int) -> tuple[np.ndarray, np.ndarray]:
+    # the face of each box facing `sign * axis`, as 4 vertices and 2 triangles wound counter-clockwise from outside
+    u, w = (axis + 1) % 3, (axis + 2) % 3  # e_u x e_w = e_axis
+    plane = boxes[:, 2 * axis + 1] if sign > 0 else boxes[:, 2 * axis]
+    vertices = np.zeros((len(boxes), 4, 3), dtype=np.float64)
+    vertices[:, :, axis] = plane[:, None]
+    for k, (cu, cw) in enumerate([(0, 0), (1, 0), (1, 1), (0, 1)]):
+        vertices[:, k, u] = boxes[:, 2 * u + cu]
+        vertices[:, k, w] = boxes[:, 2 * w + cw]
+    triangles = np.asarray([[0, 1, 2], [0, 2, 3]] if sign > 0 else [[0, 2, 1], [0, 3, 2]])
+    faces = (np.arange(len(boxes))[:, None, None] * 4 + triangles).reshape(-1, 3)
+    return vertices.reshape(-1, 3), faces
+
+
+def greedy_mesh(volume: np.ndarray) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+    """
+    Meshes the surface of a `(X, Y, Z)` volume of labels, where voxel `(x, y, z)` spans `[x, x + 1] x [y, y + 1] x
+    [z, z + 1]`. Faces between two non-empty voxels are hidden and dropped, and the visible faces of each label are
+    merged into rectangles, first along one axis of their plane and then along the other.
+
+    Returns:
+        for each non-empty label, (V, 3) vertices and (F, 3) triangles with normals pointing out of the volume
+    """
+    solid = np.pad(volume != EMPTY, 1)
+    parts: dict[int, list[tuple[np.ndarray, np.ndarray]]] = {}
+    for axis in range(3):
+        for sign in [1, -1]:
+            neighbor = np.roll(solid, -sign, axis=axis)[1:-1, 1:-1, 1:-1]
+            labels = np.where(neighbor, EMPTY, volume)
+            boxes = _merge_along(_runs(labels, (axis + 1) % 3), (axis + 2) % 3)
+            for label in np.unique(boxes[:, 6]).tolist():
+                parts.setdefault(label, []).append(_quads(boxes[boxes[:, 6] == label], axis, sign))
+
+    meshes = {}
+    for label, label_parts in parts.items():
+        offsets = np.cumsum([0] + [len(vertices) for vertices, _ in label_parts[:-1]])
+        meshes[label] = (np.concatenate([vertices for vertices, _ in label_parts]),
+                         np.concatenate([faces + offset for (_, faces), offset in zip(label_parts, offsets)]))
+    return meshes
@@ -30,6 +30,9 @@ def primitive_call(name: Literal["set_cuboid", "spawn_entity"],
     }[name].get(block_type, default_color)  # FIXME outdated
 
     shape = _primitive_call('cube', color=color, scale=scale)  # centered at origin
+    for s in shape:  # `mi_helper` voxelizes the blocks, where air removes earlier blocks
+        s['info']['block_type'] = block_type
+        s['info']['fill'] = fill
 
     # Default to 'min' set_mode
     scale = np.broadcast_to(scale, (3,))
@@ -0,0 +1,173 @@
+# engine-agnostic
+# nonpublic
+from __future__ import annotations
+from typing import Any, Iterable, Iterator, Union
+from type_utils import Shape, T
+import itertools
+import numpy as np
+
+
+def _freeze(value: Any) -> Any:
+    # hashable key for BSDF dedup; dicts are keyed regardless of their order, arrays by content, not identity
+    if isinstance(value, dict):
+        return tuple(sorted(((k, _freeze(v)) for k, v in value.items()), key=lambda item: str(item[0])))
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__, tuple(_freeze(v) for v in value)
+    if isinstance(value, np.ndarray):
+        return 'ndarray', value.dtype.str, value.shape, value.tobytes()
+    try:
+        hash(value)
+    except TypeError:
+        return 'repr', repr(value)
+    return value
+
+
+class ShapeBatch:
+    """
+    Columnar representation of a `Shape`.
+
+    Primitives are stored as an (N, 4, 4) `to_world` array, type codes into a small type table, BSDF codes into a
+    deduplicated BSDF table, and per-primitive `info` provenance. `transform` and `concat` are single NumPy operations
+    instead of one dict copy and one 4x4 matmul per primitive.
+
+    Conversion to and from the list-of-dicts form is lossless up to `to_world` being stored as float64:
+    `ShapeBatch.from_shape(shape).to_shape() == shape` element-wise. As in the list form, `info` dicts are shared
+    (not copied) across transforms, so `register` can append to `info['stack']` in place.
+    """
+
+    def __init__(self, to_world: np.ndarray, type_codes: np.ndarray, types: list[str],
+                 bsdf_codes: np.ndarray, bsdfs: list[dict], extras: list[dict], infos: list[Union[dict, None]]) -> None:
+        self.to_world = to_world  # (N, 4, 4)
+        self.type_codes = type_codes  # (N,), indices into `types`
+        self.types = types
+        self.bsdf_codes = bsdf_codes  # (N,), indices into `bsdfs`, -1 if the primitive has no BSDF
+        self.bsdfs = bsdfs
+        self.extras = extras  # per-primitive keys other than type, to_world, bsdf, info (e.g. p0, p1, block_type)
+        self.infos = infos  # per-primitive provenance, None if the primitive has no `info`
+
+    @classmethod
+    def empty(cls) -> ShapeBatch:
+        return cls(to_world=np.zeros((0, 4, 4)), type_codes=np.zeros((0,), dtype=np.int32), types=[],
+                   bsdf_codes=np.zeros((0,), dtype=np.int32), bsdfs=[], extras=[], infos=[])
+
+    @classmethod
+    def from_shape(cls, shape: Union[Shape, dict, ShapeBatch]) -> ShapeBatch:
+        if isinstance(shape, ShapeBatch):
+            return shape
+        if isinstance(shape, dict):  # hack, same as `concat_shapes`
+            shape = [shape]
+        if len(shape) == 0:
+            return cls.empty()
+
+        types: list[str] = []
+        type_index: dict[str, int] = {}
+        bsdfs: list[dict] = []
+        bsdf_index: dict[Any, int] = {}
+        type_codes = np.empty((len(shape),), dtype=np.int32)
+        bsdf_codes = np.empty((len(shape),), dtype=np.int32)
+        extras = []
+        infos = []
+        for i, s in enumerate(shape):
+            if s['type'] not in type_index:
+                type_index[s['type']] = len(types)
+                types.append(s['type'])
+            type_codes[i] = type_index[s['type']]
+            if 'bsdf' in s:
+                key = _freeze(s['bsdf'])
+                if key not in bsdf_index:
+                    bsdf_index[key] = len(bsdfs)
+                    bsdfs.append(s['bsdf'])
+                bsdf_codes[i] = bsdf_index[key]
+            else:
+                bsdf_codes[i] = -1
+            extras.append({k: v for k, v in s.items() if k not in ('type', 'to_world', 'bsdf', 'info')})
+            infos.append(s.get('info'))
+        to_world = np.stack([np.asarray(s['to_world'], dtype=np.float64) for s in shape], axis=0)
+        return cls(to_world=to_world, type_codes=type_codes, types=types,
+                   bsdf_codes=bsdf_codes, bsdfs=bsdfs, extras=extras, infos=infos)
+
+    def to_shape(self) -> Shape:
+        return [self._primitive(i) for i in range(len(self))]
+
+    def _primitive(self, i: int) -> dict[str, Any]:
+        s = {'type': self.types[self.type_codes[i]], **self.extras[i], 'to_world': self.to_world[i]}
+        if self.bsdf_codes[i] >= 0:
+            s['bsdf'] = self.bsdfs[self.bsdf_codes[i]]
+        if self.infos[i] is not None:
+            s['info'] = self.infos[i]
+        return s
+
+    def __len__(self) -> int:
+        return len(self.infos)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        for i in range(len(self)):
+            yield self._primitive(i)
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[dict[str, Any], ShapeBatch]:
+        if isinstance(item, slice):
+            inds = range(len(self))[item]
+            return ShapeBatch(to_world=self.to_world[item], type_codes=self.type_codes[item], types=self.types,
+                              bsdf_codes=self.bsdf_codes[item], bsdfs=self.bsdfs,
+                              extras=[self.extras[i] for i in inds], infos=[self.infos[i] for i in inds])
+        return self._primitive(range(len(self))[item])
+
+    def __add__(self, other: Union[Shape, ShapeBatch]) -> ShapeBatch:
+        return ShapeBatch.concat([self, other])
+
+    def __radd__(self, other: Union[Shape, ShapeBatch]) -> ShapeBatch:
+        # supports `list + ShapeBatch` and `sum(frames, [])`
+        return ShapeBatch.concat([other, self])
+
+    def __repr__(self):
+        return f'ShapeBatch(n={len(self)}, types={self.types})'
+
+    def transform(self, pose: T) -> ShapeBatch:
+        return ShapeBatch(to_world=np.matmul(np.asarray(pose, dtype=np.float64), self.to_world),
+                          type_codes=self.type_codes, types=self.types,
+                          bsdf_codes=self.bsdf_codes, bsdfs=self.bsdfs,
+                          extras=self.extras, infos=self.infos)
+
+    def append_stack(self, name: str, call_id: Any) -> None:
+        # equivalent to `for elem in shape: elem['info']['stack'].append(...)` without materializing dicts
+        for info in self.infos:
+            info['stack'].append((name, call_id))
+
+    @staticmethod
+    def concat(shapes: Iterable[Union[Shape, dict, ShapeBatch]]) -> ShapeBatch:
+        batches = [b for b in map(ShapeBatch.from_shape, shapes) if len(b) > 0]
+        if len(batches) == 0:
+            return ShapeBatch.empty()
+        if len(batches) == 1:
+            return batches[0]
+
+        types: list[str] = []
+        type_index: dict[str, int] = {}
+        bsdfs: list[dict] = []
+        bsdf_index: dict[Any, int] = {}
+        type_codes = []
+        bsdf_codes = []
+        for b in batches:
+            type_remap = np.empty((len(b.types),), dtype=np.int32)
+            for i, t in enumerate(b.types):
+                if t not in type_index:
+                    type_index[t] = len(types)
+                    types.append(t)
+                type_remap[i] = type_index[t]
+            # the extra trailing entry maps the missing-BSDF code -1 to itself
+            bsdf_remap = np.empty((len(b.bsdfs) + 1,), dtype=np.int32)
+            bsdf_remap[-1] = -1
+            for i, bsdf in enumerate(b.bsdfs):
+                key = _freeze(bsdf)
+                if key not in bsdf_index:
+                    bsdf_index[key] = len(bsdfs)
+                    bsdfs.append(bsdf)
+                bsdf_remap[i] = bsdf_index[key]
+            type_codes.append(type_remap[b.type_codes])
+            bsdf_codes.append(bsdf_remap[b.bsdf_codes])
+
+        return ShapeBatch(to_world=np.concatenate([b.to_world for b in batches], axis=0),
+                          type_codes=np.concatenate(type_codes), types=types,
+                          bsdf_codes=np.concatenate(bsdf_codes), bsdfs=bsdfs,
+                          extras=list(itertools.chain.from_iterable(b.extras for b in batches)),
+                          infos=list(itertools.chain.from_iterable(b.infos for b in batches)))
@@ -4,6 +4,7 @@ from __future__ import annotations
 from typing import Callable, Union
 from math_utils import translation_matrix, _scale_matrix
 from type_utils import Box, ShapeSampler, Shape, T
+from _shape_batch_utils import ShapeBatch
 import numpy as np
 import logging
 logger = logging.getLogger(__name__)
@@ -149,23 +150,48 @@ placeholder.implement(lambda: lambda center, scale, color=(0, 1, 0): [{
 }])
 
 
+def _compute_corners(shape: Shape) -> tuple[np.ndarray, np.ndarray]:
+    from engine.utils.bbox_utils import compute_aabbs
+    if isinstance(shape, ShapeBatch):
+        types = [shape.types[code] for code in shape.type_codes]
+        box_min, box_max, analytic = compute_aabbs(types, shape.to_world, shape.extras)
+    else:
+        to_world = np.zeros((len(shape), 4, 4))
+        for i, s in enumerate(shape):
+            to_world[i] = np.asarray(getattr(s['to_world'], 'matrix', s['to_world']))
+        box_min, box_max, analytic = compute_aabbs([s['type'] for s in shape], to_world, shape)
+    if not analytic.all():
+        # meshes (e.g. `ply`) need to be loaded to be bounded
+        import mitsuba as mi
+        from mi_helper import _preprocess_shape
+        inds = np.flatnonzero(~analytic)
+        mesh_shape = _preprocess_shape([shape[i] for i in inds])
+        scene_dict = {'type': 'scene', **{f'{i:02d}': s for i, s in zip(inds, mesh_shape)}}
+        for s in mi.load_dict(scene_dict).shapes():
+            box_min[int(s.id())] = np.asarray(s.bbox().min)
+            box_max[int(s.id())] = np.asarray(s.bbox().max)
+    return box_min, box_max
+
+
 def compute_bbox(shape: Shape) -> 'BBox':
-    from mi_helper import _preprocess_shape
-    from engine.utils.mitsuba_utils import compute_bbox as _compute_bbox
-    shape = _preprocess_shape(shape)
-    scene_dict = {'type': 'scene', **{f'{i:02d}': s for i, s in enumerate(shape)}}
-    return _compute_bbox(scene_dict)
+    from engine.utils.bbox_utils import bbox_from_corners
+    if len(shape) == 0:
+        return bbox_from_corners(np.ones((3,)) * -.5, np.ones((3,)) * .5)
+    box_min, box_max = _compute_corners(shape)
+    return bbox_from_corners(box_min.min(axis=0), box_max.max(axis=0))
 
 
 def compute_bboxes(shape: Shape) -> list['BBox']:
-    from mi_helper import _preprocess_shape
-    from engine.utils.mitsuba_utils import compute_bboxes as _compute_bboxes
-    shape = _preprocess_shape(shape)
-    scene_dict = {'type': 'scene', **{f'{i:02d}': s for i, s in enumerate(shape)}}
-    return _compute_bboxes(scene_dict)
+    from engine.utils.bbox_utils import bbox_from_corners
+    if len(shape) == 0:
+        return []
+    box_min, box_max = _compute_corners(shape)
+    return [bbox_from_corners(lo, hi) for lo, hi in zip(box_min, box_max)]
 
 
 def transform_shape(shape: Shape, pose: T) -> Shape:
+    if isinstance(shape, ShapeBatch):
+        return shape.transform(pose)
     return [
         {k: v for k, v in s.items() if k != "to_world"}
         | {"to_world": np.asarray(pose) @ s["to_world"]}
@@ -1,11 +1,14 @@
 from __future__ import annotations
 from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import wraps
 import numpy as np
 import uuid
 from typing import Callable, Optional
 from type_utils import Shape, Box, ShapeSampler
 from shape_utils import concat_shapes
+from _shape_batch_utils import ShapeBatch
+from engine.constants import MEMOIZE as _MEMOIZE
 import inspect
 import random
 
@@ -18,7 +21,14 @@ animation_func = None
 library = {}
 
 TRACK_HISTORY = False
+TRACE: Optional[dict[str, set[str]]] = None  # maps each executed function to the functions it called via `library_call`
+_call_stack: ContextVar[tuple[str, ...]] = ContextVar('call_stack', default=())  # registered functions being executed
 LOCK = False
+# caches `library_call` results on the function name, args and kwargs; calls run under the global RNG, and a call
+# that draws from `np.random` or `random` (and so every call above it) is re-executed rather than cached
+MEMOIZE = _MEMOIZE
+_memo: dict[tuple, Shape] = {}
+memo_stats: dict[str, dict[str, int]] = {}  # maps function name to hit and miss counts
 RR = Callable[['RR'], Callable[[int], Shape]]
 
 
@@ -62,24 +72,12 @@ def if_else(c: bool, true_fn: Callable[[], Shape], false_fn: Callable[[], Shape]
     return true_fn() if c else false_fn()
 
 
-def get_caller_name(self: Optional[str]) -> str:
-    for depth in range(1, len(inspect.stack())):
-        caller = inspect.stack()[depth]
-        if caller.function == 'library_call':
-            caller_args = inspect.getargvalues(caller.frame)
-            caller = caller_args.locals['func_name']
-            if self is not None and caller == self:
-                # this case should only be hit once
-                continue
-            else:
-                break
-        else:
-            caller = caller.function
-            if caller not in library:
-                continue
-            else:
-                break
-    return caller
+def get_caller_name(self: Optional[str]) -> Optional[str]:
+    # the innermost registered function being executed, skipping `self` once
+    stack = _call_stack.get()
+    if self is not None and len(stack) > 0 and stack[-1] == self:
+        stack = stack[:-1]
+    return stack[-1] if len(stack) > 0 else None
 
 
 def register(docstring: Optional[str] = None):
@@ -96,9 +94,17 @@ def register(docstring: Optional[str] = None):
 
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # caller = get_caller_name(func.__name__)
-            # print(f'{caller=} calls {func.__name__}')
-            ret = func(*args, **kwargs)  # FIXME should use the function in the library
+            callers = _call_stack.get()
+            token = _call_stack.set(callers + (func.__name__,))
+            if TRACE is not None:
+                TRACE.setdefault(func.__name__, set())
+            try:
+                if MEMOIZE and not FAKE_CALL:
+                    ret = _memoized_call(func, args, kwargs)
+                else:
+                    ret = func(*args, **kwargs)  # FIXME should use the function in the library
+            finally:
+                _call_stack.reset(token)
             if LOCK is False:  # and the call is successful
                 library[func.__name__]['last_call'] = (args, kwargs)
 
@@ -107,11 +113,14 @@ def register(docstring: Optional[str] = None):
                 # something is wrong
                 print(f"[ERROR] {func.__name__} returned None")
                 return ret
-            for elem in ret:
-                elem['info']['stack'].append((func.__name__, call_id))
+            if isinstance(ret, ShapeBatch):
+                ret.append_stack(func.__name__, call_id)
+            else:
+                for elem in ret:
+                    elem['info']['stack'].append((func.__name__, call_id))
 
             if TRACK_HISTORY:
-                library[func.__name__]['hist_calls'].append((args, kwargs, get_caller_name(func.__name__)))
+                library[func.__name__]['hist_calls'].append((args, kwargs, callers[-1] if len(callers) > 0 else None))
             # print(f'[INFO] calling {func.__name__}', library[func.__name__]['hist_calls'][-1])
             if len(library[func.__name__]['hist_calls']) > 1000:
                 print(f"[WARNING] {func.__name__} has more than 1000 calls")
@@ -221,19 +230,170 @@ def library_call(func_name: str, **kwargs) -> Shape:
             if library[alt_func_name]['docstring'] == func_name:
                 # print(f'WARNING: {func_name=} not found in library but found an alternative: {alt_func_name=}')
                 # with set_seed(0):
-                return library[alt_func_name]['__target__'](**kwargs)
+                return _traced_call(alt_func_name, kwargs)
 
         for alt_func_name in library.keys():
             if library[alt_func_name]['docstring'].split(';')[0] == func_name:
                 # with set_seed(0):
-                return library[alt_func_name]['__target__'](**kwargs)
+                return _traced_call(alt_func_name, kwargs)
         print(f'WARNING: {func_name=} not found in library')
 
         return []
     # with set_seed(0):
+    return _traced_call(func_name, kwargs)
+
+
+def _traced_call(func_name: str, kwargs: dict) -> Shape:
+    if TRACE is not None:
+        callers = _call_stack.get()
+        if len(callers) > 0:
+            TRACE.setdefault(callers[-1], set()).add(func_name)
     return library[func_name]['__target__'](**kwargs)
 
 
+def _canonicalize(value):
+    # raises TypeError for values that cannot be part of a memoization key, e.g. lambdas
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return 'ndarray', value.shape, tuple(value.ravel().tolist())
+    if isinstance(value, (list, tuple)):
+        return tuple(_canonicalize(v) for v in value)
+    if isinstance(value, dict):
+        return 'dict', tuple(sorted((k, _canonicalize(v)) for k, v in value.items()))
+    raise TypeError(f'cannot memoize argument of type {type(value)}')
+
+
+def _memo_key(func_name: str, args: tuple, kwargs: dict) -> Optional[tuple]:
+    try:
+        call_key = _canonicalize(args), _canonicalize(kwargs)
+    except TypeError:
+        return None
+    import engine_utils
+    # results also depend on the current library, which `make_new_library` and `animation_library_call` swap out
+    library_key = id(engine_utils.inner_primitive_call), tuple((k, id(v['__target__'])) for k, v in library.items())
+    return func_name, call_key, library_key
+
+
+def _rng_state() -> tuple:
+    state_np = np.random.get_state()
+    return state_np[0], state_np[1].copy(), *state_np[2:], random.getstate()
+
+
+def _rng_state_unchanged(state: tuple) -> bool:
+    current = _rng_state()
+    return all(np.array_equal(a, b) if isinstance(a, np.ndarray) else a == b for a, b in zip(state, current))
+
+
+def _copy_shape(shape: Shape, remap_call_ids: bool) -> Shape:
+    # primitives share transforms and BSDFs, which are never modified in place, but get their own provenance;
+    # primitives that share an `info` keep sharing one copy, so callers extend their stacks as often as without a cache
+    call_ids = {}
+    infos = {}
+
+    def copy_info(info):
+        if info is None:
+            return info
+        if id(info) not in infos:
+            copied = {**info}
+            if 'stack' in info:
+                stack = info['stack']
+                if remap_call_ids:
+                    stack = [(name, call_ids.setdefault(call_id, uuid.uuid4())) for name, call_id in stack]
+                copied['stack'] = list(stack)
+            infos[id(info)] = copied
+        return infos[id(info)]
+
+    if isinstance(shape, ShapeBatch):
+        return ShapeBatch(to_world=shape.to_world, type_codes=shape.type_codes, types=shape.types,
+                          bsdf_codes=shape.bsdf_codes, bsdfs=shape.bsdfs, extras=shape.extras,
+                          infos=[copy_info(info) for info in shape.infos])
+    return [{**s, 'info': copy_info(s['info'])} if 'info' in s else {**s} for s in shape]
+
+
+def _memoized_call(func: ShapeSampler, args: tuple, kwargs: dict) -> Shape:
+    key = _memo_key(func.__name__, args, kwargs)
+    stats = memo_stats.setdefault(func.__name__, {'hits': 0, 'misses': 0})
+    if key is not None and key in _memo:
+        stats['hits'] += 1
+        # a hit is a new call, so nested calls get fresh call ids as they would when re-executed
+        return _copy_shape(_memo[key], remap_call_ids=True)
+    stats['misses'] += 1
+    rng_state = _rng_state()
+    ret = func(*args, **kwargs)
+    # a call that drew random numbers is not cached, so that repeated calls keep drawing new ones as without a cache
+    if key is not None and ret is not None and _rng_state_unchanged(rng_state):
+        # snapshot before this call and its callers extend the provenance stacks
+        _memo[key] = _copy_shape(ret, remap_call_ids=False)
+    return ret
+
+
+def clear_memo():
+    _memo.clear()
+    memo_stats.clear()
+
+
+def get_memo_stats() -> dict[str, int]:
+    return {'hits': sum(s['hits'] for s in memo_stats.values()),
+            'misses': sum(s['misses'] for s in memo_stats.values()),
+            'entries': len(_memo)}
+
+
+def create_static_nodes(paths: Optional[list[str]] = None) -> Optional[dict]:
+    """
+    Builds the call graph of the registered functions from the source files that define them, without running
+    anything. Returns None if it cannot be derived statically, e.g. if some `library_call` name is computed at runtime;
+    callers then trace an execution with `set_trace_enabled` instead.
+    """
+    from _shape_utils import Hole
+    from engine.utils.parse_utils import extract_call_graph
+
+    if paths is None:
+        paths = []
+        for entry in library.values():
+            try:
+                path = inspect.getsourcefile(inspect.unwrap(entry['__target__']))
+            except TypeError:
+                path = None
+            if path is None:
+                return None
+            if path not in paths:
+                paths.append(path)
+    programs = []
+    for path in paths:
+        with open(path, 'r') as f:
+            programs.append(f.read())
+    try:
+        graph = extract_call_graph(*programs)
+    except SyntaxError:
+        return None
+    if graph is None or set(graph.keys()) != set(library.keys()):
+        return None
+
+    library_equiv = {}
+    for name in library.keys():
+        node = Hole(name=name, docstring=library[name]['docstring'], check=library[name]['check'], normalize=False)
+        node.fn = library[name]['__target__']
+        node.children = set()
+        library_equiv[name] = node
+    for name, node in library_equiv.items():
+        for child_name in graph[name]['children']:
+            node.children.add(library_equiv[child_name])
+            library_equiv[child_name].add_parent(node)
+    return library_equiv
+
+
+def clear_library():
+    # restores the registry to its import-time state, e.g. between programs executed in the same process
+    global animation_func
+    library.clear()
+    animation_func = None
+    _children.clear()
+    clear_memo()
+
+
 def clear_history():
     for name in library.keys():
         library[name]['hist_calls'].clear()
@@ -250,6 +410,22 @@ def set_track_history_enabled(mode: bool):
         TRACK_HISTORY = orig_track_history
 
 
+@contextmanager
+def set_trace_enabled():
+    """
+    Records the call graph while the program runs normally: yields a dict mapping each executed registered function
+    to the names of the functions it called via `library_call`.
+    """
+    global TRACE
+    orig_trace = TRACE
+    TRACE = {}
+    clear_memo()  # a memoized result computed before tracing would hide the calls beneath it
+    try:
+        yield TRACE
+    finally:
+        TRACE = orig_trace
+
+
 @contextmanager
 def set_lock_enabled(mode: bool):
     global LOCK
@@ -261,6 +437,17 @@ def set_lock_enabled(mode: bool):
         LOCK = orig_lock
 
 
+@contextmanager
+def set_memoize_enabled(mode: bool):
+    global MEMOIZE
+    orig_memoize = MEMOIZE
+    MEMOIZE = mode
+    try:
+        yield memo_stats
+    finally:
+        MEMOIZE = orig_memoize
+
+
 @contextmanager
 def set_fake_call_enabled(mode: bool):
     global FAKE_CALL
@@ -13,7 +13,7 @@ import numpy as np
 import random
 import math
 
-from dsl_utils import library, set_lock_enabled, set_fake_call_enabled
+from dsl_utils import library, set_lock_enabled, set_trace_enabled, create_static_nodes
 from _shape_utils import Hole  # don't use the library here
 
 
@@ -32,50 +32,46 @@ def parse_program(path: str) -> tuple[dict[str, dict], dict[str, Hole]]:
     program = importlib.util.module_from_spec(spec)
     spec.loader.exec_module(program)
 
-    # register all functions including local ones
+    library_equiv = create_static_nodes(paths=[tmp_path.as_posix()])
+    if library_equiv is not None:
+        return library, library_equiv
+
+    # register all functions including local ones, and trace which functions each of them calls
 
     library_equiv: dict[str, Hole] = {}
-    while len(library_equiv) < len(library):
-        for name in list(library.keys()):
-            if name in library_equiv:
-                continue
-            node = Hole(name=name, docstring=library[name]['docstring'], check=library[name]['check'], normalize=False)
-            # manually implement the function
-            node.fn = library[name]['__target__']
-            library_equiv[name] = node
-
-            try:
-                _ = node()
-            except TypeError:
+    with set_trace_enabled() as trace:
+        while len(library_equiv) < len(library):
+            names = [name for name in library.keys() if name not in library_equiv]
+            for name in names:
+                node = Hole(name=name, docstring=library[name]['docstring'], check=library[name]['check'], normalize=False)
+                # manually implement the function
+                node.fn = library[name]['__target__']
+                library_equiv[name] = node
+
+            # callers are usually registered after their callees, so run them first; a function already executed by a
+            # caller has been traced and is not run again
+            for name in reversed(names):
+                if name in trace:
+                    continue
+                node = library_equiv[name]
                 try:
-                    args, kwargs = library[name]['last_call']
-                    with set_lock_enabled(True):
-                        _ = node(*args, **kwargs)
+                    _ = node()
+                except TypeError:
+                    try:
+                        args, kwargs = library[name]['last_call']
+                        with set_lock_enabled(True):
+                            _ = node(*args, **kwargs)
+                    except Exception as e:
+                        print(e)
+                        traceback.print_exc()
                 except Exception as e:
                     print(e)
                     traceback.print_exc()
-            except Exception as e:
-                print(e)
-                traceback.print_exc()
     print(library_equiv)
     for name, node in library_equiv.items():
-        with set_fake_call_enabled(True) as _children:
-            _children.clear()
-            try:
-                _ = node()
-            except TypeError:
-                try:
-                    args, kwargs = library[node.name]['last_call']
-                    with set_lock_enabled(True):
-                        _ = node(*args, **kwargs)
-                except Exception as e:
-                    print(e)
-                    traceback.print_exc()
-            child_names = _children.copy()
-            _children.clear()
         # manually record the dependency as the program won't call `create_hole`
         node.children = set()
-        for child_name in child_names:
+        for child_name in trace.get(name, ()):
             child_node = library_equiv[child_name]
             node.children.add(child_node)
             child_node.add_parent(node)
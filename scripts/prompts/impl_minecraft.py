@@ -19,7 +19,8 @@ def main():
     from engine.utils.graph_utils import strongly_connected_components, get_root
     # from tu.train_setup import set_seed
     from engine.utils.train_utils import set_seed
-    from dsl_utils import library, animation_func
+    from dsl_utils import library, animation_func, get_memo_stats
+    from engine.constants import MEMOIZE
     from minecraft_helper import execute, execute_animation
 
     set_seed(0)
@@ -53,6 +54,8 @@ def main():
 
         node = library_equiv[root]
         execute(node(), save_dir=(save_dir / node.name).as_posix(), description=node.name)
+        if MEMOIZE:
+            print(f'[INFO] memoization stats: {get_memo_stats()}')
 
         save_dir = Path(__file__).parent / 'extra_renderings'
         for node in library_equiv.values():
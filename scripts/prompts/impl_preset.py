@@ -1,5 +1,4 @@
 from pathlib import Path
-import numpy as np
 
 from helper import *
 import mitsuba as mi
@@ -46,13 +45,13 @@ def core(engine_modes: list[Literal['neural', 'lmd', 'omost', 'loosecontrol', 'd
         cuda_is_available = False
 
     from PIL import Image
-    from dsl_utils import library, animation_func, set_seed
+    from dsl_utils import library, animation_func, set_seed, get_memo_stats
     from impl_utils import create_nodes, run, redirect_logs
     from engine.utils.graph_utils import strongly_connected_components, get_root, calculate_node_depths
     from impl_helper import make_new_library
     from prompt_helper import load_program
     from impl_parse_dependency import parse_dependency
-    from engine.constants import ENGINE_MODE
+    from engine.constants import ENGINE_MODE, MEMOIZE
     try:
         from tu.loggers.utils import print_vcv_url
         from tu.loggers.utils import setup_vi
@@ -68,8 +67,7 @@ def core(engine_modes: list[Literal['neural', 'lmd', 'omost', 'loosecontrol', 'd
                 print('[INFO]', str(args) + str(kwargs))
         setup_vi = lambda x: (None, Helper())
 
-    from mi_helper import execute_from_preset
-    import imageio
+    from mi_helper import execute_from_preset, execute_animation_from_preset, dump_render_cache_stats
     save_dir = Path(save_dir)
     save_dir.mkdir(exist_ok=True)
     print_vcv_url(save_dir.as_posix())
@@ -87,21 +85,15 @@ def core(engine_modes: list[Literal['neural', 'lmd', 'omost', 'loosecontrol', 'd
         print(f'[INFO] rendering animation...')
         frames = list(animation_func())
         name = animation_func.__name__
-        final_frame_paths = []
         if len(frames) > 8:
             frame_skip = int(len(frames) / 8)
             frames = frames[::frame_skip]
-        out = execute_from_preset(sum(frames, []), save_dir=None)
-        for i in range(len(frames)):
-            frame_save_dir = save_dir / name / f'{i:02d}'
-            _ = execute_from_preset(frames[i], save_dir=frame_save_dir.as_posix(), prev_out=out)
-            # TODO change `sensor_info`
-            traj_paths = list(sorted(frame_save_dir.glob('rendering_traj_[0-9][0-9][0-9].png')))
-            final_frame_paths.append(traj_paths[0])
-            if i == 0:
-                imageio.mimsave((save_dir / f'{name}_static.gif').as_posix(), [np.asarray(Image.open(p)) for p in traj_paths], fps=4, loop=0)
-                out['sensors'] = {'rendering_traj_000': out['sensors']['rendering_traj_000']}
-        imageio.mimsave((save_dir / f'{name}_animation.gif').as_posix(), [np.asarray(Image.open(p)) for p in final_frame_paths], fps=len(final_frame_paths) / 2, loop=0)
+        out = execute_from_preset(sum(frames, []), save_dir=None)  # normalization and sensors cover all frames
+        execute_animation_from_preset(
+            frames, save_dir=(save_dir / name).as_posix(), prev_out=out,
+            static_gif_path=(save_dir / f'{name}_static.gif').as_posix(),
+            animation_gif_path=(save_dir / f'{name}_animation.gif').as_posix())
+        dump_render_cache_stats(save_dir.as_posix())
 
         return
 
@@ -163,6 +155,9 @@ def core(engine_modes: list[Literal['neural', 'lmd', 'omost', 'loosecontrol', 'd
     out = execute_from_preset(frame, save_dir=None, preset_id='rover_background')  # compute normalization and sensors
     out = run(root, save_dir=save_dir.as_posix(), preset_id='rover_background', overwrite=overwrite, prev_out=out, new_library=new_library)
     print(f'[INFO] executing `{root}` done!')
+    if MEMOIZE:
+        print(f'[INFO] memoization stats: {get_memo_stats()}')
+    dump_render_cache_stats(save_dir.as_posix())
 
     for name in library.keys():
         continue  # FIXME
@@ -18,7 +18,7 @@ try:
 except:
     print("[WARNING] Failed to import neural pipelines.")
     import traceback; traceback.print_exc()
-from dsl_utils import library, set_fake_call_enabled, set_seed, set_track_history_enabled, clear_history, animation_library_call
+from dsl_utils import library, set_seed, set_trace_enabled, animation_library_call, create_static_nodes
 from math_utils import _scale_matrix, translation_matrix, rotation_matrix, identity_matrix, align_vectors
 from _shape_utils import transform_shape, compute_bbox, Hole  # don't use the library here
 import inspect
@@ -528,6 +528,12 @@ def get_transform_cylinder(s) -> T:
 
 
 def create_nodes(roots: Optional[list[str]] = None) -> dict[str, Hole]:
+    library_equiv = create_static_nodes()
+    if library_equiv is not None:
+        print(f'[INFO] parsed the call graph of {len(library_equiv)} functions from the program source')
+        return library_equiv
+    print(f'[INFO] cannot parse the call graph statically, tracing the program')
+
     # first create nodes with no edges
     library_equiv: dict[str, Hole] = {}
     while len(library_equiv) < len(library):
@@ -614,42 +620,25 @@ def create_nodes(roots: Optional[list[str]] = None) -> dict[str, Hole]:
             if len(roots) != 1:
                 print(f'[ERROR] number of roots {len(roots)} != 1, {roots=}')
             # assert len(roots) == 1, roots
-        with set_track_history_enabled(True):
+        # a single traced run records which functions each function calls
+        with set_trace_enabled() as trace:
             for root in roots:
                 print(f'[INFO] calling node (supposed to be root): {root}')
                 _ = library_call(root)
-        hist_calls = {func_name: library[func_name]['hist_calls'].copy() for func_name in library.keys()}  # freeze the list of `hist_calls`
-        clear_history()
-
-        def invoke_calls(func_name):
-            if len(hist_calls[func_name]) == 0:
-                print(f'[INFO] {func_name=} has no last call')
-            print(f'[INFO] registering children for {func_name} with {len(hist_calls[func_name])} hist calls')
-            for call in hist_calls[func_name]:
-                # print(f'[INFO] registering children for {func_name} {call[0]} {call[1]}')
-                _ = library_equiv[func_name](*call[0], **call[1])
 
     # register edges
     for name, node in library_equiv.items():
         if node.children is not None:
             print(f'[INFO] {name=} already has children')
             continue
-        with set_fake_call_enabled(True) as _children:
-            _children.clear()
-            invoke_calls(name)
-            child_names = _children.copy()
-            _children.clear()
+        if name not in trace:
+            print(f'[INFO] {name=} was not called')
         # manually record the dependency as the program won't call `create_hole`
         node.children = set()
-        for child_name in child_names:
+        for child_name in trace.get(name, ()):
             if child_name not in library_equiv:
-                # hack
-                print(f"[ERROR] {child_name=} not in library_equiv, trying to find an alternative")
-                for alt_func_name in library.keys():
-                    if library[alt_func_name]['docstring'] == child_name:
-                        print(f"[ERROR] {child_name=} not in library_equiv but found an alternative: {alt_func_name=}")
-                        child_name = alt_func_name
-                        break
+                print(f"[ERROR] {child_name=} not in library_equiv, registered after the nodes were created")
+                continue
             child_node = library_equiv[child_name]
             node.children.add(child_node)
             child_node.add_parent(node)
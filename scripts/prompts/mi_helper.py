@@ -7,20 +7,26 @@ import mitsuba as mi
 from math_utils import _scale_matrix, translation_matrix, rotation_matrix, identity_matrix
 from type_utils import T, Shape, Box, P
 from _shape_utils import placeholder, primitive_call, transform_shape, compute_bbox
+from _shape_batch_utils import _freeze
 from PIL import Image, ImageDraw
+import imageio
+import shutil
 from tqdm import tqdm
 import numpy as np
 import numpy.typing
-from engine.constants import ENGINE_MODE, PROJ_DIR
+from engine.constants import ENGINE_MODE, PROJ_DIR, RENDER_CACHE, RENDER_CACHE_DIR, RENDER_CACHE_MAX_GB
+from engine.utils.render_cache import RenderCache, file_digest
 import xml.etree.ElementTree as ET
 import hashlib
-import uuid
-from contextlib import redirect_stdout, contextmanager
+from contextlib import contextmanager
+from functools import lru_cache
 import copy
 import sys
 import os
-from engine.utils.mitsuba_utils import set_bsdf_refs, set_scene_dict_default, set_auto_camera
+from engine.utils.mitsuba_utils import set_bsdf_refs, set_scene_dict_default, set_auto_camera, xml_to_dict
 from engine.utils.type_utils import BBox
+from engine.utils.voxel_grid import VoxelGrid
+from engine.utils.voxel_mesh import greedy_mesh
 # from engine.utils.camera_utils import orbit_camera
 
 __all__ = ['execute']
@@ -44,6 +50,10 @@ RESOLUTION = 512
 FOV = 49.1
 ELEVATION = -20
 REL_CAM_RADIUS = 2
+INSTANCING = True  # emit a `shapegroup` per repeated `library_call` subtree and an `instance` per placement
+INSTANCING_MIN_SIZE = 2  # subtrees with fewer primitives are cheaper to keep flat
+VOXEL_MESHING = True  # in `mi_from_minecraft` mode, render the resolved blocks as one mesh per color instead of a cube per cuboid
+PROJECT_SINGLE_PASS = False  # `project` renders shape indices once per sensor instead of each primitive alone
 
 
 def orbit_camera(elevation, azimuth, radius=1, is_degree=True, target=None):
@@ -75,6 +85,91 @@ def _preprocess_shape(shape: Shape, global_transform: Union[T, None] = None) ->
     ]
 
 
+def _similarity_frame(to_world: np.ndarray) -> Optional[np.ndarray]:
+    # closest rotation (polar decomposition) scaled by the mean singular value; for any placement `G` made of
+    # rotations, translations and uniform scaling, `_similarity_frame(G @ M) == G @ _similarity_frame(M)`
+    u, sigma, vh = np.linalg.svd(to_world[:3, :3])
+    if sigma.mean() < 1e-8:
+        return None
+    frame = np.eye(4)
+    frame[:3, :3] = sigma.mean() * (u @ vh)
+    frame[:3, 3] = to_world[:3, 3]
+    return frame
+
+
+def _find_repeated_subtrees(shape: Shape, min_size: int = INSTANCING_MIN_SIZE) -> list[dict]:
+    """
+    Finds `library_call` subtrees that occur more than once, up to a placement made of rotations, translations and
+    uniform scaling. Subtrees are read from `info['stack']`; two subtrees are identical if their primitives agree on
+    type, BSDF, parameters, and transform relative to the frame of their first primitive.
+
+    Returns:
+        one dict per repeated subtree, with 'local': (k, 4, 4) prototype transforms relative to the placement frame,
+        'indices': the k primitive indices of each placement, and 'frames': the (4, 4) transform of each placement.
+        Placements are disjoint; larger subtrees take precedence over the subtrees nested in them.
+        Placements that share one `info`, e.g. copies of a single `library_call` result made with `transform_shape`,
+        carry the same call id and are treated as one subtree, so they are never instanced against each other.
+    """
+    shape = list(shape)
+    to_world = np.stack([np.asarray(getattr(s['to_world'], 'matrix', s['to_world']), dtype=np.float64)
+                         for s in shape]) if len(shape) > 0 else np.zeros((0, 4, 4))
+    calls: dict[tuple, list[int]] = {}
+    for i, s in enumerate(shape):
+        for call in (s.get('info') or {}).get('stack', []):
+            inds = calls.setdefault(tuple(call), [])
+            if len(inds) == 0 or inds[-1] != i:  # `info` may be shared by several placements of the same call
+                inds.append(i)
+
+    placements_by_content: dict[bytes, list[tuple[list[int], np.ndarray, np.ndarray]]] = {}
+    for inds in dict.fromkeys(tuple(inds) for inds in calls.values() if len(inds) >= min_size):
+        if any(shape[i]['type'] in ('linearcurve', 'bsplinecurve') for i in inds):
+            continue
+        frame = _similarity_frame(to_world[inds[0]])
+        if frame is None:
+            continue
+        if np.linalg.det(frame[:3, :3]) < 0 and any(shape[i]['type'] == 'sphere' for i in inds):
+            continue  # Mitsuba flips the normals of mirrored spheres, but not of spheres in a mirrored instance
+        local = np.linalg.inv(frame) @ to_world[list(inds)]
+        content = hashlib.sha256()
+        for i, rounded in zip(inds, np.round(local, 5) + 0.):  # `+ 0.` maps -0. to 0.
+            content.update(repr(_freeze({k: v for k, v in shape[i].items() if k not in ('to_world', 'info')})).encode())
+            content.update(rounded.tobytes())
+        placements_by_content.setdefault(content.digest(), []).append((list(inds), frame, local))
+
+    assigned = np.zeros((len(shape),), dtype=bool)
+    groups = []
+    for placements in sorted(placements_by_content.values(), key=lambda p: -len(p[0][0])):
+        chosen = []
+        for inds, frame, local in placements:
+            if not assigned[inds].any():
+                assigned[inds] = True
+                chosen.append((inds, frame, local))
+        if len(chosen) < 2:
+            assigned[[i for inds, _, _ in chosen for i in inds]] = False
+            continue
+        groups.append({'local': chosen[0][2], 'indices': [p[0] for p in chosen], 'frames': [p[1] for p in chosen]})
+    return groups
+
+
+def _instanced_scene_dict(shape: Shape, groups: list[dict]) -> dict:
+    # `shape` is preprocessed and indexed as in `_find_repeated_subtrees`; the prototype of each group is its
+    # first placement, with `to_world` relative to the placement frame
+    scene_dict = {}
+    instanced = set()
+    for g, group in enumerate(groups):
+        group_id = f'shapegroup_{g:02d}'
+        scene_dict[group_id] = {'type': 'shapegroup', **{
+            f'{j:02d}': {**shape[i], 'to_world': mi.scalar_rgb.Transform4f(local)}
+            for j, (i, local) in enumerate(zip(group['indices'][0], group['local']))}}
+        for k, (inds, frame) in enumerate(zip(group['indices'], group['frames'])):
+            scene_dict[f'{group_id}_instance_{k:03d}'] = {'type': 'instance',
+                                                          'shapegroup': {'type': 'ref', 'id': group_id},
+                                                          'to_world': mi.scalar_rgb.Transform4f(frame)}
+            instanced.update(inds)
+    scene_dict.update({f'{i:02d}': s for i, s in enumerate(shape) if i not in instanced})
+    return scene_dict
+
+
 def render_depth(shape: Shape, save_dir: Union[str, None],
                  sensors: dict[str, mi.Sensor],
                  normalization: Union[T, None] = None,
@@ -115,6 +210,13 @@ def project(shape: Shape, save_dir: Union[str, None],
     if normalization is not None:
         shape = transform_shape(shape, normalization)
     shape = _preprocess_shape(shape)
+    if PROJECT_SINGLE_PASS:
+        boxes_all, segm_maps_all, depth_maps_all = _project_single_pass(shape, sensors)
+        for sensor_name in sensors.keys():
+            _save_boxes_overlay(boxes_all[sensor_name], segm_maps_all[sensor_name],
+                                save_to=save_dir / f'sensor_{sensor_name}_shape_all.png')
+        return boxes_all, segm_maps_all, depth_maps_all
+
     boxes_all: dict[str, list[BBox]] = {}
     segm_maps_all: dict[str, list[np.typing.NDArray[np.bool_]]] = {}
     depth_maps_all: dict[str, list[np.typing.NDArray[np.float32]]] = {}
@@ -154,29 +256,86 @@ def project(shape: Shape, save_dir: Union[str, None],
                         draw.rectangle([x_min, y_min, x_max, y_max], outline="red", width=2)
                         disp.save(save_to.with_suffix('.png').as_posix())
 
-                    box = BBox(center=np.asarray((x_min + x_max) * .5, (y_min + y_max) * .5),
-                               size=max(x_max - x_min, y_max - y_min),
-                               min=np.asarray((x_min, y_min)),
-                               max=np.asarray((x_max, y_max)),
-                               sizes=np.asarray((x_max - x_min, y_max - y_min)))
+                    box = _bbox_2d(x_min, x_max, y_min, y_max)
 
                 boxes.append(box)
                 segm_maps.append(segm)
                 depth_maps.append(depth)
 
-        disp_all = Image.new("RGB", tuple(mi.Bitmap(image).size()), "white")
-        draw_all = ImageDraw.Draw(disp_all)
-        for box in boxes:
-            draw_all.rectangle([box.min[0], box.min[1], box.max[0], box.max[1]], outline="red", width=2)
+        _save_boxes_overlay(boxes, segm_maps, save_to=save_dir / f'sensor_{sensor_name}_shape_all.png')
+    return boxes_all, segm_maps_all, depth_maps_all
 
-        disp_all = torchvision.transforms.functional.to_pil_image(
-            torchvision.utils.draw_segmentation_masks(
-                image=torchvision.transforms.functional.pil_to_tensor(disp_all),
-                masks=torch.tensor(np.stack(segm_maps, axis=0)))
-        )
 
-        save_to = save_dir / f'sensor_{sensor_name}_shape_all.png'
-        disp_all.save(save_to)
+def _bbox_2d(x_min, x_max, y_min, y_max) -> BBox:
+    return BBox(center=np.asarray((x_min + x_max) * .5, (y_min + y_max) * .5),
+                size=max(x_max - x_min, y_max - y_min),
+                min=np.asarray((x_min, y_min)),
+                max=np.asarray((x_max, y_max)),
+                sizes=np.asarray((x_max - x_min, y_max - y_min)))
+
+
+def _save_boxes_overlay(boxes: list[BBox], segm_maps: list[np.typing.NDArray[np.bool_]], save_to: Path):
+    h, w = segm_maps[0].shape
+    disp_all = Image.new("RGB", (w, h), "white")
+    draw_all = ImageDraw.Draw(disp_all)
+    for box in boxes:
+        draw_all.rectangle([box.min[0], box.min[1], box.max[0], box.max[1]], outline="red", width=2)
+
+    disp_all = torchvision.transforms.functional.to_pil_image(
+        torchvision.utils.draw_segmentation_masks(
+            image=torchvision.transforms.functional.pil_to_tensor(disp_all),
+            masks=torch.tensor(np.stack(segm_maps, axis=0)))
+    )
+    disp_all.save(save_to)
+
+
+def _id_sensor(sensor: mi.Sensor) -> mi.Sensor:
+    # same camera with a box filter, so that with one sample per pixel each pixel holds exactly one shape index
+    film_size = np.asarray(sensor.film().size())
+    return mi.load_dict({
+        'type': 'perspective',
+        'to_world': sensor.world_transform(),
+        'fov': np.array(mi.traverse(sensor)['x_fov']).item(),
+        'fov_axis': 'x',
+        'film': {
+            'type': 'hdrfilm',
+            'width': int(film_size[0]),
+            'height': int(film_size[1]),
+            'rfilter': {'type': 'box'},
+        }
+    })
+
+
+def _project_single_pass(shape: Shape, sensors: dict[str, mi.Sensor],
+) -> tuple[dict[str, list[BBox]], dict[str, list[np.typing.NDArray[np.bool_]]], dict[str, list[np.typing.NDArray[np.float32]]]]:
+    # one render per sensor; masks only cover the visible part of each primitive, unlike rendering primitives one by one
+    scene = mi.load_dict({'type': 'scene', 'integrator': {'type': 'aov', 'aovs': 'si:shape_index,dd:depth'},
+                          **{f'{i:02d}': s for i, s in enumerate(shape)}})
+    shape_index_to_ind = np.asarray([int(s.id()) for s in scene.shapes()], dtype=np.int64)
+    num_shapes = len(shape)
+    boxes_all: dict[str, list[BBox]] = {}
+    segm_maps_all: dict[str, list[np.typing.NDArray[np.bool_]]] = {}
+    depth_maps_all: dict[str, list[np.typing.NDArray[np.float32]]] = {}
+    for sensor_name, sensor in sensors.items():
+        image = np.asarray(mi.render(scene, sensor=_id_sensor(sensor), spp=1))
+        shape_index = np.rint(image[:, :, 0]).astype(np.int64)  # 0 for background, otherwise 1 + index in `scene.shapes()`
+        depth: np.typing.NDArray[np.float32] = image[:, :, 1].astype(np.float32)
+        ind = np.where(shape_index > 0, shape_index_to_ind[np.maximum(shape_index - 1, 0)], -1)  # (h, w)
+
+        segm = ind[None] == np.arange(num_shapes)[:, None, None]  # (n, h, w)
+        rows = segm.any(axis=2)  # (n, h)
+        cols = segm.any(axis=1)  # (n, w)
+        y_min, y_max = rows.argmax(axis=1), rows.shape[1] - 1 - rows[:, ::-1].argmax(axis=1)
+        x_min, x_max = cols.argmax(axis=1), cols.shape[1] - 1 - cols[:, ::-1].argmax(axis=1)
+        is_visible = np.bincount(ind[ind >= 0], minlength=num_shapes) > 0
+
+        boxes_all[sensor_name] = [
+            _bbox_2d(x_min[i], x_max[i], y_min[i], y_max[i]) if is_visible[i] else
+            BBox(center=np.zeros(2), size=0, min=np.zeros(2), max=np.zeros(2), sizes=np.zeros(2))
+            for i in range(num_shapes)
+        ]
+        segm_maps_all[sensor_name] = list(segm)
+        depth_maps_all[sensor_name] = list(np.where(segm, depth[None], 0).astype(np.float32))
     return boxes_all, segm_maps_all, depth_maps_all
 
 
@@ -361,6 +520,12 @@ SCENE_PRESETS = {
 }
 
 
+@lru_cache(maxsize=None)
+def load_preset_dict(xml_path: str) -> dict:
+    # parsed once per process and shared across renders, so callers must not modify the returned dict
+    return xml_to_dict(xml_path)
+
+
 def concatenate_xml_files(orig_path: str, tmp_path: str):
     original_tree = ET.parse(orig_path)
     original_root = original_tree.getroot()
@@ -648,6 +813,209 @@ def compute_normalization(shape, preset_id='rover_background'):
     return normalization
 
 
+AIR_BLOCKS = {'minecraft:air', 'minecraft:cave_air', 'minecraft:void_air'}
+
+
+def _voxel_mesh_dict(shape: Shape, normalization: T) -> Optional[dict]:
+    """
+    Voxelizes the cubes of `mi_from_minecraft` in order, so that later blocks replace earlier ones, air removes them and
+    cuboids with `fill=False` only set their faces, and meshes the visible faces of the blocks with `greedy_mesh`, with
+    one `mi.Mesh` per color.
+
+    Returns:
+        the meshes by scene id, or None if some primitive is not a cube aligned with the blocks
+    """
+    # `shape` is normalized, but not preprocessed
+    if any(s['type'] != 'cube' for s in shape):
+        return None
+    grid = VoxelGrid()
+    if len(shape) > 0:
+        to_local = np.linalg.inv(np.asarray(normalization, dtype=np.float64))
+        to_world = to_local @ np.stack([np.asarray(getattr(s['to_world'], 'matrix', s['to_world']), dtype=np.float64)
+                                        for s in shape])
+        if np.any(np.count_nonzero(np.abs(to_world[:, :3, :3]) > 1e-6, axis=2) != 1):  # rotated off the block axes
+            return None
+        corners = to_world[:, :3, :3] @ np.asarray([[-1, 1]] * 3) + to_world[:, :3, 3:]
+        lo, hi = corners.min(axis=2), corners.max(axis=2)
+        if not np.allclose(np.stack([lo, hi]), np.round(np.stack([lo, hi])), atol=1e-4):
+            return None
+        for s, start, end in zip(shape, np.round(lo).astype(int).tolist(), np.round(hi).astype(int).tolist()):
+            info = s.get('info') or {}
+            color = None
+            if info.get('block_type') not in AIR_BLOCKS:
+                color = tuple(np.asarray(s['bsdf']['reflectance']['value'], dtype=np.float64).tolist())
+            grid.fill_box(start, end, color, hollow=not info.get('fill', True))
+
+    bounds = grid.bounds()
+    if bounds is None:
+        return {}
+    volume = grid.dense(*bounds)
+    mesh_dict = {}
+    for value, (vertices, faces) in greedy_mesh(volume).items():
+        vertices = (vertices + bounds[0]) @ np.asarray(normalization)[:3, :3].T + np.asarray(normalization)[:3, 3]
+        props = mi.Properties()
+        props['bsdf'] = mi.load_dict({'type': 'diffuse', 'reflectance': {'type': 'rgb', 'value': grid.palette[value]}})
+        mesh_id = f'voxel_mesh_{value:03d}'
+        mesh = mi.Mesh(mesh_id, vertex_count=len(vertices), face_count=len(faces), props=props,
+                       has_vertex_normals=False, has_vertex_texcoords=False)
+        params = mi.traverse(mesh)
+        params['vertex_positions'] = type(params['vertex_positions'])(vertices.astype(np.float32).ravel())
+        params['faces'] = type(params['faces'])(faces.astype(np.uint32).ravel())
+        params.update()
+        mesh_dict[mesh_id] = mesh
+    return mesh_dict
+
+
+def _load_scene_from_preset(shape: Shape, preset_id: str, instance_groups: list[dict],
+                            mesh_dict: Optional[dict] = None) -> mi.Scene:
+    # `shape` is preprocessed; `mesh_dict`, if given, replaces it
+    preset_dict = load_preset_dict(SCENE_PRESETS[preset_id]['xml_path'])
+    shape_dict = _instanced_scene_dict(shape, instance_groups) if mesh_dict is None else mesh_dict
+    collisions = (preset_dict.keys() & shape_dict.keys()) - {'type'}
+    if len(collisions) > 0:
+        raise RuntimeError(f"ID collision: {sorted(collisions)}")
+    with suppress_output():
+        return mi.load_dict({**preset_dict, **shape_dict})
+
+
+def _render_rgb(scene: mi.Scene, sensor: mi.Sensor) -> np.typing.NDArray[np.uint8]:
+    image = mi.render(scene, sensor=sensor, spp=SPP)
+    return np.asarray(mi.util.convert_to_bitmap(image))
+
+
+# parameters of a loaded primitive that depend on its `to_world`
+POSED_PARAMS = ('vertex_positions', 'vertex_normals', 'to_world', 'control_points')
+
+
+def _snapshot_posed_params(params: mi.SceneParameters, num_shapes: int) -> dict[int, dict[str, np.ndarray]]:
+    keys = set(params.keys())
+    return {i: {name: np.array(getattr(params[f'{i:02d}.{name}'], 'matrix', params[f'{i:02d}.{name}']), dtype=np.float64)
+                for name in POSED_PARAMS if f'{i:02d}.{name}' in keys}
+            for i in range(num_shapes)}
+
+
+def _move_primitives(params: mi.SceneParameters, snapshot: dict[int, dict[str, np.ndarray]],
+                     base_to_world: np.ndarray, old_to_world: np.ndarray, new_to_world: np.ndarray) -> bool:
+    """
+    Moves primitives of a scene loaded with `base_to_world` from `old_to_world` to `new_to_world` by applying
+    `new @ inv(base)` to the parameters in `snapshot`. Returns False if some primitive cannot be moved this way,
+    in which case the scene must be reloaded.
+    """
+    for i in np.flatnonzero((old_to_world != new_to_world).any(axis=(1, 2))):
+        if len(snapshot[i]) == 0 or abs(np.linalg.det(base_to_world[i])) < 1e-12:
+            return False
+        delta = new_to_world[i] @ np.linalg.inv(base_to_world[i])
+        linear, offset = delta[:3, :3], delta[:3, 3]
+        for name, value in snapshot[i].items():
+            key = f'{i:02d}.{name}'
+            if name == 'to_world':
+                value = delta @ value
+            elif name == 'vertex_positions':
+                value = (value.reshape(-1, 3) @ linear.T + offset).ravel()
+            elif name == 'vertex_normals':
+                value = value.reshape(-1, 3) @ np.linalg.inv(linear)
+                value = (value / np.linalg.norm(value, axis=-1, keepdims=True)).ravel()
+            elif name == 'control_points':  # x y z radius; as when loading, radii are not transformed
+                value = value.reshape(-1, 4).copy()
+                value[:, :3] = value[:, :3] @ linear.T + offset
+                value = value.ravel()
+            params[key] = type(params[key])(value.astype(np.float32) if value.ndim == 1 else value)
+    params.update()
+    return True
+
+
+def _primitive_signature(s: dict) -> tuple:
+    return _freeze({k: v for k, v in s.items() if k not in ('to_world', 'info')})
+
+
+def execute_animation_from_preset(frames: list[Shape], save_dir: str, prev_out: dict,
+                                  static_gif_path: str, animation_gif_path: str,
+                                  preset_id: Literal['rover_background'] = 'rover_background') -> list[Path]:
+    """
+    Renders `frames` with the normalization and sensors from `prev_out`, i.e. all sensors for the first frame and
+    the first sensor for the remaining frames, into `save_dir/{frame:02d}/{sensor}.png`.
+
+    If all frames consist of the same primitives up to `to_world`, the scene is loaded once and moving primitives
+    are updated through `mi.traverse` parameters; a frame that does not move any primitive reuses the previous render.
+    Otherwise every frame is loaded from scratch. GIF frames are written as soon as they are rendered.
+
+    Returns:
+        path of the first sensor's rendering for every frame
+    """
+    save_dir = Path(save_dir)
+    save_dir.mkdir(exist_ok=True, parents=True)
+    sensors = prev_out['sensors']
+    sensor_names = list(sensors.keys())
+    frames = [list(transform_shape(frame, prev_out['normalization'])) for frame in frames]
+    signatures = [[_primitive_signature(s) for s in frame] for frame in frames]
+    parametric = all(signature == signatures[0] for signature in signatures)
+
+    scene = params = snapshot = base_to_world = prev_to_world = None
+    final_frame_paths: list[Path] = []
+    with imageio.get_writer(animation_gif_path, mode='I', fps=len(frames) / 2, loop=0) as writer:
+        for i, frame in enumerate(frames):
+            frame_save_dir = save_dir / f'{i:02d}'
+            frame_save_dir.mkdir(exist_ok=True, parents=True)
+            names = sensor_names if i == 0 else sensor_names[:1]
+            to_world = np.stack([np.asarray(s['to_world'], dtype=np.float64) for s in frame]) if len(frame) > 0 else np.zeros((0, 4, 4))
+
+            if parametric and prev_to_world is not None and np.array_equal(to_world, prev_to_world):
+                for k in names:
+                    shutil.copyfile(save_dir / f'{i - 1:02d}' / f'{k}.png', frame_save_dir / f'{k}.png')
+            else:
+                if scene is None or not parametric or not _move_primitives(params, snapshot, base_to_world, prev_to_world, to_world):
+                    mesh_dict = _voxel_mesh_dict(frame, prev_out['normalization']) if VOXEL_MESHING and ENGINE_MODE == 'mi_from_minecraft' else None
+                    instance_groups = _find_repeated_subtrees(frame) if INSTANCING and not parametric and mesh_dict is None else []
+                    shape = _preprocess_shape(frame)
+                    scene = _load_scene_from_preset(shape, preset_id, instance_groups, mesh_dict)
+                    params = mi.traverse(scene)
+                    snapshot = _snapshot_posed_params(params, len(shape))
+                    base_to_world = to_world
+                for k in names:
+                    Image.fromarray(_render_rgb(scene, sensors[k])).save(frame_save_dir / f'{k}.png')
+            prev_to_world = to_world
+
+            final_frame_paths.append(frame_save_dir / f'{names[0]}.png')
+            writer.append_data(np.asarray(Image.open(final_frame_paths[-1])))
+            if i == 0:
+                imageio.mimsave(static_gif_path, [np.asarray(Image.open(frame_save_dir / f'{k}.png')) for k in names], fps=4, loop=0)
+    return final_frame_paths
+
+
+_render_cache: Optional[RenderCache] = None
+
+
+def get_render_cache() -> RenderCache:
+    global _render_cache
+    if _render_cache is None:
+        _render_cache = RenderCache(RENDER_CACHE_DIR, max_bytes=int(RENDER_CACHE_MAX_GB * 2 ** 30))
+    return _render_cache
+
+
+def _scene_digest(shape: Shape, preset_id: str) -> str:
+    # `shape` is normalized; together with the sensor, this determines the rendered image
+    h = hashlib.sha256()
+    h.update(repr((preset_id, SPP, RESOLUTION, INSTANCING, VOXEL_MESHING, mi.variant(), mi.__version__)).encode())
+    h.update(file_digest(SCENE_PRESETS[preset_id]['xml_path']).encode())
+    for s in shape:
+        # `_voxel_mesh_dict` tells air apart from white blocks and hollow cuboids apart from filled ones
+        blocks = {k: v for k, v in (s.get('info') or {}).items() if k in ('block_type', 'fill')}
+        filename = s.get('filename')
+        s = {k: v for k, v in s.items() if k not in ('info', 'filename')} | blocks
+        s['to_world'] = np.round(np.asarray(getattr(s['to_world'], 'matrix', s['to_world']), dtype=np.float64), 6) + 0.
+        h.update(repr(_freeze(s)).encode())
+        if filename is not None:  # e.g. curve control points are written to a new temporary file on every call
+            h.update(file_digest(filename).encode())
+    return h.hexdigest()
+
+
+def dump_render_cache_stats(save_dir: str):
+    if _render_cache is None:
+        return
+    print(f'[INFO] render cache stats: {_render_cache.stats}')
+    _render_cache.dump_stats((Path(save_dir) / 'render_cache_stats.json').as_posix())
+
+
 def execute_from_preset(shape: Shape, save_dir: Optional[str], preset_id: Literal['rover_background'] = 'rover_background',
                         # normalization: Union[None, T] = None,
                         # sensors: Union[None, dict[str, mi.Sensor]] = None,
@@ -668,27 +1036,11 @@ def execute_from_preset(shape: Shape, save_dir: Optional[str], preset_id: Litera
         # print('after', compute_bbox(shape))
         # print('target', target_box)
 
+    scene_digest = _scene_digest(shape, preset_id) if RENDER_CACHE else None
+    normalized_shape = shape  # keeps `info`, for instancing and voxel meshing when the scene is loaded
     shape = _preprocess_shape(shape)
 
-    ply_path_to_tmp_ply_path: dict[str, str] = {}
-    tmp_shape = []
-    tmp_ply_dir = Path(preset['xml_path']).parent / 'meshes'
-    tmp_ply_dir.mkdir(exist_ok=True, parents=True)
-    mesh_shape = []
-    for s in shape:
-        if s['type'] == 'ply':
-            ply_path = Path(s['filename']).absolute().as_posix()
-            if ply_path not in ply_path_to_tmp_ply_path:
-                tmp_ply_path = tmp_ply_dir / f'tmp_{uuid.uuid4()}.ply'
-                # print('creating soft link', tmp_ply_path, '->', s['filename'])
-                tmp_ply_path.symlink_to(s['filename'])
-                ply_path_to_tmp_ply_path[ply_path] = tmp_ply_path.as_posix()
-
-            tmp_shape.append({'filename': ply_path_to_tmp_ply_path[ply_path], **{kk: vv for kk, vv in s.items() if kk != 'filename'}})
-            mesh_shape.append({'filename': ply_path_to_tmp_ply_path[ply_path], **{kk: vv for kk, vv in s.items() if kk != 'filename'}})
-        else:
-            tmp_shape.append(s)
-    shape = tmp_shape
+    mesh_shape = [s for s in shape if s['type'] == 'ply']
 
     if False: #engine_mode == 'neural':
         from optimize_utils import layout_optimize, layout_optimize_mi
@@ -703,15 +1055,7 @@ def execute_from_preset(shape: Shape, save_dir: Optional[str], preset_id: Litera
     #     if 'filename' in s.keys() and 'tmp' in s['filename']:
     #         need_rescale_ids.append(f'{i:02d}')
     else:
-        tmp_xml_file = Path(preset['xml_path']).with_name(f'tmp_{uuid.uuid4()}.xml')
-        scene_dict = {'type': 'scene', **{f'{i:02d}': s for i, s in enumerate(shape)}}
-        with open(os.devnull, 'w') as f, redirect_stdout(f):
-            mi.xml.dict_to_xml(scene_dict, tmp_xml_file)
-        tree = concatenate_xml_files(preset['xml_path'], tmp_xml_file.as_posix())
-
-        tree.write(tmp_xml_file.as_posix())
-        with suppress_output():
-            scene: mi.Scene = mi.load_file(tmp_xml_file.as_posix())
+        scene: Optional[mi.Scene] = None  # loaded by the first render that misses the render cache
     # out['sensors'] = {'rendering': scene.sensors()[0]}
 
     # also for rescale the vertex color
@@ -725,7 +1069,6 @@ def execute_from_preset(shape: Shape, save_dir: Optional[str], preset_id: Litera
     if sensors is None:
         sensors = {}
         box = compute_bbox(shape)  # box **after** normalization
-        canon_sensor = scene.sensors()[0]
         # canon_transform = canon_sensor.world_transform()
 
         # time_step = timestep[0]
@@ -903,10 +1246,21 @@ def execute_from_preset(shape: Shape, save_dir: Optional[str], preset_id: Litera
     save_dir.mkdir(exist_ok=True, parents=True)
     # for k in tqdm(out['sensors'].keys(), desc='rendering RGBs...'):  # cause misformatted outputs in execute_err.txt
     for k in out['sensors'].keys():
-        image = mi.render(scene, sensor=out['sensors'][k], spp=SPP)
-        image = mi.util.convert_to_bitmap(image)
-        image = Image.fromarray(np.asarray(image))
-        image.save(save_dir / f'{k}.png')
+        save_to = save_dir / f'{k}.png'
+        if RENDER_CACHE:
+            key = hashlib.sha256((scene_digest + str(out['sensors'][k])).encode()).hexdigest()
+            if get_render_cache().get(key, save_to.as_posix()):
+                continue
+        if scene is None:
+            mesh_dict = None
+            if VOXEL_MESHING and ENGINE_MODE == 'mi_from_minecraft':
+                mesh_dict = _voxel_mesh_dict(normalized_shape, normalization)
+            instance_groups = _find_repeated_subtrees(normalized_shape) if INSTANCING and mesh_dict is None else []
+            scene = _load_scene_from_preset(shape, preset_id, instance_groups, mesh_dict)
+        image = Image.fromarray(_render_rgb(scene, out['sensors'][k]))
+        image.save(save_to)
+        if RENDER_CACHE:
+            get_render_cache().put(key, save_to.as_posix())
 
     # coord = mi.load_dict(create_coord_system(preset['coord_scale'], out['normalization']) | {f'{i:02d}': s for i, s in enumerate(shape)})
     coord_dict = mi.load_dict(create_coord_system(preset['coord_scale'], out['normalization']))
@@ -943,11 +1297,6 @@ def execute_from_preset(shape: Shape, save_dir: Optional[str], preset_id: Litera
                 depth_normalized = np.zeros_like(depth)
             Image.fromarray((depth_normalized * 255).astype(np.uint8)).save((depth_save_dir / f'{k}.png').as_posix())
 
-    # clean up
-    tmp_xml_file.unlink()
-    for tmp_ply_path in ply_path_to_tmp_ply_path.values():
-        Path(tmp_ply_path).unlink()
-
     # we should do optimization after loading sensors?
     # from optimize_utils import debug_layout_optimize
     # scene = debug_layout_optimize(scene, keys=[f'{i:02d}' for i in range(len(shape))])
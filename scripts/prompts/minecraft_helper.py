@@ -1,7 +1,6 @@
-import difflib
-import spacy
 import json
-import itertools
+import threading
+import numpy as np
 
 
 # engine-specific helper has access to engine-agnostic helper
@@ -12,6 +11,10 @@ from type_utils import T, Shape, P
 from _shape_utils import primitive_call
 from math_utils import _scale_matrix
 from minecraft_types import valid_blocks
+from engine.constants import BLOCK_INDEX_DIR, MINECRAFT_EXPORT
+from engine.utils import block_scene
+from engine.utils.voxel_grid import VoxelGrid
+from engine.utils.block_index import BlockIndex, BlockAliasStore, alias_version, normalize_block_name, normalized_names
 
 from shape_utils import *
 from math_utils import *
@@ -50,30 +53,18 @@ def execute_animation(
     save_dir, save_prefix, description = prepare_dir_for_exec(
         save_dir, save_prefix, description
     )
-    all_shapes = list(itertools.chain(*frames))
+    # 1. Resolve overlaps and deletions in each frame
+    grids = [assemble_grid(frame) for frame in frames]
 
-    # 1. Extract scale of entire scene
+    # 2. Extract scale of entire scene
     # This is global across all frames
-    x_pad, y_pad, z_pad, width, height, length = get_x_y_z_boundaries(all_shapes)
-    data = {"width": width, "height": height, "depth": length, "frames": []}
-
-    # 2. Place blocks in region
-    for frame in frames:
-        blocks = []
-        for shape in frame:
-            if shape["type"] == "block":
-                blocks.append(place_cuboid(shape, init_coords=(x_pad, y_pad, z_pad)))
-        data["frames"].append(blocks)
+    init_coords, (width, height, length) = get_grid_boundaries(grids)
+    data = {"width": width, "height": height, "depth": length}
 
     # 3. Save
     save_dir = Path(save_dir)
     save_prefix = "" if save_prefix is None else save_prefix + "_"
-    output_path = str(save_dir / f"{save_prefix}_{description}.json")
-
-    with open(output_path, "w") as json_file:
-        json.dump(data, json_file, indent=4)
-
-    print(f"Writing to {output_path}")
+    save_scene(data, grids, init_coords, save_dir / f"{save_prefix}_{description}")
 
 
 def execute(
@@ -86,27 +77,38 @@ def execute(
         save_dir, save_prefix, description
     )
 
-    # 1. Extract scale of entire scene
-    x_pad, y_pad, z_pad, width, height, length = get_x_y_z_boundaries(shapes)
-    data = {"width": width, "height": height, "depth": length, "frames": []}
-
-    # 2. Place blocks in region
-    frame = []
-    for s in shapes:
-        if s["type"] == "block":
-            frame.append(place_cuboid(s, init_coords=(x_pad, y_pad, z_pad)))
+    # 1. Resolve overlaps and deletions
+    grid = assemble_grid(shapes)
 
-    data["frames"].append(frame)
+    # 2. Extract scale of entire scene
+    init_coords, (width, height, length) = get_grid_boundaries([grid])
+    data = {"width": width, "height": height, "depth": length, "block_counts": get_block_counts(grid)}
+    print(f"[INFO] {sum(data['block_counts'].values())} blocks")
 
     # 3. Save
     save_dir = Path(save_dir)
     save_prefix = "" if save_prefix is None else save_prefix + "_"
-    output_path = str(save_dir / f"{save_prefix}_{description}.json")
+    save_scene(data, [grid], init_coords, save_dir / f"{save_prefix}_{description}")
 
-    with open(output_path, "w") as json_file:
-        json.dump(data, json_file, indent=4)
 
-    print(f"Writing to {output_path}")
+def save_scene(data, grids, init_coords, output_stem):
+    # writes the frames as JSON boxes and/or as a `.mcscene`, depending on `MINECRAFT_EXPORT`
+    if MINECRAFT_EXPORT in ("json", "both"):
+        frames = [grid_to_blocks(grid, init_coords=init_coords) for grid in grids]
+        output_path = f"{output_stem}.json"
+        with open(output_path, "w") as json_file:
+            json.dump({**data, "frames": frames}, json_file, indent=4)
+        print(f"Writing to {output_path}")
+
+    if MINECRAFT_EXPORT in ("binary", "both"):
+        palette, lookups = get_shared_palette(grids)
+        lo = np.asarray(init_coords)
+        hi = lo + np.asarray([data["width"], data["height"], data["depth"]])
+        volumes = (lookup[grid.dense(lo, hi)] for grid, lookup in zip(grids, lookups))
+        output_path = f"{output_stem}{block_scene.SUFFIX}"
+        extra = {k: v for k, v in data.items() if k not in ("width", "height", "depth")}
+        block_scene.write_block_scene(output_path, volumes, palette, **extra)
+        print(f"Writing to {output_path}")
 
 
 def place_cuboid(data, init_coords):
@@ -178,6 +180,73 @@ def place_cuboid(data, init_coords):
     }
 
 
+AIR_BLOCKS = {"minecraft:air", "minecraft:cave_air", "minecraft:void_air"}
+
+
+def assemble_grid(shapes) -> VoxelGrid:
+    # primitives are applied in order, so later blocks replace earlier ones and `air` deletes them
+    grid = VoxelGrid()
+    for s in shapes:
+        if s["type"] != "block":
+            continue
+        block = place_cuboid(s, init_coords=(0, 0, 0))
+        state = None
+        if block["type"] not in AIR_BLOCKS:
+            state = (block["type"], json.dumps(block["properties"], sort_keys=True), tuple(block["stack"]))
+        grid.fill_box(block["start"], block["end"], state, hollow=not block["fill"])
+    return grid
+
+
+def get_grid_boundaries(grids):
+    # exact bounds of the blocks in all grids, as (x, y, z), (width, height, length)
+    bounds = [b for b in (grid.bounds() for grid in grids) if b is not None]
+    if len(bounds) == 0:
+        return (0, 0, 0), (0, 0, 0)
+    lo = np.min([b[0] for b in bounds], axis=0)
+    hi = np.max([b[1] for b in bounds], axis=0)
+    return tuple(lo.tolist()), tuple((hi - lo).tolist())
+
+
+def grid_to_blocks(grid, init_coords):
+    # disjoint filled boxes, in the same format as `place_cuboid`
+    starts, ends, values = grid.boxes()
+    starts, ends = starts - np.asarray(init_coords), ends - np.asarray(init_coords)
+    blocks = []
+    for start, end, (block_type, properties, stack) in zip(starts.tolist(), ends.tolist(), grid.states(values)):
+        blocks.append({
+            "start": start,
+            "end": end,
+            "fill": True,
+            "type": block_type,
+            "properties": json.loads(properties),
+            "stack": list(stack),
+        })
+    return blocks
+
+
+def get_block_counts(grid):
+    counts = {}
+    for (block_type, _, _), count in grid.block_counts().items():
+        counts[block_type] = counts.get(block_type, 0) + count
+    return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+
+def get_shared_palette(grids):
+    # one palette for all frames, with air at index 0, and for each grid a lookup from its palette indices into it
+    palette, index = [None], {}
+    lookups = []
+    for grid in grids:
+        lookup = np.zeros((len(grid.palette),), dtype=np.uint32)
+        for i, state in enumerate(grid.palette[1:], start=1):
+            if state not in index:
+                block_type, properties, stack = state
+                index[state] = len(palette)
+                palette.append({"type": block_type, "properties": json.loads(properties), "stack": list(stack)})
+            lookup[i] = index[state]
+        lookups.append(lookup)
+    return palette, lookups
+
+
 def get_x_y_z_boundaries(shapes):
     x_boundary = [float("inf"), float("-inf")]
     y_boundary = [float("inf"), float("-inf")]
@@ -267,56 +336,68 @@ primitive_call.implement(impl_primitive_call)
 
 
 ##### HELPER TO GET NEAREST SEMANTIC BLOCK
-# Load the spaCy model
-nlp = spacy.load("en_core_web_md")
+SPACY_MODEL = "en_core_web_md"
+_nlp = None
+_nlp_lock = threading.Lock()
+
+
+def get_nlp():
+    # the spaCy model is only loaded for the first block name that is neither valid nor a stored alias
+    global _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            import spacy
+            _nlp = spacy.load(SPACY_MODEL)
+    return _nlp
+
 
+_block_indices: dict[tuple[str, ...], BlockIndex] = {}
+_block_names: dict[tuple[str, ...], tuple[frozenset[str], dict[str, str]]] = {}
+_alias_stores: dict[tuple, BlockAliasStore] = {}
 
-# Function to calculate character-level similarity
-def character_similarity(a, b):
-    return difflib.SequenceMatcher(None, a, b).ratio()
 
+def get_block_index(valid_blocks) -> BlockIndex:
+    key = tuple(valid_blocks)
+    if key not in _block_indices:
+        _block_indices[key] = BlockIndex.load_or_build(key, get_nlp(), cache_dir=BLOCK_INDEX_DIR)
+    return _block_indices[key]
 
-# Function to calculate semantic similarity
-def semantic_similarity(query_doc, block_doc):
-    return query_doc.similarity(block_doc)
 
+def get_alias_store(valid_blocks, char_weight, sem_weight) -> BlockAliasStore:
+    key = (tuple(valid_blocks), char_weight, sem_weight)
+    if key not in _alias_stores:
+        version = alias_version(key[0], SPACY_MODEL, char_weight, sem_weight)
+        _alias_stores[key] = BlockAliasStore((Path(BLOCK_INDEX_DIR) / "aliases.db").as_posix(), version)
+    return _alias_stores[key]
 
-# Function to process minecraft types
-def parse_minecraft_types(minecraft_type):
-    prefix = "minecraft:"
-    prefix_len = len(prefix)
-    result = minecraft_type[prefix_len:]
 
-    return result.replace("_", " ")
+def lookup_block(query, valid_blocks) -> Optional[str]:
+    # exact or normalized match, e.g. `Oak Planks` for `minecraft:oak_planks`, without loading spaCy
+    key = tuple(valid_blocks)
+    if key not in _block_names:
+        _block_names[key] = frozenset(key), normalized_names(key)
+    names, normalized = _block_names[key]
+    return query if query in names else normalized.get(normalize_block_name(query))
 
 
 # Function to find the closest match using both character-level and semantic similarity
 def find_closest_match(query, valid_blocks, char_weight=0.6, sem_weight=0.4):
-    if query in valid_blocks:
-        return query
-
     if query in nearest_block_cache:
         return nearest_block_cache[query]
 
-    # Remove prefix
-    query_no_pre = parse_minecraft_types(query)
-
-    valid_blocks = list(valid_blocks)
-    query_doc = nlp(query_no_pre.replace("_", " "))
-    max_similarity = -1
-    closest_match = None
-
-    for block in valid_blocks:
-        # Replace underscores
-        block_no_pre = parse_minecraft_types(block)
-        block_doc = nlp(block_no_pre)
-        char_sim = character_similarity(query, block)
-        sem_sim = semantic_similarity(query_doc, block_doc)
-        combined_sim = (char_weight * char_sim) + (sem_weight * sem_sim)
-
-        if combined_sim > max_similarity:
-            max_similarity = combined_sim
-            closest_match = block
+    closest_match = lookup_block(query, valid_blocks)
+    if closest_match == query:
+        nearest_block_cache[query] = query
+        return query
+    if closest_match is None:
+        store = get_alias_store(valid_blocks, char_weight, sem_weight)
+        alias = store.get(query)
+        if alias is not None:
+            closest_match = alias[0]
+        else:
+            closest_match, score = get_block_index(valid_blocks).resolve_with_score(
+                query, get_nlp(), char_weight=char_weight, sem_weight=sem_weight)
+            store.put(query, closest_match, score)
 
     nearest_block_cache[query] = closest_match
 
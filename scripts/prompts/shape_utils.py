@@ -1,6 +1,8 @@
 from contextlib import contextmanager
 from type_utils import Box, ShapeSampler, Shape, T, P
 from _shape_utils import Hole, library, _children, placeholder, compute_bbox, transform_shape as _transform_shape
+from _shape_batch_utils import ShapeBatch
+from engine.constants import BATCH_SHAPES
 import numpy as np
 
 
@@ -9,6 +11,7 @@ __all__ = ["transform_shape", "concat_shapes"]
 
 _CHECK_SHAPE = False
 _REPLACE_SHAPE = False
+_BATCH_SHAPES = BATCH_SHAPES
 
 
 def create_hole(name: str, docstring: str, check: Box) -> ShapeSampler:
@@ -38,6 +41,8 @@ def concat_shapes(*shapes: Shape) -> Shape:
     """
     Combines multiple shapes into a single shape.
     """
+    if _BATCH_SHAPES or any(isinstance(s, ShapeBatch) for s in shapes):
+        return ShapeBatch.concat(shapes)
     out = []
     for s in shapes:
         if isinstance(s, dict):
@@ -57,6 +62,8 @@ def transform_shape(shape: Shape, pose: T) -> Shape:
     Returns:
         The input shape transformed by the given pose.
     """
+    if _BATCH_SHAPES:
+        shape = ShapeBatch.from_shape(shape)
     shape = _transform_shape(shape, pose)
     check = Box((0, 0, 0), 1)  # hack
     if _CHECK_SHAPE:
@@ -80,6 +87,17 @@ def compute_bbox_center(shape: Shape) -> P:
     return compute_bbox(shape).center
 
 
+@contextmanager
+def _batch_shapes_context(flag: bool):
+    global _BATCH_SHAPES
+    orig_flag = _BATCH_SHAPES
+    _BATCH_SHAPES = flag
+    try:
+        yield
+    finally:
+        _BATCH_SHAPES = orig_flag
+
+
 @contextmanager
 def _replace_shape_context(flag: bool):
     global _REPLACE_SHAPE
@@ -1,8 +1,10 @@
 from pathlib import Path
+import json
 import os
 from engine.utils.argparse_utils import setup_save_dir, modify_string_for_file
-from engine.constants import ENGINE_MODE
-from run_utils import SYSTEM_HEADER, run, read_tasks, SYSTEM_RULES, read_example, save_prompts
+from engine.utils.pipeline_utils import Pipeline, Stage, report_pipeline_stats
+from engine.constants import ENGINE_MODE, RENDER_WORKERS
+from run_utils import SYSTEM_HEADER, read_tasks, SYSTEM_RULES, read_example, save_prompts, generate, save_trial_program, save_trial_impl, execute_impl
 from engine.utils.parse_utils import create_diff, create_diff2
 import argparse
 
@@ -101,58 +103,121 @@ def get_parser():
         type=str,
         default=(root / "outputs" / Path(__file__).stem).as_posix(),
     )
+    parser.add_argument(
+        "--resume-dir", type=str, default=None, help="output dir of a previous run; finished stages are skipped"
+    )
     parser.add_argument(
         "--num-completions", type=int, default=4, help="number of samples"
     )
     parser.add_argument(
         "--temperature", type=float, default=0.2, help="LM inference temperature"
     )
+    parser.add_argument("--llm-workers", type=int, default=2, help="tasks waiting on the LLM at the same time")
+    parser.add_argument("--exec-workers", type=int, default=max(1, RENDER_WORKERS), help="programs executed at the same time")
+    parser.add_argument("--gif-workers", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=8, help="max items waiting between two stages")
     return parser
 
 
+def get_user_prompt_for_cond(task: str, cond: str):
+    if cond == "text":
+        assert not Path(task).exists(), f"use --cond image for {task}"
+        return get_user_prompt(task, animate=False)
+    elif cond == "animate":
+        assert not Path(task).exists(), f"use --cond image for {task}"
+        return get_user_prompt(task, animate=True)
+    elif cond == "image":
+        return get_user_prompt_reconstruction(task)
+    elif cond == "edit":
+        return get_user_prompt_edit(task)
+    else:
+        raise NotImplementedError(cond)
+
+
+def save_gifs(trial_save_dir: Path, fps: float = 4.):
+    import imageio
+    for frames_dir in sorted(trial_save_dir.glob("renderings/*/")):
+        frame_paths = sorted(frames_dir.glob("rendering_traj_[0-9][0-9][0-9].png"))
+        gif_path = frames_dir / "rendering_traj.gif"
+        if len(frame_paths) > 1 and not gif_path.exists():
+            imageio.mimsave(gif_path.as_posix(), [imageio.v2.imread(p.as_posix()) for p in frame_paths], fps=fps, loop=0)
+
+
 def main():
     parser = get_parser()
     args = parser.parse_args()
     tasks = args.tasks if args.tasks is not None else read_tasks()
 
-    save_dir = setup_save_dir(args.log_dir, log_unique=True)
+    if args.resume_dir is not None:
+        save_dir = setup_save_dir(args.resume_dir, log_unique=False)
+    else:
+        save_dir = setup_save_dir(args.log_dir, log_unique=True)
+    lm_config = {
+        "num_completions": args.num_completions,
+        "temperature": args.temperature,
+    }
 
-    for task in tasks:
-        name = modify_string_for_file(task)
-        save_subdir = save_dir / name
-        save_subdir.mkdir(exist_ok=True)
-        if args.cond == "text":
-            assert not Path(task).exists(), f"use --cond image for {task}"
-            user_prompt = get_user_prompt(task, animate=False)
-        elif args.cond == "animate":
-            assert not Path(task).exists(), f"use --cond image for {task}"
-            user_prompt = get_user_prompt(task, animate=True)
-        elif args.cond == "image":
-            user_prompt = get_user_prompt_reconstruction(task)
-        elif args.cond == "edit":
-            user_prompt = get_user_prompt_edit(task)
-        else:
-            raise NotImplementedError(args.cond)
+    # prompt -> LLM generation -> code extraction -> execution and rendering -> GIF assembly;
+    # every stage saves its outputs under the task's dir, so that `--resume-dir` can skip finished work
 
+    def build_prompt(task):
+        save_subdir = save_dir / modify_string_for_file(task)
+        save_subdir.mkdir(exist_ok=True)
+        user_prompt = get_user_prompt_for_cond(task, args.cond)
         save_prompts(save_subdir.as_posix(), SYSTEM_PROMPT, user_prompt)
-
-        run(
-            save_dir=save_subdir.as_posix(),
-            user_prompt=user_prompt,
-            system_prompt=SYSTEM_PROMPT,
-            extra_info={"task": task},
-            lm_config={
-                "num_completions": args.num_completions,
-                "temperature": args.temperature,
-            },
-        )
-
-        if args.cond == 'edit':
-            with open(task, 'r') as f:
+        with open((save_subdir / "info.json").as_posix(), "w") as f:
+            json.dump({"lm_config": lm_config, "task": task}, f)
+        yield {"task": task, "save_dir": save_subdir, "user_prompt": user_prompt}
+
+    def generate_completions(job):
+        results_path = job["save_dir"] / "results.json"
+        results = None
+        if results_path.exists():
+            with open(results_path.as_posix(), "r") as f:
+                results = json.load(f)
+            if len(results) < args.num_completions:
+                results = None
+        if results is None:
+            results = generate(user_prompt=job["user_prompt"], system_prompt=SYSTEM_PROMPT, lm_config=lm_config)
+            with open(results_path.with_suffix(".tmp").as_posix(), "w") as f:
+                json.dump(results, f)
+            os.replace(results_path.with_suffix(".tmp"), results_path)
+        for ind, result in enumerate(results):
+            yield {**job, "trial_save_dir": job["save_dir"] / str(ind), "result": result}
+
+    def extract_program(trial):
+        program = save_trial_program(trial["trial_save_dir"], trial["result"])
+        if program is None:
+            return
+        program_path = trial["trial_save_dir"] / "program.py"
+        if args.cond == "edit":
+            with open(trial["task"], "r") as f:
                 orig_prog = f.readline().strip()
-            for p in save_subdir.glob('*/program.py'):
-                create_diff(orig_prog, p.as_posix(), p.with_name('diff.txt').as_posix())
-                create_diff2(orig_prog, p.as_posix(), p.with_name('diff2.txt').as_posix())
+            create_diff(orig_prog, program_path.as_posix(), program_path.with_name("diff.txt").as_posix())
+            create_diff2(orig_prog, program_path.as_posix(), program_path.with_name("diff2.txt").as_posix())
+        command, impl_path = save_trial_impl(trial["trial_save_dir"], program)
+        yield {**trial, "command": command, "impl_path": impl_path}
+
+    def execute_program(trial):
+        status_path = trial["trial_save_dir"] / "execute_status.json"
+        if not status_path.exists():
+            returncode = execute_impl(trial["command"], trial["impl_path"], trial["trial_save_dir"])
+            with open(status_path.as_posix(), "w") as f:
+                json.dump({"returncode": returncode}, f)
+        yield trial
+
+    def assemble_gifs(trial):
+        save_gifs(trial["trial_save_dir"])
+
+    pipeline = Pipeline([
+        Stage("prompt", build_prompt),
+        Stage("generate", generate_completions, num_workers=args.llm_workers),
+        Stage("extract", extract_program),
+        Stage("execute", execute_program, num_workers=args.exec_workers),
+        Stage("gif", assemble_gifs, num_workers=args.gif_workers),
+    ], queue_size=args.queue_size)
+    stats = pipeline.run(tasks)
+    report_pipeline_stats(stats, (save_dir / "pipeline_stats.json").as_posix())
 
 
 if __name__ == "__main__":
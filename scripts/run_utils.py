@@ -1,4 +1,6 @@
 import traceback
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import json
 import os
@@ -13,6 +15,9 @@ except:
     print("Unable to import Llama modules. Are you running on cluster?")
 from engine.utils.lm_utils import unwrap_results
 from engine.utils.execute_utils import execute_command
+from engine.utils.parse_utils import validate_program
+from engine.utils.render_pool import setup_render_pool
+from engine.utils.render_cache import file_digest
 from engine.constants import (
     ENGINE_MODE,
     PROMPT_MODE,
@@ -22,6 +27,14 @@ from engine.constants import (
     NUM_COMPLETIONS,
     MAX_TOKENS,
     DRY_RUN,
+    RENDER_WORKERS,
+    RENDER_FORK,
+    RENDER_TIMEOUT,
+    RENDER_MEMORY_GB,
+    VALIDATE_PROGRAMS,
+    EXECUTE_TIMEOUT,
+    EXECUTE_MAX_RSS_GB,
+    EXECUTE_LOG_MAX_MB,
 )
 from typing import List, Union, Optional
 
@@ -253,6 +266,48 @@ def generate(
         raise NotImplementedError(f"{LLM_PROVIDER=}")
 
 
+def save_trial_program(trial_save_dir: Path, result: list[str], code_only: bool = False,
+                       prepend_program: Optional[str] = None) -> Optional[str]:
+    # saves `raw.txt`, `raw.py` and `program.py` for one completion; returns the program without `prepend_program`
+    trial_save_dir.mkdir(exist_ok=True)
+    with open((trial_save_dir / "raw.txt").as_posix(), "w") as f:
+        f.write("\n".join(result))
+
+    try:
+        lines = unwrap_results(result, code_only)
+    except Exception as _:
+        with open((trial_save_dir / "error.txt").as_posix(), "w") as f:
+            f.write(traceback.format_exc())
+        return None
+    if lines is None:
+        # with open((trial_save_dir / 'response.txt').as_posix(), 'w') as f:
+        #     f.write('\n'.join(result))
+        return None
+    program = "\n".join(lines)
+    with open((trial_save_dir / "raw.py").as_posix(), "w") as f:
+        f.write(program)
+    full_program = (
+        program if prepend_program is None else (prepend_program + "\n" + program)
+    )
+    with open((trial_save_dir / "program.py").as_posix(), "w") as f:
+        f.write(full_program)
+    return program
+
+
+def save_trial_impl(trial_save_dir: Path, program: str, engine_mode=ENGINE_MODE) -> tuple[str, str]:
+    impl = get_impl(program)
+
+    save_to = (trial_save_dir / "impl.py").as_posix()
+    with open(save_to, "w") as f:
+        f.write(impl)
+
+    command = (
+        f'ENGINE_MODE={engine_mode} DEBUG={"1" if DEBUG else "0"} '
+        f'PYTHONPATH={Path(__file__).parent / "prompts"}:$PYTHONPATH python {save_to}'
+    )
+    return command, save_to
+
+
 def run(
     save_dir: str,
     user_prompt: Union[str, list[dict[str, str]], None],
@@ -283,47 +338,19 @@ def run(
     programs = []
     for ind, result in enumerate(results):
         trial_save_dir = save_dir / str(ind)
-        trial_save_dir.mkdir(exist_ok=True)
-        with open((trial_save_dir / "raw.txt").as_posix(), "w") as f:
-            f.write("\n".join(result))
-
-        try:
-            lines = unwrap_results(result, code_only)
-        except Exception as _:
-            with open((trial_save_dir / "error.txt").as_posix(), "w") as f:
-                f.write(traceback.format_exc())
-            continue
-        if lines is None:
-            # with open((trial_save_dir / 'response.txt').as_posix(), 'w') as f:
-            #     f.write('\n'.join(result))
+        program = save_trial_program(trial_save_dir, result, code_only=code_only, prepend_program=prepend_program)
+        if program is None:
             continue
-        program = "\n".join(lines)
         programs.append(program)
-        with open((trial_save_dir / "raw.py").as_posix(), "w") as f:
-            f.write(program)
-        full_program = (
-            program if prepend_program is None else (prepend_program + "\n" + program)
-        )
-        with open((trial_save_dir / "program.py").as_posix(), "w") as f:
-            f.write(full_program)
         if not execute:
             continue
-        impl = get_impl(full_program)
-
-        save_to = (trial_save_dir / "impl.py").as_posix()
-        with open(save_to, "w") as f:
-            f.write(impl)
-
-        command = (
-            f'ENGINE_MODE={ENGINE_MODE} DEBUG={"1" if DEBUG else "0"} '
-            f'PYTHONPATH={Path(__file__).parent / "prompts"}:$PYTHONPATH python {save_to}'
-        )
+        command, save_to = save_trial_impl(trial_save_dir, program if prepend_program is None else (prepend_program + "\n" + program))
 
         # command_file = (trial_save_dir / "command.txt").as_posix()
         # with open(command_file, "w") as f:
         #     f.write(command)
 
-        execute_command(command, trial_save_dir.as_posix(), dry_run=dry_run)
+        execute_impl(command, save_to, trial_save_dir, dry_run=dry_run)
 
     return programs
 
@@ -541,6 +568,96 @@ def find_rendering(save_dir: Path) -> Optional[str]:
         return rendering_path[0].as_posix()
 
 
+def rendering_digest(rendering_path: Optional[str]) -> Optional[str]:
+    return None if rendering_path is None else file_digest(rendering_path)
+
+
+def run_expert(
+    save_dir: Path,
+    task: str,
+    expert: int,
+    num_experts: int,
+    draft: list[str],
+    num_reflections: int,
+    lm_config: dict,
+) -> str:
+    # one writer -> render -> critic chain; experts only share the LLM client and the render pool
+    critique = None
+    program = compile_raw_gpt_response_to_program(draft)
+    save_and_execute_trial(save_dir / f"prompts/expert_draft/{expert}", program)
+    rendering_path = find_rendering(save_dir / f"prompts/expert_draft/{expert}")
+    unchanged = False
+
+    role = switch_reflection_role(Role.WRITER)
+    for i in range(1, num_reflections):
+        print(
+            f"[INFO] Running self-reflection round {i + 1}/{num_reflections} for expert {expert + 1}/{num_experts}"
+        )
+        if role == Role.WRITER:
+            user_prompt = get_writer_prompt_with_critiques(task, program, critique)
+            system_prompt = get_system_prompt(role=role)
+            draft = generate(
+                user_prompt=user_prompt,
+                system_prompt=system_prompt,
+                lm_config=lm_config,
+                skip_cache=True,
+            )[0]
+            role_save_dir = (
+                save_dir / f"prompts/expert_{expert:02d}_refl_{i:02d}_writer"
+            )
+            save_prompts(role_save_dir.as_posix(), system_prompt, user_prompt)
+            new_program = compile_raw_gpt_response_to_program(draft)
+            if new_program == program:
+                # same program, same rendering: nothing to execute
+                (role_save_dir / "0").mkdir(exist_ok=True)
+                with open((role_save_dir / "0/program.py").as_posix(), "w") as f:
+                    f.write(new_program)
+                unchanged = True
+            else:
+                save_and_execute_trial(role_save_dir / "0", new_program)
+                new_rendering_path = find_rendering(role_save_dir / "0")
+                unchanged = new_rendering_path is not None and rendering_digest(new_rendering_path) == rendering_digest(rendering_path)
+                program, rendering_path = new_program, new_rendering_path
+        elif role == Role.CRITIC:
+            role_save_dir = (
+                save_dir / f"prompts/expert_{expert:02d}_refl_{i:02d}_critic"
+            )
+            (role_save_dir / "0").mkdir(exist_ok=True, parents=True)
+            if unchanged:
+                # the critic would review the same rendering again, so the last critique still applies
+                print(f"[INFO] Skipping critic round {i + 1}/{num_reflections} for expert {expert + 1}/{num_experts}: rendering unchanged")
+                with open((role_save_dir / "0/skipped.txt").as_posix(), "w") as f:
+                    f.write("rendering unchanged since the previous critique\n")
+            else:
+                user_prompt = get_critic_prompt(task, program, rendering_path)
+                system_prompt = get_system_prompt(role=role)
+                critique = "\n".join(
+                    generate(
+                        user_prompt=user_prompt,
+                        system_prompt=system_prompt,
+                        lm_config=lm_config,
+                        skip_cache=True,
+                    )[0]
+                )
+                save_prompts(role_save_dir.as_posix(), system_prompt, user_prompt)
+            with open((role_save_dir / "0/raw.txt").as_posix(), "w") as f:
+                f.write(critique)
+
+        else:
+            raise ValueError("Invalid role provided: " + role)
+        role = switch_reflection_role(role)
+
+    # role_save_dir = save_dir / f'prompts/expert_{expert:02d}_reparam'
+    # system_prompt = get_system_prompt(Role.WRITER, header=read_header(engine_mode='mi_material'))
+    # user_prompt = get_user_prompt_reparam(program)
+    # save_prompts(role_save_dir.as_posix(), system_prompt, user_prompt)
+    # draft = generate(user_prompt=user_prompt, system_prompt=system_prompt, lm_config=lm_config, skip_cache=True)[0]
+    # program = compile_raw_gpt_response_to_program(draft)
+    # save_and_execute_trial(role_save_dir / '0', program, engine_mode='mi_material')
+
+    return program
+
+
 def run_self_reflect_and_moe(
     save_dir: str,
     task: str,
@@ -555,16 +672,14 @@ def run_self_reflect_and_moe(
     ), "self-reflect and MOE only works with Claude for now - need to update the other generate functions to skip the cache"
 
     save_dir = Path(save_dir)
-    if lm_config.get("num_completions") > 1:
+    lm_config = lm_config if lm_config is not None else {}
+    if lm_config.get("num_completions", 1) > 1:
         print("[INFO] Setting num_completions to 1 for self-reflect and MOE")
     lm_config["num_completions"] = 1
-    lm_config = lm_config if lm_config is not None else {}
     info = {"lm_config": lm_config, **({} if extra_info is None else extra_info)}
     with open((save_dir / "info.json").as_posix(), "w") as f:
         json.dump(info, f)
 
-    code_proposals = []
-
     user_prompt = get_writer_prompt_initial(task, animate)
     system_prompt = get_system_prompt(role=Role.WRITER)
     expert_role_save_dir = save_dir / f"prompts/expert_draft"
@@ -576,70 +691,13 @@ def run_self_reflect_and_moe(
         skip_cache=False,
     )
 
-    for expert in range(num_experts):
-        role = Role.WRITER
-        critique = None
-        draft = experts[expert]
-        program = compile_raw_gpt_response_to_program(draft)
-        save_and_execute_trial(expert_role_save_dir / str(expert), program)
-        rendering_path = find_rendering(expert_role_save_dir / str(expert))
-
-        role = switch_reflection_role(role)
-
-        num_reflections = (num_reflections - 1) // 2 * 2 + 1
-        for i in range(1, num_reflections):
-            print(
-                f"[INFO] Running self-reflection round {i + 1}/{num_reflections} for expert {expert + 1}/{num_experts}"
-            )
-            if role == Role.WRITER:
-                user_prompt = get_writer_prompt_with_critiques(task, program, critique)
-                system_prompt = get_system_prompt(role=role)
-                draft = generate(
-                    user_prompt=user_prompt,
-                    system_prompt=system_prompt,
-                    lm_config=lm_config,
-                    skip_cache=True,
-                )[0]
-                role_save_dir = (
-                    save_dir / f"prompts/expert_{expert:02d}_refl_{i:02d}_writer"
-                )
-                save_prompts(role_save_dir.as_posix(), system_prompt, user_prompt)
-                program = compile_raw_gpt_response_to_program(draft)
-                save_and_execute_trial(role_save_dir / "0", program)
-                rendering_path = find_rendering(role_save_dir / "0")
-            elif role == Role.CRITIC:
-                role_save_dir = (
-                    save_dir / f"prompts/expert_{expert:02d}_refl_{i:02d}_critic"
-                )
-                user_prompt = get_critic_prompt(task, program, rendering_path)
-                system_prompt = get_system_prompt(role=role)
-                critique = "\n".join(
-                    generate(
-                        user_prompt=user_prompt,
-                        system_prompt=system_prompt,
-                        lm_config=lm_config,
-                        skip_cache=True,
-                    )[0]
-                )
-                save_prompts(role_save_dir.as_posix(), system_prompt, user_prompt)
-
-                (role_save_dir / "0").mkdir(exist_ok=True)
-                with open((role_save_dir / "0/raw.txt").as_posix(), "w") as f:
-                    f.write(critique)
-
-            else:
-                raise ValueError("Invalid role provided: " + role)
-            role = switch_reflection_role(role)
-
-        # role_save_dir = save_dir / f'prompts/expert_{expert:02d}_reparam'
-        # system_prompt = get_system_prompt(Role.WRITER, header=read_header(engine_mode='mi_material'))
-        # user_prompt = get_user_prompt_reparam(program)
-        # save_prompts(role_save_dir.as_posix(), system_prompt, user_prompt)
-        # draft = generate(user_prompt=user_prompt, system_prompt=system_prompt, lm_config=lm_config, skip_cache=True)[0]
-        # program = compile_raw_gpt_response_to_program(draft)
-        # save_and_execute_trial(role_save_dir / '0', program, engine_mode='mi_material')
-
-        code_proposals.append(program)
+    # experts are independent until the judge, so their chains run concurrently
+    num_reflections = (num_reflections - 1) // 2 * 2 + 1
+    with ThreadPoolExecutor(max_workers=max(1, num_experts)) as executor:
+        code_proposals = list(executor.map(
+            lambda expert: run_expert(save_dir, task, expert, num_experts, experts[expert], num_reflections, lm_config),
+            range(num_experts),
+        ))
 
     user_prompt = get_judge_prompt(task, code_proposals=code_proposals)
     system_prompt = get_system_prompt(role=Role.JUDGE)
@@ -654,19 +712,45 @@ def save_and_execute_trial(trial_save_dir: Path, program, engine_mode=ENGINE_MOD
     trial_save_dir.mkdir(exist_ok=True)
     with open((trial_save_dir / "program.py").as_posix(), "w") as f:
         f.write(program)
-    impl = get_impl(program)
-
-    save_to = (trial_save_dir / "impl.py").as_posix()
-    with open(save_to, "w") as f:
-        f.write(impl)
-
-    command = (
-        f'ENGINE_MODE={engine_mode} DEBUG={"1" if DEBUG else "0"} '
-        f'PYTHONPATH={Path(__file__).parent / "prompts"}:$PYTHONPATH python {save_to}'
-    )
+    command, save_to = save_trial_impl(trial_save_dir, program, engine_mode=engine_mode)
 
     command_file = (trial_save_dir / "command.txt").as_posix()
     with open(command_file, "w") as f:
         f.write(command)
 
-    execute_command(command, trial_save_dir.as_posix())
+    execute_impl(command, save_to, trial_save_dir, engine_mode=engine_mode)
+
+
+def validate_impl(impl_path: str, trial_save_dir: Path) -> bool:
+    # saves the reasons to `error.txt` and an exit record to `status.json` if `impl.py` is certain to fail; warnings
+    # are saved to `error.txt` too, but do not stop the execution
+    start = time.time()
+    with open(impl_path, "r") as f:
+        impl = f.read()
+    errors, warnings, root_name = validate_program(impl, search_dirs=((root / "prompts").as_posix(),))
+    if len(errors) + len(warnings) > 0:
+        with open((trial_save_dir / "error.txt").as_posix(), "w") as f:
+            f.write("".join(f"[ERROR] {e}\n" for e in errors) + "".join(f"[WARNING] {w}\n" for w in warnings))
+    if len(errors) == 0:
+        for warning in warnings:
+            print(f"[WARNING] {impl_path}: {warning}")
+        print(f"[INFO] validated {impl_path}, {root_name=}")
+        return True
+    print(f"[ERROR] skipping {impl_path}:\n" + "\n".join(errors))
+    with open((trial_save_dir / "status.json").as_posix(), "w") as f:
+        json.dump({"status": "invalid", "returncode": 1, "error": "\n".join(errors), "time": time.time() - start}, f)
+    return False
+
+
+def execute_impl(command: str, impl_path: str, trial_save_dir: Path, engine_mode=ENGINE_MODE, dry_run: bool = False):
+    # `command` is still saved to `impl.sh` when running in the render pool, to reproduce a trial by hand
+    if VALIDATE_PROGRAMS and not validate_impl(impl_path, trial_save_dir):
+        return 1
+    if RENDER_WORKERS == 0 or dry_run:
+        return execute_command(command, trial_save_dir.as_posix(), timeout=EXECUTE_TIMEOUT or None, dry_run=dry_run,
+                               max_rss_gb=EXECUTE_MAX_RSS_GB or None, max_log_mb=EXECUTE_LOG_MAX_MB or None)
+    with open((trial_save_dir / "impl.sh").as_posix(), "w") as f:
+        f.write(command)
+    pool = setup_render_pool(num_workers=RENDER_WORKERS, debug=DEBUG, fork=RENDER_FORK,
+                             timeout=RENDER_TIMEOUT or None, max_memory_gb=RENDER_MEMORY_GB or None)
+    return pool.run(impl_path, engine_mode=engine_mode, save_dir=trial_save_dir.as_posix())["returncode"]
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+
+class FileIndex:
+    """
+    In-process index of the files with the given extensions under a directory.
+
+    `refresh` walks the tree with one `stat` per directory and only lists the directories whose mtime changed since the
+    last refresh, so an unchanged tree of finished trials costs no `scandir`. After the first walk, `poll` refreshes in
+    a background thread at most every `min_interval` seconds and queries answer from the index as it is meanwhile.
+    Files rewritten in place do not change the mtime of their directory, so their size and mtime in the index can be
+    stale until it changes.
+    """
+
+    def __init__(self, directory, extensions, min_interval=2.):
+        self.directory = directory
+        self.extensions = tuple(extensions)
+        self.min_interval = min_interval
+        self.version = 0  # changes whenever the set of indexed files does
+        self._dirs = {}  # relative path -> (mtime_ns, files, subdirectories)
+        self._entries = []  # newest first
+        self._last_refresh = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _scan(self, rel_dir):
+        files, subdirs = [], []
+        with os.scandir(os.path.join(self.directory, rel_dir)) as it:
+            for entry in it:
+                rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):  # like `os.walk`
+                        subdirs.append(rel_path)
+                    elif entry.name.endswith(self.extensions):
+                        stat = entry.stat()
+                        files.append({'path': rel_path.replace(os.sep, '/'), 'size': stat.st_size,
+                                      'mtime': stat.st_mtime})
+                except OSError:
+                    continue
+        return files, subdirs
+
+    def refresh(self):
+        with self._lock:
+            changed, seen, stack = False, set(), ['']
+            while stack:
+                rel_dir = stack.pop()
+                try:
+                    mtime = os.stat(os.path.join(self.directory, rel_dir)).st_mtime_ns
+                    if rel_dir not in self._dirs or self._dirs[rel_dir][0] != mtime:
+                        self._dirs[rel_dir] = (mtime, *self._scan(rel_dir))
+                        changed = True
+                except OSError:  # removed while walking
+                    continue
+                seen.add(rel_dir)
+                stack.extend(self._dirs[rel_dir][2])
+            for rel_dir in set(self._dirs) - seen:
+                del self._dirs[rel_dir]
+                changed = True
+            if changed:
+                entries = [f for _, files, _ in self._dirs.values() for f in files]
+                self._entries = sorted(entries, key=lambda f: (-f['mtime'], f['path']))
+                self.version += 1
+            self._last_refresh = time.monotonic()
+
+    def poll(self):
+        # walks the tree the first time, then refreshes in the background when the index is older than `min_interval`
+        if self._last_refresh is None:
+            self.refresh()
+        elif time.monotonic() - self._last_refresh >= self.min_interval and \
+                (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self.refresh, daemon=True)
+            self._thread.start()
+
+    def query(self, task=None, since=None, until=None, page=1, per_page=100):
+        """
+        Filters the files by a case-insensitive substring of their path, where spaces match underscores as in the
+        names of trial directories, and by their mtime in `[since, until)`, given as timestamps.
+
+        Returns:
+            the files of the 1-based `page`, newest first, and the number of files matching the filters
+        """
+        entries = self._entries
+        if task:
+            task = task.lower().replace(' ', '_')
+            entries = [f for f in entries if task in f['path'].lower()]
+        if since is not None:
+            entries = [f for f in entries if f['mtime'] >= since]
+        if until is not None:
+            entries = [f for f in entries if f['mtime'] < until]
+        start = (max(page, 1) - 1) * per_page
+        return entries[start:start + per_page], len(entries)
+
+
+def parse_time(value):
+    """Parses a timestamp or an ISO date or datetime, e.g. `2024-05-12` or `2024-05-12T08:00`, in local time."""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
@@ -1,46 +1,101 @@
-from flask import Blueprint, send_from_directory, jsonify, render_template, abort
+from flask import Blueprint, Response, send_file, jsonify, render_template, abort, request
+from werkzeug.security import safe_join
+from collections import OrderedDict
+import gzip
 import os
 import logging
+import threading
+
+from .file_index import FileIndex, parse_time
 
 main = Blueprint('main', __name__)
 
-FILES_DIRECTORY = os.path.join(os.path.dirname(__file__), 'static', 'schematics', 'static')
+FILES_DIRECTORY = os.environ.get('VIEWER_FILES_DIRECTORY',  # e.g. `scripts/outputs`
+                                 os.path.join(os.path.dirname(__file__), 'static', 'schematics', 'static'))
 EXP_FILES_DIRECTORY = '../../../exp/icl_0512/outputs'
+SCENE_EXTENSIONS = ('.json', '.mcscene')  # JSON scenes and the binary scenes of `engine/utils/block_scene.py`
+MAX_PER_PAGE = 1000
+GZIP_MIN_SIZE = 1024  # bytes; smaller files are served as they are
+GZIP_CACHE_MAX_BYTES = 64 * 1024 ** 2  # compressed scenes kept in memory, in total
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
+file_index = FileIndex(FILES_DIRECTORY, SCENE_EXTENSIONS)
+
 @main.route('/')
 def home():
     """Serve the main HTML page."""
     return render_template('index.html')
 
-def find_json_files(directory):
-    """Recursively find all .json files in the directory."""
-    json_files = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith('.json'):
-                relative_path = os.path.relpath(os.path.join(root, file), directory)
-                json_files.append(relative_path)
-    return json_files
-
 @main.route('/api/files')
 def list_files():
-    """API endpoint to return a list of .json files."""
-    files = find_json_files(FILES_DIRECTORY)
-    return jsonify(files)
+    """API endpoint to return a page of scene files, optionally filtered by `task` and by mtime in [`since`, `until`)."""
+    try:
+        since, until = parse_time(request.args.get('since')), parse_time(request.args.get('until'))
+    except ValueError as e:
+        abort(400, description=str(e))
+    page = request.args.get('page', 1, type=int)
+    per_page = min(max(request.args.get('per_page', 100, type=int), 1), MAX_PER_PAGE)
+
+    file_index.poll()
+    files, total = file_index.query(task=request.args.get('task'), since=since, until=until, page=page, per_page=per_page)
+    response = jsonify(files=files, total=total, page=page, per_page=per_page)
+    # the page only changes with the index
+    response.set_etag(f'{file_index.version}-{request.query_string.decode()}')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @main.route('/api/file-directory')
 def get_file_directory():
     """API endpoint to return the main file directory to search for .litematic files."""
     return jsonify(directory=FILES_DIRECTORY)
 
-@main.route('/files/<filename>')
-def serve_file(filename):
-    """Serve a specific .json file."""
-    if filename.endswith('.json') and os.path.exists(os.path.join(FILES_DIRECTORY, filename)):
-        return send_from_directory(FILES_DIRECTORY, filename)
-    abort(404)
+class GzipCache:
+    """Compressed contents of files, cached until their mtime or size changes, least recently used first out."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # (path, mtime_ns, size) -> compressed contents
+        self._lock = threading.Lock()
 
+    def get(self, path, mtime_ns, size):
+        key = (path, mtime_ns, size)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        with open(path, 'rb') as f:
+            data = gzip.compress(f.read(), compresslevel=6, mtime=0)
+        with self._lock:
+            if key not in self._entries and len(data) <= self.max_bytes:
+                self._entries[key] = data
+                self.total_bytes += len(data)
+                while self.total_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.total_bytes -= len(evicted)
+        return data
 
+gzip_cache = GzipCache(GZIP_CACHE_MAX_BYTES)
+
+@main.route('/files/<path:filename>')
+def serve_file(filename):
+    """Serve a specific scene file, gzipped if the client accepts it, and as 304 if the client has it already."""
+    path = safe_join(FILES_DIRECTORY, filename)
+    if not filename.endswith(SCENE_EXTENSIONS) or path is None or not os.path.isfile(path):
+        abort(404)
+    stat = os.stat(path)
+    etag = f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+    # `.mcscene` files are compressed already
+    if filename.endswith('.json') and stat.st_size >= GZIP_MIN_SIZE and 'gzip' in request.accept_encodings:
+        response = Response(gzip_cache.get(path, stat.st_mtime_ns, stat.st_size), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(etag + '-gzip')
+        response.last_modified = stat.st_mtime
+        response.cache_control.no_cache = True
+        response = response.make_conditional(request)
+    else:
+        response = send_file(path, etag=etag)
+    response.vary.add('Accept-Encoding')
+    return response
@@ -373,6 +373,97 @@ function structureFromJsonData(data) {
   return { structure, frames };
 }
 
+// Reads the binary `.mcscene` written by `engine/utils/block_scene.py`:
+// "MCSC" | uint32 header length | JSON header | deflated frames, each a uint32 run count, the run lengths and the run
+// codes over the volume in x + z * width + y * width * depth order. Code 0 keeps the previous frame's block and code
+// i + 1 sets palette entry i, where entry 0 is air.
+const BLOCK_SCENE_MAGIC = "MCSC";
+
+function isBlockScene(buffer) {
+  const magic = new Uint8Array(buffer, 0, Math.min(4, buffer.byteLength));
+  return String.fromCharCode(...magic) === BLOCK_SCENE_MAGIC;
+}
+
+async function structureFromBinaryData(buffer) {
+  const view = new DataView(buffer);
+  const headerLength = view.getUint32(4, true);
+  const header = JSON.parse(
+    new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength))
+  );
+  const compressed = new Blob([new Uint8Array(buffer, 8 + headerLength)]);
+  const body = await new Response(
+    compressed.stream().pipeThrough(new DecompressionStream("deflate"))
+  ).arrayBuffer();
+  const words = new Uint32Array(body);
+
+  const { width, height, depth, palette } = header;
+  const volume = new Uint32Array(width * height * depth);
+  // Boxes of each row along x, only recomputed for the rows a frame changes
+  const rows = new Array(height * depth).fill([]);
+  const dirty = new Uint8Array(height * depth);
+  const frames = [];
+  let offset = 0;
+  for (let f = 0; f < header.num_frames; f++) {
+    const numRuns = words[offset];
+    const lengths = words.subarray(offset + 1, offset + 1 + numRuns);
+    const codes = words.subarray(
+      offset + 1 + numRuns,
+      offset + 1 + 2 * numRuns
+    );
+    offset += 1 + 2 * numRuns;
+    const dirtyRows = [];
+    let position = 0;
+    for (let r = 0; r < numRuns; r++) {
+      if (codes[r] > 0) {
+        volume.fill(codes[r] - 1, position, position + lengths[r]);
+        const lastRow = Math.floor((position + lengths[r] - 1) / width);
+        for (let row = Math.floor(position / width); row <= lastRow; row++) {
+          if (!dirty[row]) {
+            dirty[row] = 1;
+            dirtyRows.push(row);
+          }
+        }
+      }
+      position += lengths[r];
+    }
+    for (const row of dirtyRows) {
+      rows[row] = rowBoxes(volume, row, width, depth, palette);
+      dirty[row] = 0;
+    }
+    frames.push([].concat(...rows));
+  }
+
+  const structure = new deepslate.Structure([width, height, depth]);
+  return { structure, frames };
+}
+
+// Converts a row of the volume to boxes in the format of the JSON frames, one per run of equal blocks along x
+function rowBoxes(volume, row, width, depth, palette) {
+  const y = Math.floor(row / depth);
+  const z = row % depth;
+  const boxes = [];
+  let x = 0;
+  while (x < width) {
+    const value = volume[row * width + x];
+    let end = x + 1;
+    while (end < width && volume[row * width + end] === value) {
+      end++;
+    }
+    if (value !== 0) {
+      const { type, properties } = palette[value];
+      boxes.push({
+        start: [x, y, z],
+        end: [end, y + 1, z + 1],
+        type,
+        properties,
+        fill: true,
+      });
+    }
+    x = end;
+  }
+  return boxes;
+}
+
 /* Set the width of the side navigation to 250px */
 function openSettings() {
   document.getElementById("settings-panel").style.width = "800px";
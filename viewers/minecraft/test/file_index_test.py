@@ -0,0 +1,170 @@
+import unittest
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app import create_app, routes
+from app.file_index import FileIndex
+
+
+class TestFileIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.index = FileIndex(self.tmp_dir.name, ('.json', '.mcscene'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, rel_path: str, contents: str = '{}', mtime: float = None) -> Path:
+        path = self.root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(contents)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def paths(self, **kwargs) -> list[str]:
+        files, total = self.index.query(per_page=1000, **kwargs)
+        self.assertEqual(len(files), total)
+        return [f['path'] for f in files]
+
+    def test_refresh(self):
+        self.write('a_red_chair/0/scene.json', mtime=100)
+        self.write('a_red_chair/1/scene.mcscene', mtime=200)
+        self.write('a_red_chair/1/program.py')
+        self.index.refresh()
+        self.assertEqual(self.paths(), ['a_red_chair/1/scene.mcscene', 'a_red_chair/0/scene.json'])
+        version = self.index.version
+
+        # unchanged directories are not listed again
+        with mock.patch.object(self.index, '_scan', wraps=self.index._scan) as scan:
+            self.index.refresh()
+        self.assertEqual(scan.call_count, 0)
+        self.assertEqual(self.index.version, version)
+
+        self.write('a_table/0/renderings/scene.json', mtime=300)
+        with mock.patch.object(self.index, '_scan', wraps=self.index._scan) as scan:
+            self.index.refresh()
+        self.assertEqual(sorted(call.args[0] for call in scan.call_args_list),
+                         ['', 'a_table', os.path.join('a_table', '0'), os.path.join('a_table', '0', 'renderings')])
+        self.assertEqual(self.paths()[0], 'a_table/0/renderings/scene.json')
+        self.assertGreater(self.index.version, version)
+
+        shutil.rmtree(self.root / 'a_red_chair')
+        self.index.refresh()
+        self.assertEqual(self.paths(), ['a_table/0/renderings/scene.json'])
+        self.assertEqual(set(self.index._dirs), {'', 'a_table', os.path.join('a_table', '0'),
+                                                 os.path.join('a_table', '0', 'renderings')})
+
+    def test_query(self):
+        for i, task in enumerate(['a_red_chair', 'A_Red_Chair_2', 'a_table']):
+            self.write(f'{task}/0/scene.json', mtime=100 * (i + 1))
+        self.index.refresh()
+        self.assertEqual(self.paths(task='red chair'), ['A_Red_Chair_2/0/scene.json', 'a_red_chair/0/scene.json'])
+        self.assertEqual(self.paths(since=200), ['a_table/0/scene.json', 'A_Red_Chair_2/0/scene.json'])
+        self.assertEqual(self.paths(until=200), ['a_red_chair/0/scene.json'])
+        self.assertEqual(self.paths(task='chair', since=150, until=300), ['A_Red_Chair_2/0/scene.json'])
+        files, total = self.index.query(page=2, per_page=2)
+        self.assertEqual(([f['path'] for f in files], total), (['a_red_chair/0/scene.json'], 3))
+
+
+class TestRoutes(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.scene = {'blocks': [[x, 0, 0, 'minecraft:stone'] for x in range(200)]}
+        (self.root / 'a_chair' / '0').mkdir(parents=True)
+        (self.root / 'a_chair' / '0' / 'scene.json').write_text(json.dumps(self.scene))
+        (self.root / 'a_chair' / '0' / 'small.json').write_text('{}')
+        (self.root.parent / f'{self.root.name}_secret.json').write_text('{}')
+        for patch in [mock.patch.object(routes, 'FILES_DIRECTORY', self.tmp_dir.name),
+                      mock.patch.object(routes, 'file_index', FileIndex(self.tmp_dir.name, routes.SCENE_EXTENSIONS)),
+                      mock.patch.object(routes, 'gzip_cache', routes.GzipCache(routes.GZIP_CACHE_MAX_BYTES))]:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client = create_app().test_client()
+
+    def tearDown(self):
+        (self.root.parent / f'{self.root.name}_secret.json').unlink()
+        self.tmp_dir.cleanup()
+
+    def test_list_files(self):
+        response = self.client.get('/api/files?task=chair&per_page=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((len(response.json['files']), response.json['total']), (1, 2))
+        etag = response.headers['ETag']
+        self.assertEqual(self.client.get('/api/files?task=chair&per_page=1', headers={'If-None-Match': etag}).status_code, 304)
+        # another query, or a change to the index, is a new page
+        self.assertEqual(self.client.get('/api/files?task=table', headers={'If-None-Match': etag}).status_code, 200)
+        (self.root / 'a_chair' / '1').mkdir()
+        (self.root / 'a_chair' / '1' / 'scene.json').write_text('{}')
+        routes.file_index.refresh()
+        response = self.client.get('/api/files?task=chair&per_page=1', headers={'If-None-Match': etag})
+        self.assertEqual((response.status_code, response.json['total']), (200, 3))
+        self.assertEqual(self.client.get('/api/files?since=yesterday').status_code, 400)
+
+    def test_list_files_by_time(self):
+        now = time.time()
+        os.utime(self.root / 'a_chair' / '0' / 'small.json', (now - 3600, now - 3600))
+        response = self.client.get(f'/api/files?since={now - 60}')
+        self.assertEqual([f['path'] for f in response.json['files']], ['a_chair/0/scene.json'])
+        response = self.client.get(f'/api/files?until={now - 60}')
+        self.assertEqual([f['path'] for f in response.json['files']], ['a_chair/0/small.json'])
+
+    def test_serve_file(self):
+        response = self.client.get('/files/a_chair/0/scene.json', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual((response.status_code, response.headers['Content-Encoding']), (200, 'gzip'))
+        self.assertEqual(json.loads(gzip.decompress(response.data)), self.scene)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        etag = response.headers['ETag']
+        response = self.client.get('/files/a_chair/0/scene.json', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/files/a_chair/0/scene.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.json, self.scene)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        response.close()
+        response = self.client.get('/files/a_chair/0/scene.json', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        # small files are not compressed
+        response = self.client.get('/files/a_chair/0/small.json', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual((response.status_code, response.data), (200, b'{}'))
+        response.close()
+
+    def test_not_found(self):
+        for url in ['/files/a_chair/0/missing.json', '/files/a_chair/0', '/files/../secret.json',
+                    f'/files/../{self.root.name}_secret.json', f'/files/a_chair/../../{self.root.name}_secret.json',
+                    f'/files/%2E%2E/{self.root.name}_secret.json']:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_gzip_cache(self):
+        cache = routes.GzipCache(max_bytes=1000)
+        paths = []
+        for i in range(4):
+            path = self.root / f'{i}.json'
+            path.write_bytes(os.urandom(300))  # incompressible
+            paths.append(path.as_posix())
+        sizes = [len(cache.get(p, 0, 300)) for p in paths[:3]]
+        self.assertEqual(cache.total_bytes, sum(sizes))
+        cache.get(paths[0], 0, 300)  # most recently used
+        cache.get(paths[3], 0, 300)
+        self.assertLessEqual(cache.total_bytes, 1000)
+        self.assertEqual([key[0] for key in cache._entries], [paths[2], paths[0], paths[3]])
+        self.assertEqual(gzip.decompress(cache.get(paths[1], 0, 300)), Path(paths[1]).read_bytes())
+        # files larger than the cache are compressed but not kept
+        self.assertEqual(len(routes.GzipCache(max_bytes=10).get(paths[0], 0, 300)), sizes[0])
+
+
+if __name__ == '__main__':
+    unittest.main()